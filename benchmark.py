@@ -0,0 +1,702 @@
+"""
+Benchmarks for the lazor solver.
+
+Run from the repository root:
+
+    python benchmark.py startup
+    python benchmark.py trace
+    python benchmark.py batch
+    python benchmark.py bitboard
+    python benchmark.py parse
+    python benchmark.py suite --output results.json
+    python benchmark.py suite --baseline results.json
+"""
+import argparse
+import json
+import multiprocessing
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import lazor
+
+# The bundled puzzles that have a grid to solve
+PUZZLES = ['dark_1.bff', 'mad_1.bff', 'mad_4.bff', 'mad_7.bff',
+           'numbered_6.bff', 'showstopper_4.bff', 'tiny_5.bff']
+
+# The cases of the regression suite: every bundled file, including the
+# ones that cannot be parsed, plus larger generated boards given as
+# (size, blocks, seed)
+SUITE = PUZZLES + ['yarn_5.bff']
+SYNTHETIC = {
+    'synthetic_6x6': (6, ['A', 'A', 'B', 'C'], 7),
+    'synthetic_7x7': (7, ['A', 'A', 'B', 'C'], 9),
+    'synthetic_8x8': (8, ['A', 'A', 'B', 'C'], 1),
+}
+# Slowdowns smaller than this are timer noise, not regressions
+NOISE_SECONDS = 0.01
+# Engines whose 'candidates' counter is a number of candidate boards,
+# so their laser steps can be counted; backtrack counts search nodes
+BOARD_ENGINES = ['brute', 'parallel', 'incremental', 'cached', 'numpy',
+                 'bitboard']
+
+
+def time_import(module, repeat=10):
+    """
+    Measures the cost of importing a module in a fresh interpreter.
+
+    Arguments:
+    - module (str): The dotted name of the module to import.
+    - repeat (int): How many fresh interpreters to start. Defaults to 10.
+
+    Returns:
+    - seconds (float): The median wall time of one interpreter run.
+    - max_rss (int): The peak resident set size of one run in kB.
+
+    Example:
+    >> time_import('lazor')
+    (0.021, 9876)
+    """
+    code = ("import resource, {0}; "
+            "print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)"
+            .format(module))
+    times = []
+    rss = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, '-c', code],
+                                capture_output=True, text=True, check=True)
+        times.append(time.perf_counter() - start)
+        rss.append(int(output.stdout.split()[-1]))
+    return statistics.median(times), max(rss)
+
+
+def bench_startup(repeat=10):
+    """
+    Compares interpreter startup with lazor against startup with the
+    sympy permutation helper lazor used to import.
+
+    Arguments:
+    - repeat (int): How many fresh interpreters to start per module.
+
+    Example:
+    >> bench_startup()
+    """
+    baseline = time_import('sys', repeat)
+    print(f"{'import':<32}{'median ms':>12}{'max RSS kB':>12}")
+    print(f"{'(bare interpreter)':<32}"
+          f"{baseline[0] * 1000:>12.1f}{baseline[1]:>12}")
+    for module in ('lazor', 'sympy.utilities.iterables'):
+        try:
+            seconds, max_rss = time_import(module, repeat)
+        except subprocess.CalledProcessError:
+            print(f"{module:<32}{'not installed':>24}")
+            continue
+        print(f"{module:<32}{seconds * 1000:>12.1f}{max_rss:>12}")
+
+
+def load_puzzle(file_path):
+    """
+    Parses a puzzle.
+
+    Arguments:
+    - file_path (str): The path of the .bff file.
+
+    Returns:
+    - game (Game): The parsed game instance.
+    """
+    return lazor.parse_bff(file_path)
+
+
+def candidate_boards(game, limit):
+    """
+    Builds the first candidate boards the brute-force search would test.
+
+    Arguments:
+    - game (Game): The parsed game instance.
+    - limit (int): The maximum number of boards to build.
+
+    Returns:
+    - boards (list): Independent copies of the candidate grids.
+    """
+    grid = game.get_grid()
+    slots = lazor.find_all_placements(grid)
+    boards = []
+    for perm in lazor.place_blocks(slots, game.get_blocks()):
+        board = [row[:] for row in grid]
+        for (row, col), block in zip(slots, perm):
+            board[row][col] = block
+        boards.append(board)
+        if len(boards) >= limit:
+            break
+    return boards
+
+
+def shoot_laser_recursive(grid, lasers, counter=None):
+    """
+    Reference copy of the recursive tracer lazor.shoot_laser replaced,
+    kept to benchmark the iterative version against. When a counter
+    list is given, its first item is increased once per laser step.
+    """
+    passed_points = []
+
+    def laser_step(laser, grid):
+        # acquire current position and direction
+        curr_pos = laser.get_position()
+        curr_dir = laser.get_direction()
+        if counter is not None:
+            counter[0] += 1
+        # check if the current position is out of bounds
+        if lazor.check(curr_pos, grid) is False:
+            return
+        # Identify block of interest
+
+        def find_row_col(curr_pos, curr_dir):
+            if curr_pos[0] % 2 == 0:  # if x coordinate is even
+                if curr_dir[0] == 1:
+                    row_num = int((curr_pos[1]-1)/2)
+                    col_num = int(curr_pos[0]/2)
+                else:
+                    row_num = int((curr_pos[1]-1)/2)
+                    col_num = int((curr_pos[0]-2)/2)
+            else:
+                if curr_dir[1] == 1:
+                    row_num = int(curr_pos[1]/2)
+                    col_num = int((curr_pos[0]-1)/2)
+                else:
+                    row_num = int((curr_pos[1]-2)/2)
+                    col_num = int((curr_pos[0]-1)/2)
+            return row_num, col_num
+        row_num, col_num = find_row_col(curr_pos, curr_dir)
+        # check if interested block is out of bounds
+        if row_num < 0 or col_num < 0:
+            return
+        # check if interested block is out of bounds
+        if row_num >= len(grid) or col_num >= len(grid[0]):
+            return
+        interested_block = grid[row_num][col_num]
+        # Identify what type of block is encountered
+        if interested_block == 'A':  # reflect
+            if curr_pos[0] % 2 == 0:
+                # flip x only
+                laser.change_direction((curr_dir[0]*(-1), curr_dir[1]))
+            else:
+                # flip y only
+                laser.change_direction((curr_dir[0], curr_dir[1]*(-1)))
+            # Need to account for the case where the starting points
+            # are both reflect blocks for which
+            # this code will keep recursively calling itself
+            new_dir = laser.get_direction()
+            temp_row_num, temp_col_num = find_row_col(curr_pos, new_dir)
+            if temp_row_num < 0 or temp_col_num < 0:
+                return
+            if temp_row_num >= len(grid) or temp_col_num >= len(grid[0]):
+                return
+            new_block = grid[temp_row_num][temp_col_num]
+            if new_block == 'A':
+                return
+            laser_step(laser, grid)
+        elif interested_block == 'B':  # opaque, ray operation ends here
+            return
+        elif interested_block == 'C':  # refract
+            new_pos = (curr_pos[0]+curr_dir[0], curr_pos[1]+curr_dir[1])
+            if new_pos not in passed_points:
+                passed_points.append(new_pos)
+            new_laser = lazor.Laser(new_pos, curr_dir)
+            laser_step(new_laser, grid)
+            if curr_pos[0] % 2 == 0:
+                laser.change_direction((curr_dir[0]*(-1), curr_dir[1]))
+            else:
+                laser.change_direction((curr_dir[0], curr_dir[1]*(-1)))
+            # Need to account for the case where the starting points
+            # are both reflect blocks for which
+            # this code will keep recursively calling itself
+            new_dir = laser.get_direction()
+            temp_row_num, temp_col_num = find_row_col(curr_pos, new_dir)
+            if temp_row_num < 0 or temp_col_num < 0:
+                return
+            if temp_row_num >= len(grid) or temp_col_num >= len(grid[0]):
+                return
+            new_block = grid[temp_row_num][temp_col_num]
+            if new_block == 'A':
+                return
+            laser_step(laser, grid)
+        else:
+            new_pos = (curr_pos[0]+curr_dir[0], curr_pos[1]+curr_dir[1])
+            if new_pos not in passed_points:
+                passed_points.append(new_pos)
+            laser.change_position(new_pos)
+            laser_step(laser, grid)
+
+    for laser in lasers:
+        temp_pos = laser.get_position()
+        temp_dir = laser.get_direction()
+        temp_laser = lazor.Laser(temp_pos, temp_dir)
+        laser_step(temp_laser, grid)
+    return passed_points
+
+
+def best_time(trace, inputs, repeat):
+    """
+    Times one tracer over a list of inputs.
+
+    Arguments:
+    - trace (function): Called once per input.
+    - inputs (list): The inputs to trace.
+    - repeat (int): Timing runs; the best is kept.
+
+    Returns:
+    - seconds (float): The best wall time of one run over all inputs.
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in inputs:
+            trace(item)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_trace(limit=2000, repeat=3):
+    """
+    Compares laser steps per second of the recursive tracer lazor used
+    to have with trace_lasers on grids of letters and with trace_board on
+    flat boards of block codes, over the first candidate boards of every
+    bundled puzzle.
+
+    Arguments:
+    - limit (int): Candidate boards per puzzle. Defaults to 2000.
+    - repeat (int): Timing runs per tracer; the best is kept.
+
+    Example:
+    >> bench_trace()
+    """
+    print(f"{'puzzle':<20}{'boards':>8}{'steps':>10}{'recursive/s':>14}"
+          f"{'grid/s':>12}{'flat/s':>12}{'speedup':>9}")
+    for file_path in PUZZLES:
+        game = load_puzzle(file_path)
+        lasers = game.get_lasers()
+        grid = game.get_grid()
+        layout = lazor.board_layout(len(grid), len(grid[0]))
+        starts = layout.laser_states(lasers)
+        boards = []
+        steps = 0
+        for board in candidate_boards(game, limit):
+            counter = [0]
+            try:
+                shoot_laser_recursive(board, lasers, counter)
+            except RecursionError:
+                continue  # the old tracer cannot finish looping beams
+            boards.append(board)
+            steps += counter[0]
+        flat_boards = [lazor.encode_grid(board) for board in boards]
+
+        recursive = best_time(
+            lambda board: shoot_laser_recursive(board, lasers),
+            boards, repeat)
+        on_grid = best_time(lambda board: lazor.trace_lasers(board, lasers),
+                            boards, repeat)
+        on_flat = best_time(
+            lambda board: lazor.trace_board(board, layout, starts),
+            flat_boards, repeat)
+        print(f"{file_path:<20}{len(boards):>8}{steps:>10}"
+              f"{steps / recursive:>14.0f}{steps / on_grid:>12.0f}"
+              f"{steps / on_flat:>12.0f}{recursive / on_flat:>8.1f}x")
+
+
+def bench_batch(repeat=3):
+    """
+    Compares candidate boards per second of the brute-force engine with
+    the NumPy batch evaluator on every bundled puzzle.
+
+    Arguments:
+    - repeat (int): Timing runs per engine; the best is kept.
+
+    Example:
+    >> bench_batch()
+    """
+    if not lazor.NUMPY_AVAILABLE:
+        print("numpy is not installed")
+        return
+    print(f"{'puzzle':<20}{'boards':>8}{'brute/s':>12}{'numpy/s':>12}"
+          f"{'speedup':>9}")
+    for file_path in PUZZLES:
+        game = load_puzzle(file_path)
+        stats = {}
+        lazor.brute_force_search(game, stats)
+        brute = best_time(lazor.brute_force_search, [game], repeat)
+        batch = best_time(lazor.numpy_search, [game], repeat)
+        boards = stats['candidates']
+        print(f"{file_path:<20}{boards:>8}{boards / brute:>12.0f}"
+              f"{boards / batch:>12.0f}{brute / batch:>8.1f}x")
+
+
+def bench_bitboard(limit=2000, repeat=3):
+    """
+    Compares the time per candidate board of shoot_laser with
+    check_solution and of its drop-in replacement bitboard_check on grids
+    of letters, and of trace_board and trace_bitboard stopping at the
+    last target on boards already converted, over the first candidate
+    boards of every bundled puzzle and generated board. Then compares
+    the time to solve each of them with the brute and bitboard engines.
+
+    Arguments:
+    - limit (int): Candidate boards per puzzle. Defaults to 2000.
+    - repeat (int): Timing runs per evaluator; the best is kept.
+
+    Example:
+    >> bench_bitboard()
+    """
+    games = [(file_path, load_puzzle(file_path)) for file_path in PUZZLES]
+    games += [(name, synthetic_game(*SYNTHETIC[name]))
+              for name in SYNTHETIC]
+    print(f"{'puzzle':<20}{'boards':>8}{'sets us':>9}{'bits us':>9}"
+          f"{'speedup':>9}{'flat us':>9}{'runs us':>9}{'speedup':>9}"
+          f"{'brute s':>10}{'bitboard s':>12}{'speedup':>9}")
+    for name, game in games:
+        lasers, points = game.get_lasers(), game.get_points()
+        grid = game.get_grid()
+        layout = lazor.board_layout(len(grid), len(grid[0]))
+        bitboard = lazor.bitboard_layout(len(grid), len(grid[0]))
+        starts = layout.laser_states(lasers)
+        target_mask = lazor.points_mask(points, grid)
+        boards = candidate_boards(game, limit)
+        flat_boards = [lazor.encode_grid(board) for board in boards]
+
+        sets = best_time(
+            lambda board: lazor.check_solution(
+                lazor.shoot_laser(board, lasers), points),
+            boards, repeat)
+        bits = best_time(
+            lambda board: lazor.bitboard_check(board, lasers, points),
+            boards, repeat)
+        flat = best_time(
+            lambda board: lazor.trace_board(board, layout, starts,
+                                            target_mask),
+            flat_boards, repeat)
+        runs = best_time(
+            lambda board: lazor.trace_bitboard(board, bitboard, starts,
+                                               target_mask),
+            flat_boards, repeat)
+        brute = best_time(lazor.brute_force_search, [game], repeat)
+        engine = best_time(lazor.bitboard_search, [game], repeat)
+        count = len(boards)
+        print(f"{name:<20}{count:>8}{sets / count * 1e6:>9.1f}"
+              f"{bits / count * 1e6:>9.1f}{sets / bits:>8.1f}x"
+              f"{flat / count * 1e6:>9.1f}{runs / count * 1e6:>9.1f}"
+              f"{flat / runs:>8.1f}x{brute:>10.4f}{engine:>12.4f}"
+              f"{brute / engine:>8.1f}x")
+
+
+def bench_parse(loads=1000, repeat=3):
+    """
+    Compares the time to load the bundled puzzles many times with the
+    parser and through the on-disk parse cache.
+
+    Arguments:
+    - loads (int): How many times each puzzle is loaded per run.
+    - repeat (int): Timing runs per loader; the best is kept.
+
+    Example:
+    >> bench_parse()
+    """
+    print(f"{'puzzle':<20}{'parse us':>10}{'cached us':>11}")
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for file_path in PUZZLES:
+            paths = [file_path] * loads
+            parse = best_time(lazor.read_puzzle, paths, repeat)
+            lazor.read_puzzle(file_path, cache_dir)
+            cached = best_time(
+                lambda path: lazor.read_puzzle(path, cache_dir),
+                paths, repeat)
+            print(f"{file_path:<20}{parse / loads * 1e6:>10.1f}"
+                  f"{cached / loads * 1e6:>11.1f}")
+
+
+def synthetic_game(size, blocks, seed):
+    """
+    Generates a solvable square puzzle by placing the blocks at random on
+    an empty board, shooting one laser from the left edge through it and
+    picking targets among the points the laser passes.
+
+    Arguments:
+    - size (int): The number of rows and columns.
+    - blocks (list): The letters of the blocks to place.
+    - seed (int): The seed of the random generator, so a case is the
+      same puzzle on every run.
+
+    Returns:
+    - game (Game): The generated game instance.
+
+    Example:
+    >> synthetic_game(6, ['A', 'A', 'B', 'C'], 7).get_blocks().get_opaque()
+    1
+    """
+    rng = random.Random(seed)
+    grid = [['o'] * size for _ in range(size)]
+    while True:
+        solved = [row[:] for row in grid]
+        cells = rng.sample(range(size * size), len(blocks))
+        for cell, block in zip(cells, blocks):
+            solved[cell // size][cell % size] = block
+        laser = lazor.Laser((0, rng.randrange(1, size * 2, 2)),
+                            (1, rng.choice((-1, 1))))
+        passed = sorted(lazor.shoot_laser(solved, [laser]))
+        # Insist on a long beam, so the targets are hard to hit by chance
+        if len(passed) >= size * 2:
+            points = sorted(rng.sample(passed, 3))
+            return lazor.Game(grid, lazor.Blocks(blocks), [laser], points)
+
+
+def count_steps(game, candidates):
+    """
+    Counts the laser steps of fully tracing the first candidate boards
+    of a game, the same work brute_force_search does for them. The
+    engines that trace less per board are still credited with these
+    steps, so steps per second compares like with like.
+
+    Arguments:
+    - game (Game): The parsed game instance.
+    - candidates (int): The number of candidate boards to trace.
+
+    Returns:
+    - steps (int): The number of beam states visited.
+    """
+    compiled = lazor.compile_game(game)
+    if compiled.target_mask is None:
+        return 0
+    layout = compiled.layout
+    clean = bytes(len(layout.neighbours))
+    visited = bytearray(clean)
+    total = 0
+    for i, board in enumerate(lazor.PlacementSpace(game).boards()):
+        if i == candidates:
+            break
+        lazor.trace_board(board, layout, compiled.starts,
+                          compiled.target_mask, visited)
+        total += visited.count(1)
+        visited[:] = clean
+    return total
+
+
+def run_case(name, engine, repeat):
+    """
+    Solves one suite case and measures it. Run in a fresh process, so
+    the peak resident set size belongs to this case alone.
+
+    Arguments:
+    - name (str): A bundled .bff file or a key of SYNTHETIC.
+    - engine (str): The search engine to use, one of lazor.SOLVER_ENGINES.
+    - repeat (int): Timing runs; the best is kept.
+
+    Returns:
+    - record (dict): The case, whether it was solved, the best wall time
+      in seconds, the candidates tested, the laser steps, their rates,
+      the peak RSS in kB and any error message. The steps are only
+      counted for BOARD_ENGINES and are None for the others.
+    """
+    record = {'case': name, 'engine': engine, 'solved': False,
+              'seconds': None, 'candidates': 0, 'steps': 0,
+              'candidates_per_sec': None, 'steps_per_sec': None,
+              'max_rss_kb': None, 'error': None}
+    try:
+        if name in SYNTHETIC:
+            size, blocks, seed = SYNTHETIC[name]
+            game = synthetic_game(size, list(blocks), seed)
+        else:
+            game = load_puzzle(name)
+        search = lazor.SOLVER_ENGINES[engine]
+        best = float('inf')
+        solution = None
+        stats = {}
+        for _ in range(max(repeat, 1)):
+            stats = {}
+            start = time.perf_counter()
+            solution = search(game, stats=stats)
+            best = min(best, time.perf_counter() - start)
+        record['solved'] = solution is not None
+        record['seconds'] = best
+        record['candidates'] = stats.get('candidates', 0)
+        if engine in BOARD_ENGINES:
+            record['steps'] = count_steps(game, record['candidates'])
+        else:
+            record['steps'] = None
+        if best > 0:
+            record['candidates_per_sec'] = record['candidates'] / best
+            if record['steps'] is not None:
+                record['steps_per_sec'] = record['steps'] / best
+    except (OSError, ValueError, IndexError) as error:
+        record['error'] = f"{type(error).__name__}: {error}"
+    record['max_rss_kb'] = resource.getrusage(
+        resource.RUSAGE_SELF).ru_maxrss
+    return record
+
+
+def compare_results(results, baseline, tolerance):
+    """
+    Compares suite results with a saved baseline run.
+
+    A case regresses when it is now more than tolerance and more than
+    NOISE_SECONDS slower than in the baseline, when it stops finding a
+    solution or when it fails where the baseline did not. Testing fewer
+    or more candidates is not a regression in itself, since pruning
+    changes the order of the search.
+
+    Arguments:
+    - results (list): The records of the current run.
+    - baseline (list): The records of the baseline run.
+    - tolerance (float): The allowed relative slowdown, e.g. 0.25.
+
+    Returns:
+    - regressions (list): One message per regressed case.
+
+    Example:
+    >> compare_results([{'case': 'a', 'seconds': 2.0, 'solved': True,
+    ..                   'error': None}],
+    ..                 [{'case': 'a', 'seconds': 1.0, 'solved': True,
+    ..                   'error': None}], 0.25)
+    ['a: 2.000s vs 1.000s baseline (+100%)']
+    """
+    previous = {record['case']: record for record in baseline}
+    regressions = []
+    for record in results:
+        old = previous.get(record['case'])
+        if old is None:
+            continue
+        name = record['case']
+        if record['solved'] != old['solved'] or \
+                (record['error'] and not old['error']):
+            regressions.append(
+                f"{name}: solved={record['solved']} error="
+                f"{record['error']} vs solved={old['solved']} error="
+                f"{old['error']} baseline")
+        elif record['seconds'] and old['seconds'] and \
+                record['seconds'] > old['seconds'] * (1 + tolerance) and \
+                record['seconds'] - old['seconds'] > NOISE_SECONDS:
+            change = record['seconds'] / old['seconds'] - 1
+            regressions.append(
+                f"{name}: {record['seconds']:.3f}s vs "
+                f"{old['seconds']:.3f}s baseline (+{change:.0%})")
+    return regressions
+
+
+def bench_suite(engine='brute', repeat=3, output=None, baseline=None,
+                tolerance=0.25):
+    """
+    Runs every bundled puzzle and the synthetic boards, each in a fresh
+    process, and prints wall time, candidates per second, laser steps per
+    second and peak RSS. The results can be written as JSON and compared
+    against a saved baseline.
+
+    Arguments:
+    - engine (str): The search engine to use. Defaults to 'brute'.
+    - repeat (int): Timing runs per case; the best is kept.
+    - output (str): Optional path to write the JSON results to.
+    - baseline (str): Optional path of a saved JSON run to compare to.
+    - tolerance (float): The allowed relative slowdown against the
+      baseline. Defaults to 0.25.
+
+    Returns:
+    - status (int): 1 if any case regressed against the baseline,
+      otherwise 0.
+
+    Example:
+    >> bench_suite(output='baseline.json')
+    >> bench_suite(baseline='baseline.json')
+    """
+    results = []
+    print(f"{'case':<20}{'seconds':>9}{'candidates/s':>14}{'steps/s':>12}"
+          f"{'RSS kB':>9}")
+    context = multiprocessing.get_context('spawn')
+    for name in SUITE + list(SYNTHETIC):
+        with ProcessPoolExecutor(max_workers=1,
+                                 mp_context=context) as executor:
+            record = executor.submit(run_case, name, engine, repeat).result()
+        results.append(record)
+        if record['error']:
+            print(f"{name:<20}{record['error']}")
+            continue
+        steps_per_sec = record['steps_per_sec']
+        steps_per_sec = '-' if steps_per_sec is None else \
+            f"{steps_per_sec:.0f}"
+        print(f"{name:<20}{record['seconds']:>9.3f}"
+              f"{record['candidates_per_sec'] or 0:>14.0f}"
+              f"{steps_per_sec:>12}{record['max_rss_kb']:>9}")
+
+    if output:
+        run = {'engine': engine, 'repeat': repeat,
+               'python': platform.python_version(),
+               'machine': platform.machine(), 'results': results}
+        with open(output, 'w') as file:
+            json.dump(run, file, indent=2)
+    if baseline:
+        with open(baseline) as file:
+            saved = json.load(file)
+        regressions = compare_results(results, saved['results'], tolerance)
+        for message in regressions:
+            print(f"REGRESSION {message}")
+        if regressions:
+            return 1
+        print(f"No regressions against {baseline}")
+    return 0
+
+
+BENCHMARKS = {
+    'startup': bench_startup,
+    'trace': bench_trace,
+    'batch': bench_batch,
+    'bitboard': bench_bitboard,
+    'parse': bench_parse,
+    'suite': bench_suite,
+}
+
+
+def main(argv=None):
+    """
+    Runs the benchmarks named on the command line, or all of them.
+
+    Arguments:
+    - argv (list): The command line arguments. Defaults to sys.argv[1:].
+
+    Returns:
+    - status (int): The exit status, 1 if the suite found regressions.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('names', nargs='*', metavar='benchmark',
+                        help=f"one of {', '.join(BENCHMARKS)}")
+    parser.add_argument('-e', '--engine', default='brute',
+                        choices=sorted(lazor.SOLVER_ENGINES),
+                        help='search engine of the suite')
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help='timing runs per suite case')
+    parser.add_argument('-o', '--output',
+                        help='write the suite results to this JSON file')
+    parser.add_argument('-b', '--baseline',
+                        help='compare the suite with this JSON file')
+    parser.add_argument('-t', '--tolerance', type=float, default=0.25,
+                        help='allowed slowdown against the baseline')
+    args = parser.parse_args(argv)
+    for name in args.names:
+        if name not in BENCHMARKS:
+            parser.error(f"Unknown benchmark: {name} "
+                         f"(choose from {', '.join(BENCHMARKS)})")
+
+    status = 0
+    for name in args.names or list(BENCHMARKS):
+        print(f"== {name}")
+        if name == 'suite':
+            status |= bench_suite(args.engine, args.repeat, args.output,
+                                  args.baseline, args.tolerance)
+        else:
+            BENCHMARKS[name]()
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,48 @@
-from sympy.utilities.iterables import multiset_permutations
+from array import array
+from collections import OrderedDict, defaultdict, namedtuple
+from concurrent.futures import (FIRST_COMPLETED, ProcessPoolExecutor,
+                                as_completed, wait)
+from functools import lru_cache
+from itertools import combinations, islice, permutations
+import argparse
+import contextlib
+import cProfile
+import hashlib
+import importlib.util
+import io
+import json
+import mmap
+import multiprocessing
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import time
 import unittest
 
+try:
+    import fcntl
+except ImportError:  # no file locks on Windows; writes stay atomic
+    fcntl = None
+
+# numpy is only needed for the batch evaluator, so it is imported there
+# rather than slowing down every start
+NUMPY_AVAILABLE = importlib.util.find_spec('numpy') is not None
+
+# Small-integer codes for the cells of a flat board. Blocks sort in the
+# same order as their letters, so permuting codes visits placements in
+# the same order as permuting letters, and every code up to REFRACT
+# interacts with a beam.
+REFLECT, OPAQUE, REFRACT, EMPTY, NO_BLOCK = 1, 2, 3, 4, 5
+BLOCK_CODES = {'A': REFLECT, 'B': OPAQUE, 'C': REFRACT,
+               'o': EMPTY, 'x': NO_BLOCK}
+BLOCK_LETTERS = {code: letter for letter, code in BLOCK_CODES.items()}
+GRID_LETTERS = ''.join(BLOCK_CODES)
+
+# Beam directions, numbered so that d ^ 2 flips vx and d ^ 1 flips vy
+DIRECTIONS = ((-1, -1), (-1, 1), (1, -1), (1, 1))
+
 
 # Define the basic classes first
 class Blocks:
@@ -244,35 +286,73 @@ class Game:
         return self.points
 
 
-# Now we'll define the parser function to read
-# from the .bff file and create a game instance
-def parse_bff(file_path):
+class Puzzle(namedtuple('Puzzle', ['grid', 'blocks', 'lasers', 'points'])):
+    """
+    A compact, immutable and hashable description of a puzzle, as read
+    from a .bff file.
+
+    Attributes:
+    - grid (tuple): One string per grid row, one letter per cell.
+    - blocks (tuple): The numbers of reflect, opaque and refract blocks.
+    - lasers (tuple): One (x, y, vx, vy) tuple per laser.
+    - points (tuple): One (x, y) tuple per point to intersect.
+    """
+    __slots__ = ()
+
+    def to_game(self):
+        """
+        Builds a fresh game instance from the puzzle.
+
+        Returns:
+        - game (Game): The game instance.
+
+        Example:
+        >> puzzle = Puzzle(('oo', 'ox'), (1, 0, 0), ((1, 4, 1, -1),),
+        ..                 ((2, 1),))
+        >> puzzle.to_game().get_grid()
+        [['o', 'o'], ['o', 'x']]
+        """
+        reflect, opaque, refract = self.blocks
+        return Game([list(row) for row in self.grid],
+                    Blocks(['A'] * reflect + ['B'] * opaque +
+                           ['C'] * refract),
+                    [Laser((x, y), (vx, vy))
+                     for x, y, vx, vy in self.lasers],
+                    [tuple(point) for point in self.points])
+
+
+def parse_puzzle(text, source='<string>'):
     """
-    Parses a .bff file and creates a game instance.
+    Parses the text of a .bff file into a Puzzle without printing it.
+
+    Lines that are comments, blank or not understood are skipped, as
+    they always have been. Errors name the source and the line number.
 
     Arguments:
-    - file_path (str): The path of the .bff file.
+    - text (str): The content of the .bff file.
+    - source (str): The name of the file, for error messages.
 
     Returns:
-    - game (Game): The game instance created from the .bff file.
+    - puzzle (Puzzle): The parsed puzzle.
 
     Example:
-    >> game_instance = parse_bff('showstopper_4.bff')
+    >> parse_puzzle('GRID START\no o\nGRID STOP\nA 1\nL 0 1 1 1\nP 2 1')
+    Puzzle(grid=('oo',), blocks=(1, 0, 0), lasers=((0, 1, 1, 1),),
+           points=((2, 1),))
+    >> parse_puzzle('GRID START\no o\nGRID STOP\nL 0 1')
+    ValueError: <string>, line 4: Invalid laser line: L 0 1
     """
+    grid = []
+    counts = {'A': 0, 'B': 0, 'C': 0}
+    lasers = []
+    points = []
 
-    grid_data = []  # To store raw grid data from the file
-    blocks = ['A', 'B', 'C']  # Valid block types
-    available_blocks = []  # To store the types and counts of available block
-    lasers = []  # To store laser objects
-    points = []  # To store points that lasers need to intersect
-
-    with open(file_path, 'r') as file:
-        content = file.readlines()
+    def fail(number, message):
+        raise ValueError(f"{source}, line {number}: {message}")
 
     reading_grid = False
-    for line in content:
+    for number, line in enumerate(text.splitlines(), 1):
         line = line.strip()
-        print(line)
         if line.startswith('#') or not line:
             # This is a comment or empty line, skip it
             continue
@@ -281,80 +361,653 @@ def parse_bff(file_path):
         elif line == 'GRID STOP':
             reading_grid = False
         elif reading_grid:
-            line = line.replace(" ", "")  # Remove spaces for grid data
-            grid_data.append(line)
-        elif line[0] in blocks:
+            row = line.replace(" ", "")  # Remove spaces for grid data
+            if row.strip(GRID_LETTERS):
+                fail(number, f"Invalid grid line: {line}")
+            if grid and len(row) != len(grid[0]):
+                fail(number, f"Grid row has {len(row)} cells, "
+                     f"expected {len(grid[0])}: {line}")
+            grid.append(row)
+        elif line[0] in counts:
             # This line indicates the number of a specific type of block
-            try:
-                block_type, count = line.split()
-                available_blocks.extend([block_type
-                                         for _ in range(int(count))])
-            except ValueError:
-                raise ValueError(f"Invalid block line: {line}")
+            fields = line.split()
+            if (len(fields) != 2 or fields[0] not in counts or
+                    not fields[1].isdigit()):
+                fail(number, f"Invalid block line: {line}")
+            counts[fields[0]] += int(fields[1])
         elif line.startswith('L'):
             # This line defines a laser
             try:
                 _, x, y, vx, vy = line.split()
-                lasers.append(Laser((int(x), int(y)), (int(vx), int(vy))))
+                lasers.append((int(x), int(y), int(vx), int(vy)))
             except ValueError:
-                raise ValueError(f"Invalid laser line: {line}")
+                fail(number, f"Invalid laser line: {line}")
         elif line.startswith('P'):
             # This line defines a point
             try:
                 _, x, y = line.split()
                 points.append((int(x), int(y)))
             except ValueError:
-                raise ValueError(f"Invalid point line: {line}")
-    if not grid_data:
-        raise ValueError("No grid data found in the file")
+                fail(number, f"Invalid point line: {line}")
+    if not grid:
+        raise ValueError(f"{source}: No grid data found in the file")
+    return Puzzle(tuple(grid), (counts['A'], counts['B'], counts['C']),
+                  tuple(lasers), tuple(points))
 
-    rows = len(grid_data)
-    cols = len(grid_data[0])
-    grid_array = [[0 for i in range(cols)] for j in range(rows)]
 
-    # Convert raw grid data to a 2D grid array
-    for i, line in enumerate(grid_data):
-        for j in range(cols):
-            grid_array[i][j] = line[j:j + 1]
-    block_object = Blocks(available_blocks)
-    game = Game(grid_array, block_object, lasers, points)
-    return game
+def read_puzzle(file_path, cache_dir=None):
+    """
+    Reads a .bff file into a Puzzle, optionally through an on-disk cache.
+
+    Cache entries are keyed by a hash of the file content, so a renamed
+    or copied puzzle still hits and an edited one misses. An entry that
+    cannot be read is parsed again and replaced.
+
+    Arguments:
+    - file_path (str): The path of the .bff file.
+    - cache_dir (str): Optional directory of cached puzzles; it is
+      created if needed.
+
+    Returns:
+    - puzzle (Puzzle): The parsed puzzle.
+
+    Example:
+    >> read_puzzle('tiny_5.bff', cache_dir='.bff_cache').blocks
+    (3, 0, 1)
+    """
+    with open(file_path, 'rb') as file:
+        content = file.read()
+    if cache_dir is None:
+        return parse_puzzle(content.decode(), file_path)
+
+    key = hashlib.sha256(content).hexdigest()
+    entry = os.path.join(cache_dir, f"{key}.json")
+    try:
+        with open(entry) as file:
+            grid, blocks, lasers, points = json.load(file)
+        return Puzzle(tuple(grid), tuple(blocks),
+                      tuple(map(tuple, lasers)), tuple(map(tuple, points)))
+    except (OSError, ValueError, TypeError):
+        pass  # not cached yet, or unreadable
+
+    puzzle = parse_puzzle(content.decode(), file_path)
+    os.makedirs(cache_dir, exist_ok=True)
+    # Write to a private file first, so readers never see half an entry
+    handle, temp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+    with os.fdopen(handle, 'w') as file:
+        json.dump(puzzle, file)
+    os.replace(temp_path, entry)
+    return puzzle
 
 
-def place_blocks(available_slots, blocks):
+# Now we'll define the parser function to read
+# from the .bff file and create a game instance
+def parse_bff(file_path, cache_dir=None):
     """
-    Generates all possible permutations of placing blocks
-    onto the original board.
+    Parses a .bff file and creates a game instance. Nothing is printed.
+
+    Arguments:
+    - file_path (str): The path of the .bff file.
+    - cache_dir (str): Optional directory of cached puzzles, see
+      read_puzzle.
+
+    Returns:
+    - game (Game): The game instance created from the .bff file.
+
+    Example:
+    >> game_instance = parse_bff('showstopper_4.bff')
+    """
+    return read_puzzle(file_path, cache_dir).to_game()
+
+
+# Layout of a packed puzzle corpus: a file header, then one offset per
+# puzzle plus the end offset, then the puzzle records. A record is a
+# fixed-width header (rows, cols, block counts, numbers of lasers and
+# points, name length), the grid codes row by row, the lasers as four
+# int16 each, the points as two int16 each and the UTF-8 name.
+CORPUS_MAGIC = b'LAZORPZL'
+CORPUS_VERSION = 1
+CORPUS_HEADER = struct.Struct('<8sHHI')
+CORPUS_OFFSET = struct.Struct('<Q')
+RECORD_HEADER = struct.Struct('<BBHHHHHH')
+CODE_LETTERS = bytes(range(256)).translate(
+    bytes.maketrans(bytes(BLOCK_LETTERS), ''.join(
+        BLOCK_LETTERS.values()).encode()))
+LETTER_CODES = bytes.maketrans(GRID_LETTERS.encode(),
+                               bytes(BLOCK_CODES.values()))
+
+
+def pack_puzzle(puzzle, name=''):
+    """
+    Packs a puzzle into one record of a corpus file.
+
+    Arguments:
+    - puzzle (Puzzle): The puzzle to pack.
+    - name (str): The name stored with the puzzle, usually its file name.
+
+    Returns:
+    - record (bytes): The packed record.
+
+    Example:
+    >> len(pack_puzzle(read_puzzle('tiny_5.bff'), 'tiny_5.bff'))
+    49
+    """
+    rows, cols = len(puzzle.grid), len(puzzle.grid[0])
+    name = name.encode()
+    try:
+        header = RECORD_HEADER.pack(rows, cols, *puzzle.blocks,
+                                    len(puzzle.lasers), len(puzzle.points),
+                                    len(name))
+        numbers = [value for laser in puzzle.lasers for value in laser]
+        numbers += [value for point in puzzle.points for value in point]
+        numbers = struct.pack(f'<{len(numbers)}h', *numbers)
+    except struct.error as error:
+        raise ValueError(f"Puzzle does not fit a corpus record: {error}")
+    grid = ''.join(puzzle.grid).encode().translate(LETTER_CODES)
+    return header + grid + numbers + name
+
+
+def write_corpus(corpus_path, file_paths):
+    """
+    Converts .bff files into one packed corpus file. Files that cannot
+    be parsed are left out.
+
+    Arguments:
+    - corpus_path (str): The path of the corpus file to write.
+    - file_paths (list): Paths of .bff files or of directories holding
+      them, see find_puzzles.
+
+    Returns:
+    - written (int): The number of puzzles in the corpus.
+    - skipped (list): One (file path, error message) pair per file left
+      out.
+
+    Example:
+    >> write_corpus('levels.lzc', ['levels/'])
+    (7, [('levels/yarn_5.bff', 'levels/yarn_5.bff: No grid data ...')])
+    """
+    records = []
+    skipped = []
+    for file_path in find_puzzles(file_paths):
+        try:
+            records.append(pack_puzzle(read_puzzle(file_path),
+                                       os.path.basename(file_path)))
+        except (OSError, ValueError) as error:
+            skipped.append((file_path, str(error)))
+
+    offset = CORPUS_HEADER.size + CORPUS_OFFSET.size * (len(records) + 1)
+    offsets = []
+    for record in records:
+        offsets.append(offset)
+        offset += len(record)
+    offsets.append(offset)
+
+    # Write to a private file first, so readers never see half a corpus
+    directory = os.path.dirname(os.path.abspath(corpus_path))
+    handle, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(handle, 'wb') as file:
+        file.write(CORPUS_HEADER.pack(CORPUS_MAGIC, CORPUS_VERSION, 0,
+                                      len(records)))
+        file.write(b''.join(CORPUS_OFFSET.pack(offset)
+                            for offset in offsets))
+        file.writelines(records)
+    os.replace(temp_path, corpus_path)
+    return len(records), skipped
+
+
+class PuzzleCorpus:
+    """
+    A packed corpus file of puzzles, memory-mapped so that puzzle k is
+    read straight from the page cache without reading the rest.
+
+    Attributes:
+    - path (str): The path of the corpus file.
+    - count (int): The number of puzzles.
+    """
+
+    def __init__(self, path):
+        """
+        Opens and maps a corpus file written by write_corpus.
+
+        Arguments:
+        - path (str): The path of the corpus file.
+
+        Example:
+        >> with PuzzleCorpus('levels.lzc') as corpus:
+        ..     corpus[3].to_game()
+        """
+        self.path = path
+        with open(path, 'rb') as file:
+            try:
+                self.map = mmap.mmap(file.fileno(), 0,
+                                     access=mmap.ACCESS_READ)
+            except ValueError:  # an empty file cannot be mapped
+                raise ValueError(f"{path}: Not a puzzle corpus")
+        self.view = memoryview(self.map)
+        if len(self.map) < CORPUS_HEADER.size:
+            self.close()
+            raise ValueError(f"{path}: Not a puzzle corpus")
+        magic, version, _, self.count = CORPUS_HEADER.unpack_from(self.map)
+        if magic != CORPUS_MAGIC or version != CORPUS_VERSION:
+            self.close()
+            raise ValueError(f"{path}: Not a puzzle corpus of version "
+                             f"{CORPUS_VERSION}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """
+        Unmaps the corpus file. Boards returned by board must be released
+        or dropped first, or mmap raises BufferError.
+        """
+        self.view.release()
+        self.map.close()
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        for index in range(self.count):
+            yield self[index]
+
+    def record(self, index):
+        """
+        Locates the record of puzzle index.
+
+        Returns:
+        - header (tuple): The unpacked fixed-width record header.
+        - offset (int): The offset of the grid codes in the file.
+        """
+        if not 0 <= index < self.count:
+            raise IndexError(f"Puzzle {index} is not in {self.path}")
+        offset, = CORPUS_OFFSET.unpack_from(
+            self.map, CORPUS_HEADER.size + CORPUS_OFFSET.size * index)
+        return (RECORD_HEADER.unpack_from(self.map, offset),
+                offset + RECORD_HEADER.size)
+
+    def board(self, index):
+        """
+        Returns the grid codes of a puzzle without copying them, ready to
+        use as the base board of trace_board.
+
+        Arguments:
+        - index (int): The number of the puzzle.
+
+        Returns:
+        - board (memoryview): The block codes of the cells, row by row.
+          It points into the mapped file, so release it before close.
+        """
+        (rows, cols, *_), offset = self.record(index)
+        return self.view[offset:offset + rows * cols]
+
+    def name(self, index):
+        """
+        Returns the name stored with a puzzle.
+        """
+        (rows, cols, _, _, _, lasers, points, length), offset = \
+            self.record(index)
+        offset += rows * cols + 2 * (lasers * 4 + points * 2)
+        return bytes(self.view[offset:offset + length]).decode()
+
+    def __getitem__(self, index):
+        """
+        Decodes puzzle index.
+
+        Arguments:
+        - index (int): The number of the puzzle.
+
+        Returns:
+        - puzzle (Puzzle): The puzzle, equal to read_puzzle of its file.
+        """
+        (rows, cols, reflect, opaque, refract, lasers, points, _), \
+            offset = self.record(index)
+        letters = bytes(self.view[offset:offset + rows * cols]).translate(
+            CODE_LETTERS).decode()
+        numbers = struct.unpack_from(f'<{lasers * 4 + points * 2}h',
+                                     self.map, offset + rows * cols)
+        return Puzzle(
+            tuple(letters[i:i + cols] for i in range(0, rows * cols, cols)),
+            (reflect, opaque, refract),
+            tuple(numbers[i:i + 4] for i in range(0, lasers * 4, 4)),
+            tuple(numbers[i:i + 2]
+                  for i in range(lasers * 4, len(numbers), 2)))
+
+
+def multinomial(counts):
+    """
+    Counts the distinct orderings of a multiset with the given
+    multiplicities, n! / (k1! k2! ...).
+
+    Arguments:
+    - counts (list): The multiplicity of each distinct item.
+
+    Returns:
+    - total (int): The number of distinct orderings.
+
+    Example:
+    >> multinomial([1, 2, 3])
+    60
+    """
+    # Built up one factor at a time so every intermediate is an integer
+    total = 1
+    placed = 0
+    for count in counts:
+        for i in range(1, count + 1):
+            placed += 1
+            total = total * placed // i
+    return total
+
+
+def multiset_permutations(items, start=0):
+    """
+    Lazily generates the distinct permutations of a multiset in
+    lexicographic order.
+
+    The first permutation is unranked directly from the start index and
+    each following one is produced in place with the classic
+    next-lexicographic-permutation step, so skipping ahead costs nothing
+    and only one working list is ever kept.
+
+    Arguments:
+    - items (list): The items to permute, duplicates allowed.
+    - start (int): Rank of the first permutation to yield. Defaults to 0.
+
+    Yields:
+    - perm (list): A fresh list holding one permutation.
+
+    Example:
+    >> list(multiset_permutations(['B', 'A', 'A']))
+    [['A', 'A', 'B'], ['A', 'B', 'A'], ['B', 'A', 'A']]
+    >> list(multiset_permutations(['B', 'A', 'A'], start=2))
+    [['B', 'A', 'A']]
+    """
+    symbols = sorted(set(items))
+    counts = [list(items).count(symbol) for symbol in symbols]
+    remaining = multinomial(counts)
+    if start >= remaining:
+        return
+
+    # Unrank the starting permutation one position at a time
+    perm = []
+    rank = start
+    for _ in range(len(items)):
+        for k, symbol in enumerate(symbols):
+            if counts[k] == 0:
+                continue
+            counts[k] -= 1
+            block = multinomial(counts)
+            if rank < block:
+                perm.append(symbol)
+                break
+            rank -= block
+            counts[k] += 1
+    yield perm[:]
+
+    n = len(perm)
+    while True:
+        # Find the rightmost ascent, the last position that can grow
+        i = n - 2
+        while i >= 0 and perm[i] >= perm[i + 1]:
+            i -= 1
+        if i < 0:
+            return
+        # Swap it with the smallest larger item to its right
+        j = n - 1
+        while perm[j] <= perm[i]:
+            j -= 1
+        perm[i], perm[j] = perm[j], perm[i]
+        # The tail is descending, so reversing it makes it the smallest
+        perm[i + 1:] = perm[:i:-1]
+        yield perm[:]
+
+
+def revolving_door(n, k):
+    """
+    Lazily generates the k-element subsets of range(n) in revolving door
+    order, where each subset differs from the one before by swapping a
+    single element in for a single element out. This is the loopless
+    Algorithm R from Knuth, The Art of Computer Programming, 7.2.1.3.
+
+    Arguments:
+    - n (int): The size of the ground set.
+    - k (int): The size of each subset.
+
+    Yields:
+    - subset (list): The elements of one subset, in increasing order.
+      The same list is updated in place, so copy it to keep it.
+
+    Example:
+    >> [subset[:] for subset in revolving_door(4, 2)]
+    [[0, 1], [1, 2], [0, 2], [2, 3], [1, 3], [0, 3]]
+    """
+    if k == 0 or k == n:
+        yield list(range(k))
+        return
+    # c[1..k] hold the subset, c[k + 1] = n is a sentinel
+    c = [0] + list(range(k)) + [n]
+    subset = c[1:k + 1]
+    while True:
+        subset[:] = c[1:k + 1]
+        yield subset
+        if k % 2:  # easy case for odd k, move the smallest element up
+            if c[1] + 1 < c[2]:
+                c[1] += 1
+                continue
+            j = 2
+            increase = False
+        else:  # easy case for even k, move the smallest element down
+            if c[1] > 0:
+                c[1] -= 1
+                continue
+            j = 2
+            increase = True
+        while j <= k:
+            if not increase:
+                # Try to decrease c[j]
+                if c[j] >= j:
+                    c[j] = c[j - 1]
+                    c[j - 1] = j - 2
+                    break
+                j += 1
+            # Try to increase c[j]
+            if j <= k and c[j] + 1 < c[j + 1]:
+                c[j - 1] = c[j]
+                c[j] += 1
+                break
+            j += 1
+            increase = False
+        else:
+            return
+
+
+def minimal_change_permutations(codes):
+    """
+    Lazily generates the distinct permutations of a multiset of block
+    codes so that consecutive permutations differ in very few positions.
+
+    The slots holding a block follow the revolving door order, so moving
+    to the next set of slots moves one block to one empty slot. For each
+    set of slots the arrangements of the blocks over them run through in
+    lexicographic order, alternately forwards and backwards, so the last
+    arrangement for one set of slots is also the first for the next.
+
+    Arguments:
+    - codes (list): The block codes to permute, with EMPTY for the slots
+      left open.
+
+    Yields:
+    - perm (list): The current permutation. The same list is updated in
+      place and yielded each time, so copy it to keep it.
+    - changed (list): The positions that changed since the previous
+      permutation, or every position for the first one.
+
+    Example:
+    >> [perm[:] for perm, _ in minimal_change_permutations([1, 4, 4])]
+    [[1, 4, 4], [4, 1, 4], [4, 4, 1]]
+    """
+    n = len(codes)
+    blocks = sorted(code for code in codes if code != EMPTY)
+    # Arrangements of the blocks over the block slots, small and fixed
+    arrangements = [tuple(perm) for perm in multiset_permutations(blocks)]
+    perm = [EMPTY] * n
+    roles = None
+    forward = True
+    for subset in revolving_door(n, len(blocks)):
+        if roles is None:
+            roles = list(subset)
+            for slot, code in zip(roles, arrangements[0]):
+                perm[slot] = code
+            yield perm, list(range(n))
+        else:
+            # One slot lost its block and another gained it
+            left = set(roles).difference(subset).pop()
+            entered = set(subset).difference(roles).pop()
+            roles[roles.index(left)] = entered
+            perm[entered] = perm[left]
+            perm[left] = EMPTY
+            yield perm, [left, entered]
+        order = arrangements if forward else arrangements[::-1]
+        for previous, arrangement in zip(order, order[1:]):
+            changed = []
+            for slot, old, new in zip(roles, previous, arrangement):
+                if old != new:
+                    perm[slot] = new
+                    changed.append(slot)
+            yield perm, changed
+        forward = not forward
+
+
+def ranked_minimal_change_permutations(codes, prefix=1024):
+    """
+    Lazily generates the distinct permutations of a multiset of block
+    codes, the first prefix of them in lexicographic order and the rest
+    in the order of minimal_change_permutations.
+
+    The lexicographic prefix tests the same placements first as the
+    brute-force search, which finds many solutions early on. The
+    minimal-change walk then changes few slots per step over the rest,
+    passing over the permutations the prefix already gave.
+
+    Arguments:
+    - codes (list): The block codes to permute, with EMPTY for the slots
+      left open.
+    - prefix (int): The number of permutations to give in lexicographic
+      order. Defaults to 1024.
+
+    Yields:
+    - perm (list): The current permutation. Do not change it.
+    - changed (list): The positions that changed since the previous
+      permutation, or every position for the first one.
+
+    Example:
+    >> [perm[:] for perm, _ in
+    ..  ranked_minimal_change_permutations([1, 4, 4, 4], prefix=2)]
+    [[1, 4, 4, 4], [4, 1, 4, 4], [4, 4, 1, 4], [4, 4, 4, 1]]
+    """
+    n = len(codes)
+    # The permutation the caller last saw, to work out what changed
+    # across the permutations passed over
+    current = None
+    given = 0
+    for perm in islice(multiset_permutations(codes), prefix):
+        if current is None:
+            changed = list(range(n))
+        else:
+            changed = [i for i in range(n) if perm[i] != current[i]]
+        current = perm
+        given += 1
+        yield perm, changed
+    if given < prefix:
+        return
+    if current is None:
+        yield from minimal_change_permutations(codes)
+        return
+
+    last = current
+    current = current[:]
+    skipped = False
+    for perm, changed in minimal_change_permutations(codes):
+        if perm <= last:
+            skipped = True
+            continue
+        if skipped:
+            changed = [i for i in range(n) if perm[i] != current[i]]
+            skipped = False
+        for i in changed:
+            current[i] = perm[i]
+        yield perm, changed
+
+
+def count_placements(available_slots, blocks):
+    """
+    Counts the distinct block placements without generating them.
 
     Arguments:
     - available_slots (list): List of available slots on the board.
     - blocks (Blocks): The available blocks in the game.
 
     Returns:
-    - perms (list): A list of all possible block placement permutations.
+    - total (int): The number of distinct placement permutations.
 
     Example:
     >> blocks = Blocks(['A', 'B', 'B', 'C', 'C', 'C'])
     >> slots = [(0, 0), (0, 1), (1, 1), (2, 2), (2, 2), (2, 2)]
-    >> perms = place_blocks(slots, blocks)
-    >> len(perms)
+    >> count_placements(slots, blocks)
     60
     """
-    # Extract block counts for reflection, opaque, refractive, and empty slots
     reflect = blocks.get_reflect()
     opaque = blocks.get_opaque()
     refract = blocks.get_refract()
     empty = len(available_slots) - reflect - opaque - refract
+    if empty < 0:
+        return 0
+    return multinomial([reflect, opaque, refract, empty])
+
+
+def place_blocks(available_slots, blocks, start=0):
+    """
+    Lazily generates all possible permutations of placing blocks
+    onto the original board.
 
-    # Creat a list of block symbols based on counts
-    blocks = ['A'] * reflect + ['B'] * opaque + ['C'] * refract + ['o'] * empty
+    Placements are yielded one at a time in lexicographic order, so
+    memory use does not depend on the size of the placement space and
+    callers can stop as soon as they find what they are looking for.
 
-    # Generate all possible permutations of the block symbols
-    perms = list(multiset_permutations(reflect * ('A',) +
-                                       opaque * ('B',) +
-                                       refract * ('C',) +
-                                       empty * ('o',)))
-    return perms
+    Arguments:
+    - available_slots (list): List of available slots on the board.
+    - blocks (Blocks): The available blocks in the game.
+    - start (int): Rank of the first placement to yield, used to
+      resume an interrupted enumeration. Defaults to 0.
+
+    Yields:
+    - perm (list): One block placement permutation.
+
+    Example:
+    >> blocks = Blocks(['A', 'B', 'B', 'C', 'C', 'C'])
+    >> slots = [(0, 0), (0, 1), (1, 1), (2, 2), (2, 2), (2, 2)]
+    >> perms = place_blocks(slots, blocks)
+    >> next(perms)
+    ['A', 'B', 'B', 'C', 'C', 'C']
+    >> len(list(place_blocks(slots, blocks, start=50)))
+    10
+    """
+    # Extract block counts for reflection, opaque, refractive, and empty slots
+    reflect = blocks.get_reflect()
+    opaque = blocks.get_opaque()
+    refract = blocks.get_refract()
+    empty = len(available_slots) - reflect - opaque - refract
+    if empty < 0:
+        return
+
+    # Generate the permutations of the block symbols on demand
+    yield from multiset_permutations(reflect * ('A',) +
+                                     opaque * ('B',) +
+                                     refract * ('C',) +
+                                     empty * ('o',), start)
 
 
 def find_all_placements(grid):
@@ -383,212 +1036,3061 @@ def find_all_placements(grid):
     return available_positions
 
 
-def shoot_laser(grid, lasers):
-    '''
-    Shoot laser through the completed grid with blocks, and
-    retain all the points that the laser passes through
+def point_bit(point, grid):
+    """
+    Numbers a point of the half-step lattice over the grid, so that a set
+    of points can be held as the bits of one integer.
 
     Arguments:
-   - grid (list): The grid of the game.
-   - lasers (list): The lasers in the game.
+    - point (tuple): The point as a tuple (x, y).
+    - grid (list): The grid of the game.
 
-   Returns:
-   - passed_points (list): List of points that the lasers pass through.
+    Returns:
+    - bit (int): The bit index of the point, or None if the point is
+      not on the lattice.
 
-   Example:
-   >> grid = [[0, 'A', 0], ['B', 0, 'C']]
-   >> lasers = [Laser((1, 2), (1, -1)), Laser((3, 4), (0, -1))]
-   >> shoot_laser(grid, lasers)
-   [(2, 0), (2, 2)]
-    '''
-    passed_points = []
-
-    def laser_step(laser, grid):
-        # acquire current position and direction
-        curr_pos = laser.get_position()
-        curr_dir = laser.get_direction()
-        # check if the current position is out of bounds
-        if check(curr_pos, grid) is False:
-            return
-        # Identify block of interest
-
-        def find_row_col(curr_pos, curr_dir):
-            if curr_pos[0] % 2 == 0:  # if x coordinate is even
-                if curr_dir[0] == 1:
-                    row_num = int((curr_pos[1]-1)/2)
-                    col_num = int(curr_pos[0]/2)
-                else:
-                    row_num = int((curr_pos[1]-1)/2)
-                    col_num = int((curr_pos[0]-2)/2)
-            else:
-                if curr_dir[1] == 1:
-                    row_num = int(curr_pos[1]/2)
-                    col_num = int((curr_pos[0]-1)/2)
-                else:
-                    row_num = int((curr_pos[1]-2)/2)
-                    col_num = int((curr_pos[0]-1)/2)
-            return row_num, col_num
-        row_num, col_num = find_row_col(curr_pos, curr_dir)
-        # check if interested block is out of bounds
-        if row_num < 0 or col_num < 0:
-            return
-        # check if interested block is out of bounds
-        if row_num >= len(grid) or col_num >= len(grid[0]):
-            return
-        interested_block = grid[row_num][col_num]
-        # Identify what type of block is encountered
-        if interested_block == 'A':  # reflect
-            if curr_pos[0] % 2 == 0:
-                # flip x only
-                laser.change_direction((curr_dir[0]*(-1), curr_dir[1]))
-            else:
-                # flip y only
-                laser.change_direction((curr_dir[0], curr_dir[1]*(-1)))
-            # Need to account for the case where the starting points
-            # are both reflect blocks for which
-            # this code will keep recursively calling itself
-            new_dir = laser.get_direction()
-            temp_row_num, temp_col_num = find_row_col(curr_pos, new_dir)
-            if temp_row_num < 0 or temp_col_num < 0:
-                return
-            if temp_row_num >= len(grid) or temp_col_num >= len(grid[0]):
-                return
-            new_block = grid[temp_row_num][temp_col_num]
-            if new_block == 'A':
-                return
-            laser_step(laser, grid)
-        elif interested_block == 'B':  # opaque, ray operation ends here
-            return
-        elif interested_block == 'C':  # refract
-            new_pos = (curr_pos[0]+curr_dir[0], curr_pos[1]+curr_dir[1])
-            if new_pos not in passed_points:
-                passed_points.append(new_pos)
-            new_laser = Laser(new_pos, curr_dir)
-            laser_step(new_laser, grid)
-            if curr_pos[0] % 2 == 0:
-                laser.change_direction((curr_dir[0]*(-1), curr_dir[1]))
-            else:
-                laser.change_direction((curr_dir[0], curr_dir[1]*(-1)))
-            # Need to account for the case where the starting points
-            # are both reflect blocks for which
-            # this code will keep recursively calling itself
-            new_dir = laser.get_direction()
-            temp_row_num, temp_col_num = find_row_col(curr_pos, new_dir)
-            if temp_row_num < 0 or temp_col_num < 0:
-                return
-            if temp_row_num >= len(grid) or temp_col_num >= len(grid[0]):
-                return
-            new_block = grid[temp_row_num][temp_col_num]
-            if new_block == 'A':
-                return
-            laser_step(laser, grid)
-        else:
-            new_pos = (curr_pos[0]+curr_dir[0], curr_pos[1]+curr_dir[1])
-            if new_pos not in passed_points:
-                passed_points.append(new_pos)
-            laser.change_position(new_pos)
-            laser_step(laser, grid)
-
-    for laser in lasers:
-        temp_pos = laser.get_position()
-        temp_dir = laser.get_direction()
-        temp_laser = Laser(temp_pos, temp_dir)
-        laser_step(temp_laser, grid)
-    return passed_points
+    Example:
+    >> grid = [['o', 'o'], ['o', 'o']]
+    >> point_bit((1, 2), grid)
+    11
+    """
+    width = len(grid[0]) * 2 + 1
+    if not 0 <= point[0] < width or not 0 <= point[1] <= len(grid) * 2:
+        return None
+    return point[1] * width + point[0]
 
 
-def check(curr_pos, grid):
-    '''
-    Checks if the current position is within the bounds of the grid.
+def points_mask(points, grid):
+    """
+    Builds the bitmask of a set of lattice points.
 
     Arguments:
-    - curr_pos (tuple): The current position as a tuple (x, y).
+    - points (list): The points as tuples (x, y).
     - grid (list): The grid of the game.
 
     Returns:
-    - in_bounds (bool): True if the position is within bounds, False otherwise.
+    - mask (int): The bitmask of the points, or None if any point is
+      off the lattice and so can never be hit.
 
     Example:
-    >> grid = [[0, 'A', 0], ['B', 0, 'C']]
-    >> check((2, 0), grid)
-    True
-    >> check((3, 0), grid)
-    False
-    '''
-    # Calculate the total number of rows and columns based on the grid
-    rows = len(grid)*2
-    cols = len(grid[0])*2
+    >> grid = [['o', 'o'], ['o', 'o']]
+    >> points_mask([(0, 1), (1, 2)], grid)
+    2080
+    """
+    mask = 0
+    for point in points:
+        bit = point_bit(point, grid)
+        if bit is None:
+            return None
+        mask |= 1 << bit
+    return mask
 
-    # Check if the current position is within the calculated bounds
-    if curr_pos[1] > rows or curr_pos[0] > cols:
-        return False
 
-    if curr_pos[1] < 0 or curr_pos[0] < 0:
-        return False
+class BoardLayout:
+    """
+    Lookup tables for tracing lasers over a flat board of a given size.
 
-    return True
+    A beam state is numbered (y * width + x) * 4 + d, where (x, y) is a
+    point of the half-step lattice, width is the number of lattice
+    columns and d indexes DIRECTIONS. The point number of a state is
+    therefore state >> 2, the same numbering used by point_bit.
 
+    Attributes:
+    - rows (int): The number of grid rows.
+    - cols (int): The number of grid columns.
+    - width (int): The number of lattice columns, cols * 2 + 1.
+    - neighbours (array): For each state, the index of the cell the beam
+      is about to enter in a flat board, or -1 if it leaves the grid.
+    - bounce (array): For each state, the state after a reflection.
+    - steps (tuple): For each direction, the state offset of one step.
+    """
 
-def check_solution(passed_points, required_points):
-    '''
-    Check if the current solution contains all points required
+    def __init__(self, rows, cols):
+        """
+        Builds the lookup tables for a grid of the given size.
 
-    Arguments:
-   - passed_points (list): List of points that the lasers have passed through.
-   - required_points (list): List of points that the lasers need to intersect.
+        Arguments:
+        - rows (int): The number of grid rows.
+        - cols (int): The number of grid columns.
 
+        Example:
+        >> layout = BoardLayout(2, 2)
+        >> layout.neighbours[(2 * 5 + 1) * 4 + 0]
+        0
+        """
+        self.rows = rows
+        self.cols = cols
+        self.width = width = cols * 2 + 1
+        height = rows * 2 + 1
+        self.neighbours = array('i', [-1]) * (width * height * 4)
+        self.bounce = array('i', [0]) * (width * height * 4)
+        self.steps = tuple((vy * width + vx) * 4 for vx, vy in DIRECTIONS)
+
+        for y in range(height):
+            for x in range(width):
+                for d, (vx, vy) in enumerate(DIRECTIONS):
+                    state = (y * width + x) * 4 + d
+                    # Identify block of interest
+                    if x % 2 == 0:  # if x coordinate is even
+                        row_num = (y - 1) // 2
+                        col_num = x // 2 if vx == 1 else (x - 2) // 2
+                        self.bounce[state] = state ^ 2  # flip x only
+                    else:
+                        row_num = y // 2 if vy == 1 else (y - 2) // 2
+                        col_num = (x - 1) // 2
+                        self.bounce[state] = state ^ 1  # flip y only
+                    if 0 <= row_num < rows and 0 <= col_num < cols:
+                        self.neighbours[state] = row_num * cols + col_num
+
+    def laser_states(self, lasers):
+        """
+        Converts lasers to starting beam states.
 
-   Returns:
-   - solution_found (bool): True if the solution is found, False otherwise.
+        Arguments:
+        - lasers (list): The lasers in the game.
 
+        Returns:
+        - states (list): The beam state of each laser that starts on the
+          lattice with a diagonal direction; other lasers never hit
+          anything and are left out.
 
-   Example:
-   >> passed_points = [(0, 1), (1, 1), (2, 1), (2, 2)]
-   >> required_points = [(0, 1), (1, 1), (2, 2)]
-   >> check_solution(passed_points, required_points)
-   True
-   >> required_points = [(0, 1), (2, 2), (3, 3)]
-   >> check_solution(passed_points, required_points)
-   False
+        Example:
+        >> BoardLayout(2, 2).laser_states([Laser((1, 2), (1, -1))])
+        [46]
+        """
+        states = []
+        for laser in lasers:
+            x, y = laser.get_position()
+            direction = laser.get_direction()
+            if direction not in DIRECTIONS:
+                continue
+            if 0 <= x < self.width and 0 <= y <= self.rows * 2:
+                states.append((y * self.width + x) * 4 +
+                              DIRECTIONS.index(direction))
+        return states
+
+
+@lru_cache(maxsize=None)
+def board_layout(rows, cols):
+    """
+    Returns the shared BoardLayout for a grid size, building it once.
 
-    '''
-    for point in required_points:
-        if point not in passed_points:
-            return False
-    return True
+    Example:
+    >> board_layout(3, 3) is board_layout(3, 3)
+    True
+    """
+    return BoardLayout(rows, cols)
 
 
-def initialize_board(org_grid, available_slots, perm):
-    '''
+def encode_grid(grid):
+    """
+    Encodes a grid of block letters as a flat board of block codes.
+
+    Arguments:
+    - grid (list): The grid of the game.
+
+    Returns:
+    - board (bytearray): The block codes of the cells, row by row.
+
+    Example:
+    >> encode_grid([['o', 'A'], ['x', 'B']])
+    bytearray(b'\\x04\\x01\\x05\\x02')
+    """
+    return bytearray(BLOCK_CODES[block] for row in grid for block in row)
+
+
+def decode_grid(board, cols):
+    """
+    Decodes a flat board of block codes back into a grid of letters.
+
+    Arguments:
+    - board (bytearray): The block codes of the cells, row by row.
+    - cols (int): The number of grid columns.
+
+    Returns:
+    - grid (list): The grid of block letters.
+
+    Example:
+    >> decode_grid(bytearray(b'\\x04\\x01\\x05\\x02'), 2)
+    [['o', 'A'], ['x', 'B']]
+    """
+    letters = [BLOCK_LETTERS[code] for code in board]
+    return [letters[i:i + cols] for i in range(0, len(letters), cols)]
+
+
+def trace_board(board, layout, starts, target_mask=0, visited=None):
+    """
+    Shoots beams through a flat board and records every point they pass
+    through as a bit of one integer, numbered by point_bit.
+
+    The beams are traced iteratively from an explicit work-stack, so long
+    beams are not limited by Python's recursion depth, and a beam that
+    returns to a state it already had is cut off, so loops of reflect and
+    refract blocks always terminate.
+
+    When a target mask is given the trace stops as soon as the last
+    target is hit, so the result is only complete for the target bits.
+    A result missing any target bit means the board cannot succeed.
+
+    Arguments:
+    - board (bytearray): The block codes of the cells, row by row.
+    - layout (BoardLayout): The lookup tables for the board size.
+    - starts (list): The starting beam states of the lasers.
+    - target_mask (int): The bitmask of the points the lasers need to
+      intersect, or 0 to trace every beam to its end. Defaults to 0.
+    - visited (bytearray): Optional zeroed buffer with one byte per beam
+      state, marked for every state traced, so the caller can count the
+      laser steps. A defaultdict(int) works too, and then holds only the
+      states traced, so it is cheap to count and clear. A fresh buffer is
+      used by default.
+
+    Returns:
+    - hit_mask (int): The bitmask of the points the lasers pass through.
+
+    Example:
+    >> layout = board_layout(2, 2)
+    >> trace_board(encode_grid([['o', 'o'], ['o', 'o']]), layout, [46])
+    1 << 7 | 1 << 3
+    """
+    hit_mask = 0
+    neighbours = layout.neighbours
+    bounce = layout.bounce
+    steps = layout.steps
+    if visited is None:
+        visited = bytearray(len(neighbours))
+
+    # Work-stack of beam states still to trace, the first laser on top
+    beams = starts[::-1]
+    while beams:
+        state = beams.pop()
+        if visited[state]:
+            continue
+        visited[state] = 1
+        cell = neighbours[state]
+        if cell < 0:  # the beam leaves the grid
+            continue
+        block = board[cell]
+        if block <= REFRACT:
+            if block == OPAQUE:  # ray operation ends here
+                continue
+            beams.append(bounce[state])
+            if block == REFLECT:
+                continue
+        # Empty cell, or the part of a refracted beam that passes through
+        state += steps[state & 3]
+        bit = 1 << (state >> 2)
+        hit_mask |= bit
+        # Stop tracing as soon as the last target is hit
+        if bit & target_mask and hit_mask & target_mask == target_mask:
+            return hit_mask
+        beams.append(state)
+    return hit_mask
+
+
+def trace_lasers(grid, lasers, target_mask=0):
+    """
+    Shoots the lasers through the completed grid and records every point
+    they pass through as a bit of one integer, numbered by point_bit.
+    See trace_board for the tracing itself.
+
+    Arguments:
+    - grid (list): The grid of the game.
+    - lasers (list): The lasers in the game.
+    - target_mask (int): The bitmask of the points the lasers need to
+      intersect, or 0 to trace every beam to its end. Defaults to 0.
+
+    Returns:
+    - hit_mask (int): The bitmask of the points the lasers pass through.
+
+    Example:
+    >> grid = [['o', 'B', 'o'], ['A', 'x', 'o'], ['C', 'o', 'o']]
+    >> trace_lasers(grid, [Laser((4, 3), (-1, -1))]) == 1 << 17
+    True
+    """
+    layout = board_layout(len(grid), len(grid[0]))
+    return trace_board(encode_grid(grid), layout,
+                       layout.laser_states(lasers), target_mask)
+
+
+def shoot_laser(grid, lasers):
+    '''
+    Shoot laser through the completed grid with blocks, and
+    retain all the points that the laser passes through
+
+    Arguments:
+   - grid (list): The grid of the game.
+   - lasers (list): The lasers in the game.
+
+   Returns:
+   - passed_points (set): Set of points that the lasers pass through.
+
+   Example:
+   >> grid = [['o', 'B', 'o'], ['A', 'x', 'o'], ['C', 'o', 'o']]
+   >> shoot_laser(grid, [Laser((3, 4), (-1, -1))])
+   {(2, 3), (3, 2)}
+    '''
+    hit_mask = trace_lasers(grid, lasers)
+    width = len(grid[0]) * 2 + 1
+    passed_points = set()
+    bit = 0
+    while hit_mask:
+        if hit_mask & 1:
+            passed_points.add((bit % width, bit // width))
+        hit_mask >>= 1
+        bit += 1
+    return passed_points
+
+
+def check(curr_pos, grid):
+    '''
+    Checks if the current position is within the bounds of the grid.
+
+    Arguments:
+    - curr_pos (tuple): The current position as a tuple (x, y).
+    - grid (list): The grid of the game.
+
+    Returns:
+    - in_bounds (bool): True if the position is within bounds, False otherwise.
+
+    Example:
+    >> grid = [[0, 'A', 0], ['B', 0, 'C']]
+    >> check((2, 0), grid)
+    True
+    >> check((3, 0), grid)
+    False
+    '''
+    # Calculate the total number of rows and columns based on the grid
+    rows = len(grid)*2
+    cols = len(grid[0])*2
+
+    # Check if the current position is within the calculated bounds
+    if curr_pos[1] > rows or curr_pos[0] > cols:
+        return False
+
+    if curr_pos[1] < 0 or curr_pos[0] < 0:
+        return False
+
+    return True
+
+
+def check_solution(passed_points, required_points):
+    '''
+    Check if the current solution contains all points required
+
+    Arguments:
+   - passed_points (set): Set of points that the lasers have passed through.
+   - required_points (list): List of points that the lasers need to intersect.
+
+
+   Returns:
+   - solution_found (bool): True if the solution is found, False otherwise.
+
+
+   Example:
+   >> passed_points = {(0, 1), (1, 1), (2, 1), (2, 2)}
+   >> required_points = [(0, 1), (1, 1), (2, 2)]
+   >> check_solution(passed_points, required_points)
+   True
+   >> required_points = [(0, 1), (2, 2), (3, 3)]
+   >> check_solution(passed_points, required_points)
+   False
+
+    '''
+    return set(required_points).issubset(passed_points)
+
+
+# Block codes mapped to '1' for the blocks a beam cannot run through and
+# '0' for the cells it can, so int(board.translate(BLOCKED_DIGITS), 2) is
+# the bitmask of the blocks of a flat board
+BLOCKED_DIGITS = bytes.maketrans(bytes([REFLECT, OPAQUE, REFRACT, EMPTY,
+                                        NO_BLOCK]), b'11100')
+
+
+class BitboardLayout(BoardLayout):
+    """
+    Lookup tables for tracing lasers a whole straight run at a time, on
+    top of those of BoardLayout.
+
+    The blocks of a board are one integer with a bit per cell, the first
+    cell in the highest bit, and every beam state has the mask of the
+    cells its run would enter up to the edge of the grid. Their AND holds
+    the blocks in the way, and the first of them along the run is the
+    highest or the lowest bit, depending on the direction.
+
+    Attributes:
+    - cells (list): For each beam state, the mask of the cells its run
+      enters, starting with the cell ahead of it.
+    - runs (list): For each beam state, the mask of the points its run
+      passes through up to the edge of the grid, numbered by point_bit.
+      The points of a run that stops at state s are then
+      runs[start] & ~runs[s].
+    - entries (tuple): For each cell and direction, cell * 4 + d, the
+      state entering the cell from the point beside it and the state
+      entering it from the point above or below it.
+    """
+
+    def __init__(self, rows, cols):
+        """
+        Builds the lookup tables for a grid of the given size.
+
+        Arguments:
+        - rows (int): The number of grid rows.
+        - cols (int): The number of grid columns.
+
+        Example:
+        >> layout = BitboardLayout(2, 2)
+        >> bin(layout.cells[(2 * 5 + 1) * 4 + 3])
+        '0b1011'
+        """
+        super().__init__(rows, cols)
+        width = self.width
+        count = len(self.neighbours)
+        last = rows * cols - 1
+
+        self.cells = [0] * count
+        self.runs = [0] * count
+        side = array('i', [0]) * ((last + 1) * 4)
+        above = array('i', [0]) * ((last + 1) * 4)
+        # Walk each state after the one a step ahead of it, so its run
+        # is that of the next state plus one cell and one point
+        for state in sorted(range(count), key=lambda state: (
+                -(state >> 2) if self.steps[state & 3] > 0 else state)):
+            x, y = (state >> 2) % width, (state >> 2) // width
+            cell = self.neighbours[state]
+            if (x + y) % 2 == 0 or cell < 0:
+                continue  # beams never pass corners or centres
+            d = state & 3
+            following = state + self.steps[d]
+            self.cells[state] = self.cells[following] | 1 << (last - cell)
+            self.runs[state] = self.runs[following] | 1 << (following >> 2)
+            (side if x % 2 == 0 else above)[cell * 4 + d] = state
+        self.entries = (side, above)
+
+
+@lru_cache(maxsize=None)
+def bitboard_layout(rows, cols):
+    """
+    Returns the shared BitboardLayout for a grid size, building it once.
+
+    Example:
+    >> bitboard_layout(3, 3) is bitboard_layout(3, 3)
+    True
+    """
+    return BitboardLayout(rows, cols)
+
+
+def trace_bitboard(board, layout, starts, target_mask=0):
+    """
+    Shoots beams through a flat board and records every point they pass
+    through as a bit of one integer, like trace_board, but a whole
+    straight run at a time.
+
+    The blocks of the board become one bitmask, so finding the first
+    block in the way of a run, and the points it passes up to there, are
+    a few integer operations however long the run is. A beam that starts
+    a run it already had is cut off, so loops of reflect and refract
+    blocks always terminate.
+
+    When a target mask is given the trace stops as soon as the last
+    target is hit, so the result is only complete for the target bits.
+
+    Arguments:
+    - board (bytearray): The block codes of the cells, row by row.
+    - layout (BitboardLayout): The lookup tables for the board size.
+    - starts (list): The starting beam states of the lasers.
+    - target_mask (int): The bitmask of the points the lasers need to
+      intersect, or 0 to trace every beam to its end. Defaults to 0.
+
+    Returns:
+    - hit_mask (int): The bitmask of the points the lasers pass through.
+
+    Example:
+    >> layout = bitboard_layout(2, 2)
+    >> trace_bitboard(encode_grid([['o', 'o'], ['o', 'o']]), layout, [46])
+    1 << 7 | 1 << 3
+    """
+    blocks = int(board.translate(BLOCKED_DIGITS), 2)
+    cells, runs = layout.cells, layout.runs
+    side, above = layout.entries
+    bounce, steps = layout.bounce, layout.steps
+    cols = layout.cols
+    last = len(board) - 1
+    hit_mask = 0
+    seen = set()
+
+    # Work-stack of runs still to trace, the first laser on top
+    beams = starts[::-1]
+    while beams:
+        state = beams.pop()
+        if state in seen:
+            continue
+        seen.add(state)
+        blocked = cells[state] & blocks
+        if not blocked:  # the beam runs off the grid
+            hit_mask |= runs[state]
+        else:
+            d = state & 3
+            # The first block along the run. Runs heading down go to
+            # higher cells and runs heading up to lower ones, except for
+            # the two cells of a row that a run enters one after the
+            # other.
+            if d & 1:
+                cell = last + 1 - blocked.bit_length()
+                if (d == 1 and (cell + 1) % cols and
+                        blocked >> (last - cell - 1) & 1):
+                    cell += 1
+            else:
+                cell = last + 1 - (blocked & -blocked).bit_length()
+                if d == 2 and cell % cols and blocked >> (last - cell + 1) & 1:
+                    cell -= 1
+            entry = side[cell * 4 + d]
+            if entry != state and not runs[state] >> (entry >> 2) & 1:
+                entry = above[cell * 4 + d]
+            hit_mask |= runs[state] & ~runs[entry]
+            block = board[cell]
+            if block != OPAQUE:
+                beams.append(bounce[entry])
+                if block == REFRACT:
+                    entry += steps[d]
+                    hit_mask |= 1 << (entry >> 2)
+                    beams.append(entry)
+        # Stop tracing as soon as the last target is hit
+        if target_mask and hit_mask & target_mask == target_mask:
+            return hit_mask
+    return hit_mask
+
+
+def bitboard_check(grid, lasers, required_points):
+    '''
+    Checks whether the lasers pass through every required point of the
+    completed grid, tracing them with trace_bitboard. It gives the same
+    answer as check_solution(shoot_laser(grid, lasers), required_points).
+
+    Arguments:
+    - grid (list): The grid of the game.
+    - lasers (list): The lasers in the game.
+    - required_points (list): List of points that the lasers need to
+      intersect.
+
+    Returns:
+    - solution_found (bool): True if the solution is found, False otherwise.
+
+    Example:
+    >> grid = [['o', 'B', 'o'], ['A', 'x', 'o'], ['C', 'o', 'o']]
+    >> bitboard_check(grid, [Laser((3, 4), (-1, -1))], [(2, 3)])
+    True
+    '''
+    target_mask = points_mask(required_points, grid)
+    if target_mask is None:  # a target off the lattice is never hit
+        return False
+    layout = bitboard_layout(len(grid), len(grid[0]))
+    board = ''.join(map(''.join, grid)).encode().translate(LETTER_CODES)
+    hit_mask = trace_bitboard(board, layout, layout.laser_states(lasers),
+                              target_mask)
+    return hit_mask & target_mask == target_mask
+
+
+def initialize_board(org_grid, available_slots, perm):
+    '''
     Initializes the board with the given permutation of block placements.
+    The original grid is left untouched.
+
+
+   Arguments:
+   - org_grid (list): The original grid of the game.
+   - available_slots (list): List of available slots on the grid.
+   - perm (list): Permutation of block placements.
+
+
+   Returns:
+   - new_grid (list): A new grid with the block placements.
+
+
+   Example:
+   >> org_grid = [[0, 'A', 0], ['B', 0, 'C']]
+   >> available_slots = [(0, 0), (0, 2), (1, 1)]
+   >> perm = ['A', 'B', 'C']
+   >> new_grid = initialize_board(org_grid, available_slots, perm)
+   >> new_grid
+   [['A', 'A', 'B'], ['B', 'C', 'C']]
+   >> org_grid
+   [[0, 'A', 0], ['B', 0, 'C']]
+
+    '''
+    new_grid = [row[:] for row in org_grid]
+    for i, slot in enumerate(available_slots):
+        new_grid[slot[0]][slot[1]] = perm[i]
+    return new_grid
+
+
+class CandidateBoard:
+    """
+    A private flat board for evaluating block placements over a base
+    board that is never changed.
+
+    The scratch buffer is allocated once and every placement overwrites
+    all of the slot cells, so evaluating a candidate needs no copy of the
+    grid. Each worker or thread should use its own CandidateBoard; the
+    base board can be shared freely.
+
+    Attributes:
+    - base (bytes): The immutable flat board of block codes.
+    - slot_cells (tuple): The flat indices of the open slots.
+    - board (bytearray): The scratch buffer holding the last placement.
+    """
+
+    def __init__(self, base, slot_cells):
+        """
+        Initializes the CandidateBoard with the given base board.
+
+        Arguments:
+        - base (bytes): The flat board of block codes.
+        - slot_cells (list): The flat indices of the open slots.
+
+        Example:
+        >> candidate = CandidateBoard(encode_grid([['o', 'x']]), [0])
+        >> candidate.overlay([REFLECT])
+        bytearray(b'\\x01\\x05')
+        """
+        self.base = bytes(base)
+        self.slot_cells = tuple(slot_cells)
+        self.board = bytearray(self.base)
+
+    def overlay(self, codes):
+        """
+        Places blocks on the open slots of the scratch board.
+
+        Arguments:
+        - codes (list): The block code for each open slot, in order.
+
+        Returns:
+        - board (bytearray): The scratch board. It is reused by the next
+          call, so copy it to keep it.
+        """
+        board = self.board
+        for cell, code in zip(self.slot_cells, codes):
+            board[cell] = code
+        return board
+
+
+def placement_codes(available_slots, blocks):
+    """
+    Lists the block codes to permute over the open slots.
+
+    Arguments:
+    - available_slots (list): List of available slots on the board.
+    - blocks (Blocks): The available blocks in the game.
+
+    Returns:
+    - codes (list): One code per slot in sorted order, or None if the
+      blocks do not fit in the slots.
+
+    Example:
+    >> placement_codes([(0, 0), (0, 1), (1, 1)], Blocks(['A', 'C']))
+    [1, 3, 4]
+    """
+    empty = len(available_slots) - (blocks.get_reflect() +
+                                    blocks.get_opaque() +
+                                    blocks.get_refract())
+    if empty < 0:
+        return None
+    return ([REFLECT] * blocks.get_reflect() +
+            [OPAQUE] * blocks.get_opaque() +
+            [REFRACT] * blocks.get_refract() + [EMPTY] * empty)
+
+
+def beam_closure(game, limits=None):
+    """
+    Traces the beams over every possible filling of the open slots at
+    once: at an open slot a beam both passes through and, if there are
+    reflect or refract blocks to place, bounces, while fixed blocks act
+    as usual. Any real trace only follows edges of this closure.
+
+    Arguments:
+    - game (Game): The game instance.
+    - limits (dict): Optional (can_bounce, can_pass) pair per flat cell
+      index of an open slot, narrowing what the slot may do to a beam.
+
+    Returns:
+    - successors (dict): For each beam state reached, the list of the
+      states it can lead to. A successor on another point is a step
+      through the cell, one on the same point is a bounce.
+
+    Example:
+    >> len(beam_closure(parse_bff('tiny_5.bff')))
+    19
+    """
+    grid = game.get_grid()
+    layout = board_layout(len(grid), len(grid[0]))
+    board = encode_grid(grid)
+    blocks = game.get_blocks()
+    can_bounce = blocks.get_reflect() + blocks.get_refract() > 0
+    limits = limits or {}
+
+    successors = {}
+    beams = layout.laser_states(game.get_lasers())
+    while beams:
+        state = beams.pop()
+        if state in successors:
+            continue
+        successors[state] = following = []
+        cell = layout.neighbours[state]
+        if cell < 0:  # the beam leaves the grid
+            continue
+        block = board[cell]
+        if block == EMPTY:  # an open slot could hold anything
+            bounces, passes = limits.get(cell, (can_bounce, True))
+        else:
+            bounces = block == REFLECT or block == REFRACT
+            passes = block != REFLECT and block != OPAQUE
+        if bounces:
+            following.append(layout.bounce[state])
+        if passes:
+            following.append(state + layout.steps[state & 3])
+        beams.extend(following)
+    return successors
+
+
+def reachable_slots(game):
+    """
+    Works out which open slots any beam could possibly reach, whatever
+    blocks end up in the slots, see beam_closure. A slot the closure
+    never looks into cannot affect any beam.
+
+    Arguments:
+    - game (Game): The game instance.
+
+    Returns:
+    - reachable (list): The open slots a beam could reach, in the order
+      of find_all_placements.
+
+    Example:
+    >> reachable_slots(parse_bff('tiny_5.bff'))
+    [(0, 0), (1, 0), (1, 1), (1, 2), (2, 0), (2, 1), (2, 2)]
+    """
+    grid = game.get_grid()
+    cols = len(grid[0])
+    layout = board_layout(len(grid), cols)
+    reached = {layout.neighbours[state] for state in beam_closure(game)}
+    return [(row, col) for row, col in find_all_placements(grid)
+            if row * cols + col in reached]
+
+
+TargetAnalysis = namedtuple('TargetAnalysis',
+                            ['feasible', 'relevant', 'deflect', 'through'])
+
+
+def target_constraints(game):
+    """
+    Works out, backwards from the targets, which open slots can matter
+    and what some of them must hold in any solution.
+
+    A slot matters only if a beam of beam_closure that can still go on
+    to hit a target looks into it; the others are as good as unreachable.
+    A slot must deflect, holding a reflect or refract block, if some
+    target is out of reach of the closure once the slot can only let
+    beams through or stop them. It must let beams through, holding a
+    refract block or nothing, if some target is out of reach once the
+    slot can only bounce or stop beams. Both only ever rule out
+    placements that cannot be solutions.
+
+    Arguments:
+    - game (Game): The game instance.
+
+    Returns:
+    - analysis (TargetAnalysis): Whether the closure hits every target
+      at all, then the slots that matter, the slots that must deflect
+      and the slots that must let beams through, each in the order of
+      find_all_placements.
+
+    Example:
+    >> target_constraints(parse_bff('showstopper_4.bff'))
+    TargetAnalysis(feasible=True, relevant=[(0, 1), (1, 0), ...],
+                   deflect=[(0, 1), (1, 2), (2, 0)],
+                   through=[(1, 1), (2, 1)])
+    """
+    grid = game.get_grid()
+    cols = len(grid[0])
+    layout = board_layout(len(grid), cols)
+    reflect = game.get_blocks().get_reflect() > 0
+    slots = find_all_placements(grid)
+    targets = {point_bit(point, grid) for point in game.get_points()}
+
+    if None in targets:
+        return TargetAnalysis(False, [], [], [])
+    successors = beam_closure(game)
+    starts = layout.laser_states(game.get_lasers())
+
+    def hits_targets(cell, bounces, passes):
+        # Narrowing one slot only drops edges of the closure, so walk the
+        # closure again without them rather than tracing it anew
+        missing = set(targets)
+        seen = set(starts)
+        beams = list(seen)
+        while beams:
+            state = beams.pop()
+            limited = layout.neighbours[state] == cell
+            for following in successors[state]:
+                point = following >> 2
+                if point == state >> 2:
+                    if limited and not bounces:
+                        continue
+                elif limited and not passes:
+                    continue
+                elif point in missing:
+                    missing.discard(point)
+                    if not missing:
+                        return True
+                if following not in seen:
+                    seen.add(following)
+                    beams.append(following)
+        return False
+
+    # Find a shortest path of the closure to each target. A slot none of
+    # these paths bounces off or passes through cannot cut any target off.
+    parents = dict.fromkeys(starts)
+    hits = {}
+    beams = list(parents)
+    while beams:
+        reached = []
+        for state in beams:
+            for following in successors[state]:
+                point = following >> 2
+                if point in targets and point != state >> 2:
+                    hits.setdefault(point, state)
+                if following not in parents:
+                    parents[following] = state
+                    reached.append(following)
+        beams = reached
+    if len(hits) < len(targets):
+        return TargetAnalysis(False, [], [], [])
+    bounced = set()
+    passed = set()
+    for state in hits.values():
+        passed.add(layout.neighbours[state])  # the step onto the target
+        while parents[state] is not None:
+            parent = parents[state]
+            (bounced if state >> 2 == parent >> 2 else passed).add(
+                layout.neighbours[parent])
+            state = parent
+
+    # Walk backwards from the steps onto a target to every state that
+    # can lead to one
+    predecessors = {}
+    useful = set()
+    for state, states in successors.items():
+        for following in states:
+            predecessors.setdefault(following, []).append(state)
+            if following >> 2 in targets and following >> 2 != state >> 2:
+                useful.add(state)
+    beams = list(useful)
+    while beams:
+        for state in predecessors.get(beams.pop(), ()):
+            if state not in useful:
+                useful.add(state)
+                beams.append(state)
+    looked = {layout.neighbours[state] for state in useful}
+
+    relevant = []
+    deflect = []
+    through = []
+    for row, col in slots:
+        cell = row * cols + col
+        if cell not in looked:
+            continue
+        relevant.append((row, col))
+        if cell in bounced and not hits_targets(cell, False, True):
+            deflect.append((row, col))
+        if ((cell in passed or cell in bounced and not reflect) and
+                not hits_targets(cell, reflect, False)):
+            through.append((row, col))
+    return TargetAnalysis(True, relevant, deflect, through)
+
+
+def constraint_patterns(constrained, deflect, through, counts):
+    """
+    Lists the ways of filling constrained slots that meet their
+    constraints with the blocks available. A slot that must deflect
+    holds a reflect or a refract block, one that must let beams through
+    holds a refract block or nothing, and one that must do both holds a
+    refract block, so a pattern is fixed by which slots get the refract
+    blocks.
+
+    Arguments:
+    - constrained (list): The constrained slots.
+    - deflect (list): The slots that must deflect.
+    - through (list): The slots that must let beams through.
+    - counts (tuple): The numbers of reflect, opaque and refract blocks.
+
+    Returns:
+    - patterns (list): The block codes of the constrained slots, one list
+      per way of filling them. Those using fewer refract blocks come
+      first, leaving more blocks for the slots that are permuted.
+
+    Example:
+    >> constraint_patterns([(0, 0), (0, 1)], [(0, 0)], [(0, 1)],
+    ..                     (1, 0, 1))
+    [[1, 4], [3, 4], [1, 3]]
+    """
+    must = [i for i, slot in enumerate(constrained)
+            if slot in deflect and slot in through]
+    optional = [i for i in range(len(constrained)) if i not in must]
+    patterns = []
+    for extra in range(min(counts[2] - len(must), len(optional)) + 1):
+        for chosen in combinations(optional, extra):
+            refract = set(must).union(chosen)
+            pattern = [REFRACT if i in refract else
+                       REFLECT if slot in deflect else EMPTY
+                       for i, slot in enumerate(constrained)]
+            if pattern.count(REFLECT) <= counts[0]:
+                patterns.append(pattern)
+    return patterns
+
+
+class PlacementSpace:
+    """
+    The block placements worth testing for a game, numbered by rank.
+
+    Slots that cannot matter (see reachable_slots and target_constraints)
+    are not enumerated. Instead, for each way of splitting the blocks
+    between the slots that matter and the others, the slots that matter
+    are permuted and the blocks left over are parked in the others. When
+    every slot matters this is exactly the lexicographic order of
+    place_blocks.
+
+    Slots that target_constraints says must deflect or let beams through
+    are not permuted either: each way of filling them that meets the
+    constraints, deciding which of them hold the refract blocks, starts
+    its own splits with those slots filled in. Placements that break a
+    constraint are skipped as whole families without being traced, and
+    a game whose targets no beam can reach has no placements at all.
+
+    Attributes:
+    - base (bytes): The flat board of block codes of the parsed grid.
+    - cols (int): The number of grid columns.
+    - reach_cells (list): Flat indices of the slots that are permuted.
+    - spare_cells (list): Flat indices of the other slots, whose codes
+      are fixed within a group: first the constrained slots, then the
+      slots that cannot matter.
+    - idle_cells (list): Flat indices of the slots that cannot matter,
+      the tail of spare_cells. Any arrangement of the blocks parked in
+      them gives a placement with the same outcome.
+    - groups (list): One (count, reach_codes, spare_codes) tuple per
+      split of the blocks, where count is the number of placements.
+    - total (int): The number of placements in the space.
+    """
+
+    def __init__(self, game, prune=True, constrain=True):
+        """
+        Initializes the PlacementSpace for the given game.
+
+        Arguments:
+        - game (Game): The game instance.
+        - prune (bool): Whether to leave out slots no beam can reach.
+          Defaults to True.
+        - constrain (bool): Whether to also leave out slots no beam that
+          can still hit a target reaches, and to apply the constraints
+          of target_constraints, when pruning. Defaults to True.
+
+        Example:
+        >> space = PlacementSpace(parse_bff('dark_1.bff'))
+        >> space.total
+        4
+        """
+        grid = game.get_grid()
+        self.cols = cols = len(grid[0])
+        self.base = bytes(encode_grid(grid))
+        slots = find_all_placements(grid)
+        blocks = game.get_blocks()
+        counts = (blocks.get_reflect(), blocks.get_opaque(),
+                  blocks.get_refract())
+
+        # The codes of the constrained slots, one list per way of filling
+        # them in
+        constrained = []
+        patterns = [[]]
+        if prune and constrain:
+            analysis = target_constraints(game)
+            reach = analysis.relevant
+            constrained = [slot for slot in reach
+                           if slot in analysis.deflect or
+                           slot in analysis.through]
+            patterns = constraint_patterns(constrained, analysis.deflect,
+                                           analysis.through, counts)
+            if not analysis.feasible:
+                patterns = []
+        elif prune:
+            reach = reachable_slots(game)
+        else:
+            reach = slots
+        self.reach_cells = [row * cols + col for row, col in reach
+                            if (row, col) not in constrained]
+        self.idle_cells = [row * cols + col for row, col in slots
+                           if (row, col) not in reach]
+        self.spare_cells = [row * cols + col for row, col in constrained]
+        self.spare_cells += self.idle_cells
+        self.groups = []
+
+        n_reach = len(self.reach_cells)
+        n_spare = len(self.spare_cells) - len(constrained)
+        for pattern in patterns:
+            left = (counts[0] - pattern.count(REFLECT), counts[1],
+                    counts[2] - pattern.count(REFRACT))
+            # Splits with more blocks on the reachable slots come first
+            for a in range(left[0], -1, -1):
+                for b in range(left[1], -1, -1):
+                    for c in range(left[2], -1, -1):
+                        placed = a + b + c
+                        spare = sum(left) - placed
+                        if placed > n_reach or spare > n_spare:
+                            continue
+                        reach_codes = ([REFLECT] * a + [OPAQUE] * b +
+                                       [REFRACT] * c +
+                                       [EMPTY] * (n_reach - placed))
+                        spare_codes = pattern + ([REFLECT] * (left[0] - a) +
+                                                 [OPAQUE] * (left[1] - b) +
+                                                 [REFRACT] * (left[2] - c) +
+                                                 [EMPTY] * (n_spare - spare))
+                        self.groups.append((multinomial([a, b, c,
+                                                         n_reach - placed]),
+                                            reach_codes, spare_codes))
+        self.total = sum(group[0] for group in self.groups)
+
+    def boards(self, start=0):
+        """
+        Lazily generates the candidate boards from rank start onwards.
+
+        Arguments:
+        - start (int): Rank of the first placement. Defaults to 0.
+
+        Yields:
+        - board (bytearray): A scratch flat board holding one placement.
+          It is reused for the next placement, so copy it to keep it.
+        """
+        candidate = CandidateBoard(self.base, self.reach_cells)
+        for count, reach_codes, spare_codes in self.groups:
+            if start >= count:
+                start -= count
+                continue
+            for cell, code in zip(self.spare_cells, spare_codes):
+                candidate.board[cell] = code
+            for perm in multiset_permutations(reach_codes, start):
+                yield candidate.overlay(perm)
+            start = 0
+
+
+class CompiledGame:
+    """
+    A game specialised for testing block placements, built once so that
+    testing a candidate costs only the laser trace itself.
+
+    The board size, fixed blocks, laser starts and targets never change
+    after parsing, so the lookup tables, the flat base board, the beam
+    states of the lasers and the target mask are all worked out here
+    instead of on every candidate.
+
+    Attributes:
+    - rows (int): The number of grid rows.
+    - cols (int): The number of grid columns.
+    - layout (BoardLayout): The lookup tables for the board size.
+    - slots (list): The open slots, in the order of find_all_placements.
+    - candidate (CandidateBoard): The scratch board placements go on.
+    - starts (list): The starting beam states of the lasers.
+    - target_mask (int): The bitmask of the target points, or None if a
+      target is off the lattice and can never be hit.
+    """
+
+    def __init__(self, game):
+        """
+        Compiles the given game.
+
+        Arguments:
+        - game (Game): The game instance.
+
+        Example:
+        >> compiled = CompiledGame(parse_bff('showstopper_4.bff'))
+        >> compiled.slots[:2]
+        [(0, 1), (0, 2)]
+        """
+        grid = game.get_grid()
+        self.rows, self.cols = len(grid), len(grid[0])
+        self.layout = board_layout(self.rows, self.cols)
+        self.slots = find_all_placements(grid)
+        self.candidate = CandidateBoard(
+            encode_grid(grid),
+            [row * self.cols + col for row, col in self.slots])
+        self.starts = self.layout.laser_states(game.get_lasers())
+        self.target_mask = points_mask(game.get_points(), grid)
+
+    def solves(self, board):
+        """
+        Tests whether a complete flat board solves the game.
+
+        Arguments:
+        - board (bytearray): The block codes of the cells, row by row.
+
+        Returns:
+        - solved (bool): True if the lasers hit every target.
+        """
+        target_mask = self.target_mask
+        if target_mask is None:
+            return False
+        return trace_board(board, self.layout, self.starts,
+                           target_mask) & target_mask == target_mask
+
+    def evaluate(self, placement):
+        """
+        Tests whether a block placement solves the game.
+
+        Arguments:
+        - placement (list): The block letter for each open slot, in the
+          order of find_all_placements, as yielded by place_blocks.
+
+        Returns:
+        - solved (bool): True if the lasers hit every target.
+
+        Example:
+        >> compiled = compile_game(parse_bff('showstopper_4.bff'))
+        >> compiled.evaluate(['A', 'B', 'B', 'o', 'A', 'A', 'o', 'B'])
+        True
+        """
+        return self.solves(self.candidate.overlay(
+            [BLOCK_CODES[block] for block in placement]))
+
+    def grid(self, placement):
+        """
+        Builds the grid of block letters for a placement.
+
+        Arguments:
+        - placement (list): The block letter for each open slot.
+
+        Returns:
+        - grid (list): The grid with the blocks placed.
+        """
+        return decode_grid(self.candidate.overlay(
+            [BLOCK_CODES[block] for block in placement]), self.cols)
+
+
+def compile_game(game):
+    """
+    Compiles a game into a CompiledGame for testing block placements.
+
+    Example:
+    >> game = parse_bff('tiny_5.bff')
+    >> compiled = compile_game(game)
+    >> any(compiled.evaluate(perm)
+    ..     for perm in place_blocks(compiled.slots, game.get_blocks()))
+    True
+    """
+    return CompiledGame(game)
+
+
+class SolveMonitor(dict):
+    """
+    Counters, phase timers and progress reports for one solver run.
+
+    A SolveMonitor is a stats dictionary, so it can be handed to any
+    engine. Every engine fills in the 'candidates' counter with the
+    placements or partial boards it tested, the 'steps' counter with the
+    laser steps it traced, times its 'enumerate', 'trace' and 'check'
+    phases and reports progress. The engines that walk a PlacementSpace
+    also fill in the 'pruned' counter with the placements left out
+    because no beam reaches their slots. Engines that reuse traces count
+    only the steps they traced again, so their steps show the work saved.
+
+    Attributes:
+    - timers (dict): The seconds spent in each phase.
+    - progress (function): Optional callable given a progress dictionary
+      with the 'done' and 'total' candidates, the 'elapsed' seconds, the
+      'rate' in candidates per second and the 'eta' in seconds.
+    - interval (float): The least number of seconds between two progress
+      reports.
+    - count_steps (bool): Whether to count the laser steps.
+    """
+
+    def __init__(self, progress=None, interval=1.0, count_steps=True):
+        """
+        Initializes the SolveMonitor with zeroed counters.
+
+        Arguments:
+        - progress (function): Optional progress callback.
+        - interval (float): Seconds between progress reports. Defaults
+          to 1.0.
+        - count_steps (bool): Whether to count the laser steps. Defaults
+          to True.
+
+        Example:
+        >> monitor = SolveMonitor(progress=print)
+        >> solve('mad_7.bff', monitor=monitor)
+        >> monitor['candidates'], monitor.timers['trace']
+        (76432, 0.61)
+        """
+        super().__init__(candidates=0, pruned=0, steps=0)
+        self.timers = dict.fromkeys(('parse', 'enumerate', 'trace',
+                                     'check'), 0.0)
+        self.progress = progress
+        self.interval = interval
+        self.count_steps = count_steps
+        self.total = None
+        self.started = self.reported = self.lapped = time.perf_counter()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """
+        Adds the time spent in the with block to the timer of a phase.
+
+        Arguments:
+        - name (str): The name of the phase.
+
+        Example:
+        >> with monitor.phase('parse'):
+        ..     game = parse_bff('mad_7.bff')
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timers[name] = (self.timers.get(name, 0.0) +
+                                 time.perf_counter() - start)
+
+    def start(self, total):
+        """
+        Starts the progress clock of a search over total candidates.
+
+        Arguments:
+        - total (int): The number of candidates the search could test,
+          or None if it is not known up front.
+        """
+        self.total = total
+        self.started = self.reported = self.lapped = time.perf_counter()
+
+    def lap(self, name=None):
+        """
+        Adds the time since the last lap, or since the search started, to
+        the timer of a phase. An engine laps at the end of each phase of
+        its loop, so one clock reading closes one phase and opens the
+        next.
+
+        Arguments:
+        - name (str): The name of the phase that just ended, or None to
+          leave the time since the last lap out of every phase.
+
+        Example:
+        >> monitor.start(space.total)
+        >> for board in space.boards():
+        ..     monitor.lap('enumerate')
+        ..     hit_mask = trace_board(board, layout, starts)
+        ..     monitor.lap('trace')
+        """
+        now = time.perf_counter()
+        if name is not None:
+            self.timers[name] += now - self.lapped
+        self.lapped = now
+
+    def add_pruned(self, game, space):
+        """
+        Adds the placements a PlacementSpace leaves out to the 'pruned'
+        counter.
+
+        Arguments:
+        - game (Game): The game instance.
+        - space (PlacementSpace): The placements of the game.
+        """
+        self['pruned'] += (count_placements(find_all_placements(
+            game.get_grid()), game.get_blocks()) - space.total)
+
+    def update(self, done, force=False):
+        """
+        Calls the progress callback if the interval has passed since the
+        last report.
+
+        Arguments:
+        - done (int): The number of candidates tested so far.
+        - force (bool): Whether to report even within the interval.
+        """
+        if self.progress is None:
+            return
+        now = time.perf_counter()
+        if not force and now - self.reported < self.interval:
+            return
+        self.reported = now
+        elapsed = now - self.started
+        rate = done / elapsed if elapsed > 0 else 0.0
+        eta = None
+        if self.total is not None and rate > 0:
+            eta = max(self.total - done, 0) / rate
+        self.progress({'done': done, 'total': self.total,
+                       'elapsed': elapsed, 'rate': rate, 'eta': eta})
+
+    def report(self):
+        """
+        Describes the counters and phase timers in one line.
+
+        Returns:
+        - report (str): The counters and timers.
+
+        Example:
+        >> monitor.report()
+        'candidates=76432 pruned=0 steps=... parse=0.001s ...'
+        """
+        counters = ' '.join(f"{name}={value}" for name, value in
+                            self.items() if isinstance(value, int))
+        timers = ' '.join(f"{name}={seconds:.3f}s"
+                          for name, seconds in self.timers.items())
+        return f"{counters} {timers}"
+
+
+def format_progress(progress):
+    """
+    Formats a progress report of SolveMonitor as one line of text.
+
+    Arguments:
+    - progress (dict): The progress report.
+
+    Returns:
+    - line (str): The candidates tested, the rate and the ETA.
+
+    Example:
+    >> format_progress({'done': 500, 'total': 1000, 'elapsed': 1.0,
+    ..                  'rate': 500.0, 'eta': 1.0})
+    '500/1000 candidates (50.0%), 500/s, ETA 1s'
+    """
+    line = f"{progress['done']}"
+    if progress['total']:
+        line += (f"/{progress['total']} candidates "
+                 f"({progress['done'] / progress['total']:.1%})")
+    else:
+        line += " candidates"
+    line += f", {progress['rate']:.0f}/s"
+    if progress['eta'] is not None:
+        line += f", ETA {progress['eta']:.0f}s"
+    return line
+
+
+def search_placements(game, start=0, stop=None, should_stop=None,
+                      stats=None, space=None, bitboard=False):
+    """
+    Tests the placements of a PlacementSpace in rank order, from rank
+    start up to but not including rank stop, with a full laser trace each.
+
+    Arguments:
+    - game (Game): The game instance to solve.
+    - start (int): Rank of the first placement to test. Defaults to 0.
+    - stop (int): Rank to stop before, or None to run to the end.
+    - should_stop (function): Optional callable polled every few hundred
+      candidates; the search gives up when it returns True.
+    - stats (dict): Optional dictionary whose 'candidates' entry is
+      increased by the number of placements tested. A SolveMonitor also
+      gets the other counters, the phase timers and progress reports.
+    - space (PlacementSpace): The placements of the game, if already
+      built. Defaults to building them.
+    - bitboard (bool): Whether to trace with trace_bitboard instead of
+      trace_board. Defaults to False.
+
+    Returns:
+    - result (tuple): The rank and solved grid of the first solution in
+      the range, or None if the range holds no solution.
+
+    Example:
+    >> search_placements(parse_bff('mad_1.bff'))
+    (93, [['o', 'o', 'C', 'o'], ['o', 'o', 'o', 'A'], ...])
+    """
+    # Work on flat boards of block codes with precomputed lookup tables,
+    # leaving out slots that cannot matter
+    compiled = compile_game(game)
+    target_mask = compiled.target_mask
+    if target_mask is None:  # a target off the lattice is never hit
+        return None
+    layout, starts = compiled.layout, compiled.starts
+    trace = trace_board
+    if bitboard:
+        layout = bitboard_layout(compiled.rows, compiled.cols)
+        trace = trace_bitboard
+    if space is None:
+        space = PlacementSpace(game)
+    if isinstance(stats, SolveMonitor):
+        if start == 0:
+            stats.add_pruned(game, space)
+        return monitored_search(compiled, space, start, stop, should_stop,
+                                stats, bitboard)
+
+    # Test the placements one at a time as they are generated, so the
+    # search stops at the first solution without building the rest
+    rank = start
+    result = None
+    for board in space.boards(start):
+        if rank == stop:
+            break
+        if should_stop is not None and rank & 255 == 0 and should_stop():
+            break
+        hit_mask = trace(board, layout, starts, target_mask)
+        rank += 1
+
+        # Check if the current solution matches the target points
+        if hit_mask & target_mask == target_mask:
+            result = rank - 1, decode_grid(board, compiled.cols)
+            break
+    if stats is not None:
+        stats['candidates'] = stats.get('candidates', 0) + rank - start
+    return result
+
+
+def monitored_search(compiled, space, start, stop, should_stop, monitor,
+                     bitboard=False):
+    """
+    The loop of search_placements with every phase timed, the laser steps
+    counted and progress reported to a SolveMonitor. It is kept apart so
+    the timers cost nothing when nobody is watching.
+
+    Arguments:
+    - compiled (CompiledGame): The game to solve.
+    - space (PlacementSpace): The placements to test.
+    - start (int): Rank of the first placement to test.
+    - stop (int): Rank to stop before, or None to run to the end.
+    - should_stop (function): Optional callable polled every few hundred
+      candidates; the search gives up when it returns True.
+    - monitor (SolveMonitor): The monitor to fill in.
+    - bitboard (bool): Whether to trace with trace_bitboard. Its laser
+      steps are then counted with an untimed trace_board, so they are
+      the same as for the other engines.
+
+    Returns:
+    - result (tuple): The rank and solved grid of the first solution in
+      the range, or None if the range holds no solution.
+    """
+    layout, starts = compiled.layout, compiled.starts
+    trace = trace_board
+    if bitboard:
+        layout = bitboard_layout(compiled.rows, compiled.cols)
+        trace = trace_bitboard
+    target_mask = compiled.target_mask
+    end = space.total if stop is None else min(stop, space.total)
+    monitor.start(max(end - start, 0))
+    timers = monitor.timers
+    clock = time.perf_counter
+    # Only the states traced are marked, so counting and clearing them
+    # costs as much as the steps, not as much as the whole board
+    visited = defaultdict(int) if monitor.count_steps else None
+
+    rank = start
+    result = None
+    steps = 0
+    boards = space.boards(start)
+    while rank != stop:
+        before = clock()
+        board = next(boards, None)
+        traced = clock()
+        timers['enumerate'] += traced - before
+        if board is None:
+            break
+        if rank & 255 == 0:
+            if should_stop is not None and should_stop():
+                break
+            monitor.update(rank - start)
+        if bitboard:
+            hit_mask = trace(board, layout, starts, target_mask)
+        else:
+            hit_mask = trace(board, layout, starts, target_mask, visited)
+        checked = clock()
+        timers['trace'] += checked - traced
+        rank += 1
+        solved = hit_mask & target_mask == target_mask
+        timers['check'] += clock() - checked
+        if visited is not None:
+            if bitboard:
+                trace_board(board, compiled.layout, starts, target_mask,
+                            visited)
+            steps += len(visited)
+            visited.clear()
+        if solved:
+            result = rank - 1, decode_grid(board, compiled.cols)
+            break
+    monitor['candidates'] += rank - start
+    monitor['steps'] += steps
+    monitor.update(rank - start, force=True)
+    return result
+
+
+def brute_force_search(game, stats=None):
+    """
+    Searches for a solution by testing every block placement permutation
+    in turn with a full laser trace, leaving out slots no beam can reach.
+
+    Arguments:
+    - game (Game): The game instance to solve.
+    - stats (dict): Optional dictionary whose 'candidates' entry is
+      increased by the number of placements tested.
+
+    Returns:
+    - solution (list): The solved grid, or None if there is no solution.
+
+    Example:
+    >> brute_force_search(parse_bff('showstopper_4.bff'))
+    [['B', 'A', 'B'], ['B', 'o', 'A'], ['A', 'o', 'B']]
+    """
+    result = search_placements(game, stats=stats)
+    return None if result is None else result[1]
+
+
+def bitboard_search(game, stats=None):
+    """
+    Searches for a solution like brute_force_search, but traces each
+    placement a straight run at a time with trace_bitboard. It tests the
+    same placements in the same order and is faster on large boards with
+    few blocks, where beams run far between blocks.
+
+    Arguments:
+    - game (Game): The game instance to solve.
+    - stats (dict): Optional dictionary whose 'candidates' entry is
+      increased by the number of placements tested.
+
+    Returns:
+    - solution (list): The solved grid, or None if there is no solution.
+
+    Example:
+    >> bitboard_search(parse_bff('showstopper_4.bff'))
+    [['B', 'A', 'B'], ['B', 'o', 'A'], ['A', 'o', 'B']]
+    """
+    result = search_placements(game, stats=stats, bitboard=True)
+    return None if result is None else result[1]
+
+
+def solution_boards(game, space=None, stats=None, bitboard=False):
+    """
+    Lazily generates the boards of a PlacementSpace that solve the game,
+    in rank order, testing each one with trace_board.
+
+    Arguments:
+    - game (Game): The game instance to solve.
+    - space (PlacementSpace): The placements of the game, if already
+      built. Defaults to building them.
+    - stats (dict): Optional dictionary whose 'candidates' entry is
+      increased by the number of placements tested, also when the caller
+      stops early. A SolveMonitor also gets the other counters, the phase
+      timers and progress reports; the time the caller spends between
+      two solutions is left out of the timers.
+    - bitboard (bool): Whether to test with trace_bitboard instead of
+      trace_board. Defaults to False.
+
+    Yields:
+    - board (bytearray): The scratch flat board holding a solution. It is
+      reused for the next placement, so copy it to keep it.
+
+    Example:
+    >> len(list(solution_boards(parse_bff('tiny_5.bff'))))
+    1
+    """
+    compiled = compile_game(game)
+    target_mask = compiled.target_mask
+    if target_mask is None:  # a target off the lattice is never hit
+        return
+    layout, starts = compiled.layout, compiled.starts
+    trace = trace_board
+    if bitboard:
+        layout = bitboard_layout(compiled.rows, compiled.cols)
+        trace = trace_bitboard
+    if space is None:
+        space = PlacementSpace(game)
+    monitor = stats if isinstance(stats, SolveMonitor) else None
+    visited = None
+    if monitor is not None:
+        monitor.add_pruned(game, space)
+        monitor.start(space.total)
+        if monitor.count_steps:
+            visited = defaultdict(int)
+
+    tested = 0
+    steps = 0
+    try:
+        for board in space.boards():
+            if monitor is not None:
+                monitor.lap('enumerate')
+                if tested & 255 == 0:
+                    monitor.update(tested)
+            tested += 1
+            hit_mask = trace(board, layout, starts, target_mask)
+            if monitor is not None:
+                monitor.lap('trace')
+            solved = hit_mask & target_mask == target_mask
+            if monitor is not None:
+                monitor.lap('check')
+                if visited is not None:
+                    # Counted with an untimed trace_board, so the steps
+                    # are the same for both tracers
+                    trace_board(board, compiled.layout, starts, target_mask,
+                                visited)
+                    steps += len(visited)
+                    visited.clear()
+                    monitor.lap()
+            if solved:
+                yield board
+                if monitor is not None:
+                    monitor.lap()
+    finally:
+        if stats is not None:
+            stats['candidates'] = stats.get('candidates', 0) + tested
+        if monitor is not None:
+            monitor['steps'] += steps
+            monitor.update(tested, force=True)
+
+
+def all_solutions(game, stats=None, bitboard=False):
+    """
+    Lazily generates every block placement that solves the game.
+
+    Placements that differ only in the slots no beam that matters can
+    reach are tested once, and every arrangement of the blocks parked in
+    those slots is then yielded, so each distinct solution comes out
+    exactly once.
+
+    Arguments:
+    - game (Game): The game instance to solve.
+    - stats (dict): Optional counters, see solution_boards.
+    - bitboard (bool): Whether to test with trace_bitboard, see
+      solution_boards.
+
+    Yields:
+    - grid (list): A solved grid.
+
+    Example:
+    >> for grid in all_solutions(parse_bff('mad_1.bff')):
+    ..     print(grid)
+    """
+    space = PlacementSpace(game)
+    idle_cells = space.idle_cells
+    for board in solution_boards(game, space, stats, bitboard):
+        board = bytearray(board)
+        for perm in multiset_permutations([board[cell]
+                                           for cell in idle_cells]):
+            for cell, code in zip(idle_cells, perm):
+                board[cell] = code
+            yield decode_grid(board, space.cols)
+
+
+def count_solutions(game, at_least=None, stats=None, bitboard=False):
+    """
+    Counts the block placements that solve the game without building
+    their grids. A solution found among the placements that are tested
+    counts once for every arrangement of the blocks parked in the slots
+    that cannot matter.
+
+    Arguments:
+    - game (Game): The game instance to solve.
+    - at_least (int): Optional number of solutions to stop at, for
+      questions like "does this level have exactly one solution?".
+    - stats (dict): Optional counters, see solution_boards.
+    - bitboard (bool): Whether to test with trace_bitboard, see
+      solution_boards.
+
+    Returns:
+    - count (int): The number of solutions, or at_least if there are at
+      least that many.
+
+    Example:
+    >> count_solutions(parse_bff('tiny_5.bff'))
+    1
+    >> count_solutions(parse_bff('mad_1.bff'), at_least=2) == 1
+    True
+    """
+    space = PlacementSpace(game)
+    idle_cells = space.idle_cells
+    count = 0
+    boards = solution_boards(game, space, stats, bitboard)
+    for board in boards:
+        codes = bytes(board[cell] for cell in idle_cells)
+        count += multinomial([codes.count(code) for code in set(codes)])
+        if at_least is not None and count >= at_least:
+            boards.close()
+            return at_least
+    return count
+
+
+# State of a worker process of parallel_search or batch_solve, set once
+# by init_worker or init_batch_worker
+worker_state = {}
+
+
+def init_worker(game, best_rank, space):
+    """
+    Stores the game, the shared best solution rank and the placement
+    space in a worker process of parallel_search, so they are sent to
+    each worker only once and the space is not built again there.
+
+    Arguments:
+    - game (Game): The game instance to solve.
+    - best_rank (multiprocessing.Value): The lowest rank of a solution
+      found by any worker so far.
+    - space (PlacementSpace): The placement space of the game.
+    """
+    worker_state['game'] = game
+    worker_state['best_rank'] = best_rank
+    worker_state['space'] = space
+
+
+def search_chunk(start, stop, count_steps=None):
+    """
+    Searches one rank range of the placement space in a worker process.
+    The worker gives up once another worker has found a solution at a
+    lower rank, since this range can then no longer win.
+
+    Arguments:
+    - start (int): Rank of the first placement to test.
+    - stop (int): Rank to stop before.
+    - count_steps (bool): Whether to count the laser steps, or None to
+      only count the placements tested and leave the phases untimed.
+      Defaults to None.
+
+    Returns:
+    - result (tuple): The rank and solved grid of the first solution in
+      the range, or None.
+    - counters (dict): The 'candidates' counter, and with count_steps
+      set also the 'pruned' and 'steps' counters.
+    - timers (dict): The seconds spent in each phase, or an empty
+      dictionary when count_steps is None.
+    """
+    best_rank = worker_state['best_rank']
+    stats = {} if count_steps is None else \
+        SolveMonitor(count_steps=count_steps)
+    result = search_placements(worker_state['game'], start, stop,
+                               lambda: best_rank.value < start, stats,
+                               worker_state['space'])
+    if result is not None:
+        with best_rank.get_lock():
+            best_rank.value = min(best_rank.value, result[0])
+    return result, dict(stats), getattr(stats, 'timers', {})
+
+
+def parallel_search(game, workers=None, chunk_size=None, stats=None):
+    """
+    Searches for a solution by splitting the PlacementSpace into rank
+    ranges and testing them on a pool of worker processes.
+
+    Chunks are handed out in rank order and the lowest-ranked solution
+    wins, so the result is the same as brute_force_search. Once a
+    solution is found, chunks after it are cancelled and running workers
+    give up on them.
+
+    Arguments:
+    - game (Game): The game instance to solve.
+    - workers (int): The number of worker processes, or None for one per
+      CPU core.
+    - chunk_size (int): Placements per chunk, or None to pick one from
+      the size of the placement space.
+    - stats (dict): Optional dictionary whose 'candidates' entry is
+      increased by the number of placements tested by all workers. A
+      SolveMonitor also gets the other counters of the workers, their
+      phase timers added up, so they can exceed the time taken, and a
+      progress report after each chunk.
+
+    Returns:
+    - solution (list): The solved grid, or None if there is no solution.
+
+    Example:
+    >> parallel_search(parse_bff('mad_7.bff'), workers=4)
+    """
+    workers = workers or os.cpu_count() or 1
+    space = PlacementSpace(game)
+    total = space.total
+    if chunk_size is None:
+        chunk_size = min(max(total // (workers * 16), 256), 65536)
+    monitor = stats if isinstance(stats, SolveMonitor) else None
+    count_steps = None
+    if monitor is not None:
+        count_steps = monitor.count_steps
+        monitor.start(total)
+
+    best_rank = multiprocessing.Value('q', total)
+    best = None
+    pending = {}
+    next_start = 0
+    tested = 0
+    with ProcessPoolExecutor(workers, initializer=init_worker,
+                             initargs=(game, best_rank, space)) as pool:
+        while True:
+            # Keep every worker busy with a couple of chunks in hand
+            while (len(pending) < workers * 2 and next_start < total and
+                   (best is None or next_start < best[0])):
+                stop = min(next_start + chunk_size, total)
+                pending[pool.submit(search_chunk, next_start, stop,
+                                    count_steps)] = next_start
+                next_start = stop
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                del pending[future]
+                result, counters, timers = future.result()
+                if stats is not None:
+                    for name, value in counters.items():
+                        stats[name] = stats.get(name, 0) + value
+                if monitor is not None:
+                    for name, seconds in timers.items():
+                        monitor.timers[name] += seconds
+                    tested += counters['candidates']
+                    monitor.update(tested)
+                if result is not None and (best is None or
+                                           result[0] < best[0]):
+                    best = result
+            if best is not None:
+                # Chunks after the best solution can no longer win
+                for future, start in list(pending.items()):
+                    if start > best[0] and future.cancel():
+                        del pending[future]
+    if monitor is not None:
+        monitor.update(tested, force=True)
+    return None if best is None else best[1]
+
+
+class IncrementalTracer:
+    """
+    Traces lasers over a board that changes a few cells at a time,
+    re-tracing only the beam segments that looked into a changed cell.
+
+    A segment is the straight run of a beam from one state until it
+    leaves the grid, is blocked, or bounces. What a segment does depends
+    only on the cells it looked into, so segments are cached by their
+    first state together with those cells, and each cell keeps the set of
+    segments that read it. Changing a cell drops just those segments.
+
+    Attributes:
+    - board (bytearray): The current flat board of block codes.
+    - segments (dict): Cached segments, mapping the first state to a
+      (hit_mask, cells, next_states) tuple.
+    - traced (int): The number of segments traced so far.
+    - reused (int): The number of cached segments reused so far.
+    - steps (int): The number of laser steps traced so far.
+    """
+
+    def __init__(self, board, layout, starts):
+        """
+        Initializes the IncrementalTracer over a copy of the given board.
+
+        Arguments:
+        - board (bytearray): The flat board of block codes.
+        - layout (BoardLayout): The lookup tables for the board size.
+        - starts (list): The starting beam states of the lasers.
+
+        Example:
+        >> tracer = IncrementalTracer(board, layout, starts)
+        >> tracer.set_cell(4, REFLECT)
+        >> tracer.hit_mask() == trace_board(tracer.board, layout, starts)
+        True
+        """
+        self.board = bytearray(board)
+        self.layout = layout
+        self.starts = list(starts)
+        self.segments = {}
+        self.readers = [set() for _ in range(len(board))]
+        self.traced = 0
+        self.reused = 0
+        self.steps = 0
+
+    def set_cell(self, cell, code):
+        """
+        Changes one cell of the board, dropping the cached segments that
+        looked into it.
+
+        Arguments:
+        - cell (int): The flat index of the cell.
+        - code (int): The new block code.
+        """
+        if self.board[cell] == code:
+            return
+        self.board[cell] = code
+        for state in self.readers[cell]:
+            segment = self.segments.pop(state, None)
+            if segment is None:
+                continue
+            for other in segment[1]:
+                if other != cell:
+                    self.readers[other].discard(state)
+        self.readers[cell].clear()
+
+    def trace_segment(self, state):
+        """
+        Traces and caches the segment that starts at a beam state.
+
+        Arguments:
+        - state (int): The first state of the segment.
+
+        Returns:
+        - segment (tuple): The (hit_mask, cells, next_states) tuple.
+        """
+        board = self.board
+        neighbours = self.layout.neighbours
+        steps = self.layout.steps
+        first = state
+        hit_mask = 0
+        cells = []
+        next_states = ()
+        while True:
+            cell = neighbours[state]
+            if cell < 0:  # the beam leaves the grid
+                break
+            cells.append(cell)
+            block = board[cell]
+            if block == OPAQUE:
+                break
+            if block == REFLECT:
+                next_states = (self.layout.bounce[state],)
+                break
+            bounce = self.layout.bounce[state]
+            state += steps[state & 3]
+            hit_mask |= 1 << (state >> 2)
+            if block == REFRACT:
+                next_states = (state, bounce)
+                break
+        segment = (hit_mask, cells, next_states)
+        self.segments[first] = segment
+        for cell in cells:
+            self.readers[cell].add(first)
+        self.traced += 1
+        self.steps += len(cells) + (cell < 0)
+        return segment
+
+    def hit_mask(self, target_mask=0):
+        """
+        Collects the points the lasers pass through on the current board,
+        reusing every cached segment that is still valid.
+
+        Arguments:
+        - target_mask (int): The bitmask of the points the lasers need to
+          intersect, or 0 to collect every point. Defaults to 0.
+
+        Returns:
+        - hit_mask (int): The bitmask of the points the lasers pass
+          through, complete at least for the target bits.
+        """
+        segments = self.segments
+        hit_mask = 0
+        traced = self.traced
+        seen = set()
+        pending = self.starts[::-1]
+        while pending:
+            state = pending.pop()
+            if state in seen:
+                continue
+            seen.add(state)
+            segment = segments.get(state)
+            if segment is None:
+                segment = self.trace_segment(state)
+            bits, _, next_states = segment
+            if bits & target_mask:
+                hit_mask |= bits
+                if hit_mask & target_mask == target_mask:
+                    break
+            else:
+                hit_mask |= bits
+            pending.extend(next_states)
+        self.reused += len(seen) - (self.traced - traced)
+        return hit_mask
+
+
+def incremental_search(game, stats=None, prefix=1024):
+    """
+    Searches for a solution by walking the placements in an order that
+    changes few slots per step and re-tracing only the beam segments
+    the changed slots affect.
+
+    A minimal-change order costs less per placement than the rank order
+    of brute_force_search, but may come to a solution the rank order
+    finds early only much later. So each split of the blocks first walks
+    prefix placements in rank order, feeding the tracer only the slots
+    that changed, and only then the rest in minimal-change order (see
+    ranked_minimal_change_permutations). This costs a little when the
+    solution is deep in the space and saves the whole walk when it is
+    near the start.
+
+    Arguments:
+    - game (Game): The game instance to solve.
+    - stats (dict): Optional dictionary whose 'candidates' entry is
+      increased by the number of placements tested. A SolveMonitor also
+      gets the other counters, with the steps of the segments traced
+      again, the phase timers and progress reports.
+    - prefix (int): The number of placements of each split to walk in
+      rank order first. Defaults to 1024.
+
+    Returns:
+    - solution (list): The solved grid, or None if there is no solution.
+
+    Example:
+    >> incremental_search(parse_bff('mad_7.bff'))
+    """
+    grid = game.get_grid()
+    target_mask = points_mask(game.get_points(), grid)
+    if target_mask is None:
+        return None
+    layout = board_layout(len(grid), len(grid[0]))
+    space = PlacementSpace(game)
+    tracer = IncrementalTracer(space.base, layout,
+                               layout.laser_states(game.get_lasers()))
+    reach_cells = space.reach_cells
+    monitor = stats if isinstance(stats, SolveMonitor) else None
+    if monitor is not None:
+        monitor.add_pruned(game, space)
+        monitor.start(space.total)
+
+    candidates = 0
+    solution = None
+    for count, reach_codes, spare_codes in space.groups:
+        for cell, code in zip(space.spare_cells, spare_codes):
+            tracer.set_cell(cell, code)
+        for perm, changed in ranked_minimal_change_permutations(
+                reach_codes, prefix):
+            for i in changed:
+                tracer.set_cell(reach_cells[i], perm[i])
+            if monitor is not None:
+                monitor.lap('enumerate')
+                if candidates & 255 == 0:
+                    monitor.update(candidates)
+            candidates += 1
+            hit_mask = tracer.hit_mask(target_mask)
+            if monitor is not None:
+                monitor.lap('trace')
+            solved = hit_mask & target_mask == target_mask
+            if monitor is not None:
+                monitor.lap('check')
+            if solved:
+                solution = decode_grid(tracer.board, space.cols)
+                break
+        if solution is not None:
+            break
+    if stats is not None:
+        stats['candidates'] = stats.get('candidates', 0) + candidates
+    if monitor is not None:
+        if monitor.count_steps:
+            monitor['steps'] += tracer.steps
+        monitor.update(candidates, force=True)
+    return solution
+
+
+def trace_path(board, layout, start, variable, visited=None):
+    """
+    Traces a single laser over a flat board, also recording which
+    variable cells it looked into and what it found there.
+
+    The trace is deterministic, so the cells it looks into depend only on
+    what it found in the cells before, and the recorded path pins down the
+    whole trace.
+
+    Arguments:
+    - board (bytearray): The block codes of the cells, row by row.
+    - layout (BoardLayout): The lookup tables for the board size.
+    - start (int): The starting beam state of the laser.
+    - variable (bytearray): 1 for each cell whose contents can change.
+    - visited (set): Optional empty set that gets every beam state
+      traced, so the caller can count the laser steps. A fresh set is
+      used by default.
+
+    Returns:
+    - hit_mask (int): The bitmask of the points the laser passes through.
+    - path (list): A (cell, code) tuple for each variable cell the laser
+      looked into, in the order it first looked into them.
+    """
+    hit_mask = 0
+    neighbours = layout.neighbours
+    bounce = layout.bounce
+    steps = layout.steps
+    if visited is None:
+        visited = set()
+    looked = set()
+    path = []
+    beams = [start]
+    while beams:
+        state = beams.pop()
+        if state in visited:
+            continue
+        visited.add(state)
+        cell = neighbours[state]
+        if cell < 0:  # the beam leaves the grid
+            continue
+        block = board[cell]
+        if variable[cell] and cell not in looked:
+            looked.add(cell)
+            path.append((cell, block))
+        if block <= REFRACT:
+            if block == OPAQUE:  # ray operation ends here
+                continue
+            beams.append(bounce[state])
+            if block == REFLECT:
+                continue
+        state += steps[state & 3]
+        hit_mask |= 1 << (state >> 2)
+        beams.append(state)
+    return hit_mask, path
+
+
+class BeamCache:
+    """
+    A bounded least-recently-used cache of laser traces, keyed on the
+    laser start and the contents of the changeable cells its beam looked
+    into.
+
+    For each laser start the cache is a decision tree: every inner node
+    names the next slot cell the beam looks into and branches on what is
+    there, and every leaf holds the points the beam hits. A lookup reads
+    only the slot cells on the beam's actual path, so candidates that
+    differ elsewhere share the entry. Cells outside the slots never
+    change and are not part of the key.
+
+    Attributes:
+    - maxsize (int): The most leaves kept before evicting.
+    - hits (int): Lookups answered from the cache.
+    - misses (int): Lookups that had to trace the laser.
+    - evictions (int): Leaves dropped to stay within maxsize.
+    - steps (int): The laser steps traced on misses.
+    """
+
+    def __init__(self, layout, slot_cells, maxsize=65536):
+        """
+        Initializes an empty BeamCache for boards of one layout.
+
+        Arguments:
+        - layout (BoardLayout): The lookup tables for the board size.
+        - slot_cells (list): The flat indices of the cells that change
+          between candidates.
+        - maxsize (int): The most leaves kept. Defaults to 65536.
+
+        Example:
+        >> cache = BeamCache(layout, [0, 3, 7], maxsize=1024)
+        >> cache.hit_mask(board, starts) == trace_board(board, layout,
+        ..                                              starts)
+        True
+        """
+        self.layout = layout
+        self.variable = bytearray(layout.rows * layout.cols)
+        for cell in slot_cells:
+            self.variable[cell] = 1
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.steps = 0
+        # Inner nodes are [cell, children, parent, code in parent] and
+        # leaves are [-1, hit_mask, parent, code in parent, key]. A root's
+        # parent is None and its code in parent is the laser start.
+        self.roots = {}
+        self.leaves = OrderedDict()
+
+    def info(self):
+        """
+        Reports the cache counters.
+
+        Returns:
+        - info (dict): The hits, misses, evictions, current size and
+          maxsize of the cache.
+
+        Example:
+        >> cache.info()
+        {'hits': 950, 'misses': 50, 'evictions': 0, 'size': 50, ...}
+        """
+        return {'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions, 'size': len(self.leaves),
+                'maxsize': self.maxsize}
+
+    def lookup(self, board, start):
+        """
+        Finds the points one laser hits on a board, tracing it only if no
+        cached trace matches.
+
+        Arguments:
+        - board (bytearray): The block codes of the cells, row by row.
+        - start (int): The starting beam state of the laser.
+
+        Returns:
+        - hit_mask (int): The bitmask of the points the laser hits.
+        """
+        node = self.roots.get(start)
+        while node is not None and node[0] >= 0:
+            node = node[1].get(board[node[0]])
+        if node is not None:
+            self.hits += 1
+            self.leaves.move_to_end(node[4])
+            return node[1]
+
+        self.misses += 1
+        visited = set()
+        hit_mask, path = trace_path(board, self.layout, start,
+                                    self.variable, visited)
+        self.steps += len(visited)
+        self.insert(start, path, hit_mask)
+        return hit_mask
+
+    def insert(self, start, path, hit_mask):
+        """
+        Adds the trace of one laser to the decision tree of its start,
+        evicting the least recently used leaf if the cache is full.
+
+        Arguments:
+        - start (int): The starting beam state of the laser.
+        - path (list): The (cell, code) path recorded by trace_path.
+        - hit_mask (int): The bitmask of the points the laser hits.
+        """
+        key = (start, tuple(code for _, code in path))
+        parent = None
+        branch = start
+        children = self.roots
+        for cell, code in path:
+            node = children.get(branch)
+            if node is None:
+                node = [cell, {}, parent, branch]
+                children[branch] = node
+            parent = node
+            branch = code
+            children = node[1]
+        leaf = [-1, hit_mask, parent, branch, key]
+        children[branch] = leaf
+        self.leaves[key] = leaf
+        if len(self.leaves) > self.maxsize:
+            self.evict()
+
+    def evict(self):
+        """
+        Drops the least recently used leaf, and any inner nodes left with
+        no children.
+        """
+        _, node = self.leaves.popitem(last=False)
+        self.evictions += 1
+        while True:
+            parent, branch = node[2], node[3]
+            children = self.roots if parent is None else parent[1]
+            del children[branch]
+            if parent is None or parent[1]:
+                break
+            node = parent
+
+    def hit_mask(self, board, starts, target_mask=0):
+        """
+        Finds the points all lasers hit on a board, using cached traces
+        wherever the beams' paths are unchanged.
+
+        Arguments:
+        - board (bytearray): The block codes of the cells, row by row.
+        - starts (list): The starting beam states of the lasers.
+        - target_mask (int): The bitmask of the points the lasers need to
+          intersect, or 0 to look up every laser. Defaults to 0.
+
+        Returns:
+        - hit_mask (int): The bitmask of the points the lasers pass
+          through, complete at least for the target bits.
+        """
+        hit_mask = 0
+        for start in starts:
+            hit_mask |= self.lookup(board, start)
+            if target_mask and hit_mask & target_mask == target_mask:
+                break
+        return hit_mask
+
+
+def cached_search(game, stats=None, cache_size=65536):
+    """
+    Searches for a solution like brute_force_search, but looks each
+    laser up in a BeamCache so beams whose paths are unchanged from an
+    earlier candidate are not traced again.
+
+    Arguments:
+    - game (Game): The game instance to solve.
+    - stats (dict): Optional dictionary whose 'candidates' entry is
+      increased by the number of placements tested, and whose 'cache'
+      entry is set to the cache counters. A SolveMonitor also gets the
+      other counters, with the steps of the lasers traced again, the
+      phase timers and progress reports.
+    - cache_size (int): The most cached traces to keep.
+
+    Returns:
+    - solution (list): The solved grid, or None if there is no solution.
+
+    Example:
+    >> stats = {}
+    >> cached_search(parse_bff('mad_7.bff'), stats)
+    >> stats['cache']['hits']
+    """
+    grid = game.get_grid()
+    target_mask = points_mask(game.get_points(), grid)
+    if target_mask is None:
+        return None
+    layout = board_layout(len(grid), len(grid[0]))
+    starts = layout.laser_states(game.get_lasers())
+    space = PlacementSpace(game)
+    cache = BeamCache(layout, space.reach_cells + space.spare_cells,
+                      cache_size)
+    monitor = stats if isinstance(stats, SolveMonitor) else None
+    if monitor is not None:
+        monitor.add_pruned(game, space)
+        monitor.start(space.total)
+
+    candidates = 0
+    solution = None
+    for board in space.boards():
+        if monitor is not None:
+            monitor.lap('enumerate')
+            if candidates & 255 == 0:
+                monitor.update(candidates)
+        candidates += 1
+        hit_mask = cache.hit_mask(board, starts, target_mask)
+        if monitor is not None:
+            monitor.lap('trace')
+        solved = hit_mask & target_mask == target_mask
+        if monitor is not None:
+            monitor.lap('check')
+        if solved:
+            solution = decode_grid(board, space.cols)
+            break
+    if stats is not None:
+        stats['candidates'] = stats.get('candidates', 0) + candidates
+        stats['cache'] = cache.info()
+    if monitor is not None:
+        if monitor.count_steps:
+            monitor['steps'] += cache.steps
+        monitor.update(candidates, force=True)
+    return solution
+
+
+def import_numpy(user):
+    """
+    Imports numpy for the batch evaluator on first use, raising an
+    ImportError naming the caller if numpy is not installed.
+
+    Arguments:
+    - user (str): The name of the function that needs numpy.
+
+    Returns:
+    - numpy (module): The numpy module.
+    """
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError(f"{user} needs numpy") from None
+    return numpy
+
+
+def candidate_array(game, placements):
+    """
+    Stacks candidate boards built from place_blocks output into one
+    array for batch_evaluate.
+
+    Arguments:
+    - game (Game): The game instance.
+    - placements (list): Block placements as yielded by place_blocks.
+
+    Returns:
+    - boards (numpy.ndarray): An (N, rows, cols) array of block codes.
+
+    Example:
+    >> slots = find_all_placements(game.get_grid())
+    >> perms = islice(place_blocks(slots, game.get_blocks()), 1000)
+    >> candidate_array(game, perms).shape
+    (1000, 3, 3)
+    """
+    np = import_numpy('candidate_array')
+    grid = game.get_grid()
+    rows, cols = len(grid), len(grid[0])
+    slots = find_all_placements(grid)
+    base = np.frombuffer(bytes(encode_grid(grid)), dtype=np.uint8)
+    letters = [BLOCK_LETTERS[code] for code in sorted(BLOCK_LETTERS)]
+    lookup = {letter: i for i, letter in enumerate(letters)}
+    codes = np.array(sorted(BLOCK_LETTERS), dtype=np.uint8)
+    chosen = np.array([[lookup[block] for block in perm]
+                       for perm in placements], dtype=np.intp)
+    boards = np.tile(base, (len(chosen), 1))
+    if len(chosen):
+        boards[:, [row * cols + col for row, col in slots]] = codes[chosen]
+    return boards.reshape(len(chosen), rows, cols)
+
+
+def batch_evaluate(boards, layout, starts, target_points, stats=None):
+    """
+    Decides for many candidate boards at once whether they solve the
+    puzzle, advancing the beams of all boards in lock-step with NumPy.
+
+    Every active beam is a (board, state) pair. Each round looks up the
+    cell ahead of every beam at once, drops beams that leave the grid or
+    hit an opaque block, bounces beams off reflect and refract blocks
+    and moves the rest, so refracted beams split into two pairs. Each
+    pair is only ever advanced once, which ends loops.
+
+    Arguments:
+    - boards (numpy.ndarray): An (N, rows, cols) or (N, rows * cols)
+      array of block codes.
+    - layout (BoardLayout): The lookup tables for the board size.
+    - starts (list): The starting beam states of the lasers.
+    - target_points (list): The points the lasers need to intersect.
+    - stats (dict): Optional dictionary whose 'steps' entry is increased
+      by the number of (board, state) pairs advanced.
+
+    Returns:
+    - solved (numpy.ndarray): An N-length boolean vector, True for the
+      boards whose beams hit every target.
+
+    Example:
+    >> batch_evaluate(candidate_array(game, perms), layout, starts,
+    ..                game.get_points())
+    array([False, False, ..., True])
+    """
+    np = import_numpy('batch_evaluate')
+    count = len(boards)
+    cells = layout.rows * layout.cols
+    boards = np.asarray(boards, dtype=np.uint8).reshape(count, cells)
+    neighbours = np.asarray(layout.neighbours, dtype=np.int64)
+    bounce = np.asarray(layout.bounce, dtype=np.int64)
+    steps = np.asarray(layout.steps, dtype=np.int64)
+    n_states = len(neighbours)
+    n_points = n_states // 4
+
+    # A target off the lattice can never be hit
+    targets = [point_bit(point, [[None] * layout.cols] * layout.rows)
+               for point in target_points]
+    if None in targets:
+        return np.zeros(count, dtype=bool)
+
+    visited = np.zeros(count * n_states, dtype=bool)
+    hits = np.zeros(count * n_points, dtype=bool)
+    board_ids = np.repeat(np.arange(count, dtype=np.int64), len(starts))
+    states = np.tile(np.asarray(starts, dtype=np.int64), count)
+    while len(states):
+        # Advance every (board, state) pair at most once
+        keys = board_ids * n_states + states
+        keys = np.unique(keys[~visited[keys]])
+        visited[keys] = True
+        if stats is not None:
+            stats['steps'] = stats.get('steps', 0) + len(keys)
+        board_ids, states = np.divmod(keys, n_states)
+
+        cell = neighbours[states]
+        inside = cell >= 0  # beams leaving the grid end here
+        board_ids, states, cell = board_ids[inside], states[inside], \
+            cell[inside]
+        block = boards[board_ids, cell]
+
+        bounced = (block == REFLECT) | (block == REFRACT)
+        passed = (block != REFLECT) & (block != OPAQUE)
+        moved = states[passed] + steps[states[passed] & 3]
+        hits[board_ids[passed] * n_points + (moved >> 2)] = True
+
+        board_ids = np.concatenate((board_ids[bounced], board_ids[passed]))
+        states = np.concatenate((bounce[states[bounced]], moved))
+
+    hits = hits.reshape(count, n_points)
+    return hits[:, targets].all(axis=1)
+
+
+def numpy_search(game, stats=None, batch_size=4096):
+    """
+    Searches for a solution like brute_force_search, but evaluates the
+    placements batch_size at a time with batch_evaluate.
+
+    Arguments:
+    - game (Game): The game instance to solve.
+    - stats (dict): Optional dictionary whose 'candidates' entry is
+      increased by the number of placements tested. A SolveMonitor also
+      gets the other counters, with the steps of every board in the
+      batches evaluated, the phase timers and a progress report after
+      each batch.
+    - batch_size (int): The number of candidate boards per batch.
+
+    Returns:
+    - solution (list): The solved grid, or None if there is no solution.
+
+    Example:
+    >> numpy_search(parse_bff('mad_7.bff'))
+    """
+    np = import_numpy('numpy_search')
+    grid = game.get_grid()
+    layout = board_layout(len(grid), len(grid[0]))
+    starts = layout.laser_states(game.get_lasers())
+    points = game.get_points()
+    space = PlacementSpace(game)
+    monitor = stats if isinstance(stats, SolveMonitor) else None
+    # The monitor also counts the steps of batch_evaluate, if asked to
+    step_stats = None
+    if monitor is not None:
+        monitor.add_pruned(game, space)
+        monitor.start(space.total)
+        if monitor.count_steps:
+            step_stats = monitor
+
+    candidates = 0
+    solution = None
+    batch = []
+    boards = space.boards()
+    while True:
+        batch.clear()
+        for board in islice(boards, batch_size):
+            batch.append(bytes(board))
+        if not batch:
+            break
+        array_boards = np.frombuffer(b''.join(batch), dtype=np.uint8)
+        if monitor is not None:
+            monitor.lap('enumerate')
+        solved = batch_evaluate(array_boards.reshape(len(batch), -1),
+                                layout, starts, points, step_stats)
+        if monitor is not None:
+            monitor.lap('trace')
+        found = np.flatnonzero(solved)
+        if monitor is not None:
+            monitor.lap('check')
+            monitor.update(candidates + len(batch))
+        if len(found):
+            candidates += int(found[0]) + 1
+            solution = decode_grid(batch[found[0]], space.cols)
+            break
+        candidates += len(batch)
+    if stats is not None:
+        stats['candidates'] = stats.get('candidates', 0) + candidates
+    if monitor is not None:
+        monitor.update(candidates, force=True)
+    return solution
+
+
+def find_row_col(curr_pos, curr_dir):
+    """
+    Finds the grid cell a laser at the given lattice position is about
+    to enter when moving in the given direction.
+
+    Arguments:
+    - curr_pos (tuple): The current position as a tuple (x, y).
+    - curr_dir (tuple): The current direction as a tuple (vx, vy).
+
+    Returns:
+    - row_num, col_num (tuple): The row and column of the cell.
+
+    Example:
+    >> find_row_col((3, 4), (-1, -1))
+    (1, 1)
+    """
+    if curr_pos[0] % 2 == 0:  # if x coordinate is even
+        if curr_dir[0] == 1:
+            row_num = int((curr_pos[1]-1)/2)
+            col_num = int(curr_pos[0]/2)
+        else:
+            row_num = int((curr_pos[1]-1)/2)
+            col_num = int((curr_pos[0]-2)/2)
+    else:
+        if curr_dir[1] == 1:
+            row_num = int(curr_pos[1]/2)
+            col_num = int((curr_pos[0]-1)/2)
+        else:
+            row_num = int((curr_pos[1]-2)/2)
+            col_num = int((curr_pos[0]-1)/2)
+    return row_num, col_num
+
+
+def backtrack_search(game, stats=None):
+    """
+    Searches for a solution by placing blocks one at a time along the
+    paths the lasers actually take.
+
+    The lasers are traced over a flat board whose open slots are
+    undecided. Whenever a beam is about to enter an undecided slot the
+    search branches on what goes there, so slots no beam reaches are
+    never enumerated. At every branch the beams still to trace are run
+    over the closure of the board, as in beam_closure, where every
+    undecided slot lets beams through and, while reflect or refract
+    blocks are left, bounces them too. The branch is pruned if a target
+    still unhit is out of reach even then. The slots target_constraints
+    finds must deflect or let beams through only get blocks that do.
+    Remaining blocks are finally dropped into slots that no beam touched.
+
+    A branch marks the beam states it traces and unmarks them when it
+    fails, so the search shares one visited buffer instead of copying it
+    at every branch.
+
+    Arguments:
+    - game (Game): The game instance to solve.
+    - stats (dict): Optional dictionary whose 'candidates' entry is
+      increased by the number of partial boards explored. A SolveMonitor
+      also gets the 'steps' counter, progress reports, and the phase
+      timers, where 'trace' is the tracing up to the next undecided
+      slot, 'check' the closure bound and 'enumerate' the branching.
+
+    Returns:
+    - solution (list): The solved grid, or None if there is no solution.
+
+    Example:
+    >> backtrack_search(parse_bff('showstopper_4.bff'))
+    [['B', 'A', 'B'], ['B', 'o', 'A'], ['A', 'o', 'B']]
+    """
+    compiled = compile_game(game)
+    target_mask = compiled.target_mask
+    blocks = game.get_blocks()
+    remaining = {REFLECT: blocks.get_reflect(),
+                 OPAQUE: blocks.get_opaque(),
+                 REFRACT: blocks.get_refract()}
+    cols = compiled.cols
+    undecided = {row * cols + col for row, col in compiled.slots}
+    if target_mask is None or sum(remaining.values()) > len(undecided):
+        return None
+    analysis = target_constraints(game)
+    if not analysis.feasible:
+        return None
+    deflect = {row * cols + col for row, col in analysis.deflect}
+    through = {row * cols + col for row, col in analysis.through}
+
+    layout = compiled.layout
+    neighbours, bounce, steps = layout.neighbours, layout.bounce, layout.steps
+    board = encode_grid(game.get_grid())
+    visited = bytearray(len(neighbours))
+    # The states marked in visited, in order, so a branch can unmark its
+    # own when it fails
+    trail = []
+    monitor = stats if isinstance(stats, SolveMonitor) else None
+    if monitor is not None:
+        monitor.start(None)
+
+    def trace(beams, hit_mask):
+        # Advance the beams until they all end or one of them is about to
+        # enter an undecided slot. Returns the slot, or -1 if every beam
+        # ended, and the points hit.
+        while beams:
+            state = beams.pop()
+            if visited[state]:
+                continue  # this beam has already been traced from here
+            cell = neighbours[state]
+            if cell in undecided:
+                beams.append(state)
+                return cell, hit_mask
+            visited[state] = 1
+            trail.append(state)
+            if cell < 0:  # the beam leaves the grid
+                continue
+            block = board[cell]
+            if block <= REFRACT:
+                if block == OPAQUE:
+                    continue
+                beams.append(bounce[state])
+                if block == REFLECT:
+                    continue
+            state += steps[state & 3]
+            hit_mask |= 1 << (state >> 2)
+            beams.append(state)
+        return -1, hit_mask
+
+    def can_hit_targets(beams, hit_mask):
+        # Whether the beams still to trace could hit every target over
+        # the closure of the board. States already traced are skipped,
+        # since what follows them is already traced or still to trace.
+        can_bounce = remaining[REFLECT] + remaining[REFRACT] > 0
+        seen = set()
+        while beams:
+            if hit_mask & target_mask == target_mask:
+                return True
+            state = beams.pop()
+            if state in seen or visited[state]:
+                continue
+            seen.add(state)
+            cell = neighbours[state]
+            if cell < 0:
+                continue
+            if cell in undecided:
+                if can_bounce:
+                    beams.append(bounce[state])
+            else:
+                block = board[cell]
+                if block <= REFRACT:
+                    if block == OPAQUE:
+                        continue
+                    beams.append(bounce[state])
+                    if block == REFLECT:
+                        continue
+            state += steps[state & 3]
+            hit_mask |= 1 << (state >> 2)
+            beams.append(state)
+        return hit_mask & target_mask == target_mask
+
+    def search(beams, hit_mask):
+        if stats is not None:
+            stats['candidates'] = stats.get('candidates', 0) + 1
+        mark = len(trail)
+        if monitor is not None:
+            monitor.lap('enumerate')
+            if monitor['candidates'] & 255 == 0:
+                monitor.update(monitor['candidates'])
+        cell, hit_mask = trace(beams, hit_mask)
+        if monitor is not None:
+            monitor.lap('trace')
+            if monitor.count_steps:
+                monitor['steps'] += len(trail) - mark
+        if cell < 0:
+            found = hit_mask & target_mask == target_mask
+        elif not can_hit_targets(list(beams), hit_mask):
+            found = False
+        else:
+            found = None
+        if monitor is not None:
+            monitor.lap('check')
+        if found is None:
+            found = branch(cell, beams, hit_mask)
+        if not found:
+            while len(trail) > mark:
+                visited[trail.pop()] = 0
+        return found
+
+    def branch(cell, beams, hit_mask):
+        # Try every block that may go in the slot, then leaving it empty
+        undecided.remove(cell)
+        choices = [code for code in (REFLECT, REFRACT, OPAQUE)
+                   if remaining[code]]
+        if len(undecided) >= sum(remaining.values()):
+            choices.append(EMPTY)
+        if cell in deflect:
+            choices = [code for code in choices
+                       if code == REFLECT or code == REFRACT]
+        if cell in through:
+            choices = [code for code in choices
+                       if code == REFRACT or code == EMPTY]
+        for code in choices:
+            board[cell] = code
+            if code != EMPTY:
+                remaining[code] -= 1
+            if search(list(beams), hit_mask):
+                return True
+            if code != EMPTY:
+                remaining[code] += 1
+        board[cell] = EMPTY
+        undecided.add(cell)
+        return False
+
+    found = search(compiled.starts[::-1], 0)
+    if monitor is not None:
+        monitor.update(monitor['candidates'], force=True)
+    if not found:
+        return None
+
+    # Drop the blocks left over into slots the lasers never reached
+    spare = ([REFLECT] * remaining[REFLECT] + [OPAQUE] * remaining[OPAQUE] +
+             [REFRACT] * remaining[REFRACT])
+    for row, col in compiled.slots:
+        if row * cols + col in undecided:
+            board[row * cols + col] = spare.pop() if spare else EMPTY
+    return decode_grid(board, cols)
+
+
+# Solver engines selectable from solve()
+SOLVER_ENGINES = {
+    'brute': brute_force_search,
+    'backtrack': backtrack_search,
+    'parallel': parallel_search,
+    'incremental': incremental_search,
+    'cached': cached_search,
+    'bitboard': bitboard_search,
+}
+# The numpy engine is only offered when numpy is installed
+if NUMPY_AVAILABLE:
+    SOLVER_ENGINES['numpy'] = numpy_search
+# Engines that run in a single process, and so can run in batch workers
+BATCH_ENGINES = [name for name in SOLVER_ENGINES if name != 'parallel']
+
+
+def puzzle_fingerprint(puzzle):
+    """
+    Works out a canonical fingerprint of a puzzle. It only depends on
+    the grid, the block counts, the lasers and the targets, so two .bff
+    files that differ in whitespace, comments or the order of their
+    laser and point lines have the same fingerprint.
+
+    Arguments:
+    - puzzle (Puzzle): The parsed puzzle.
+
+    Returns:
+    - fingerprint (str): A hex SHA-256 digest.
+
+    Example:
+    >> puzzle_fingerprint(read_puzzle('tiny_5.bff'))
+    'c5b0...'
+    """
+    canonical = json.dumps([list(puzzle.grid), list(puzzle.blocks),
+                            sorted(set(puzzle.lasers)),
+                            sorted(set(puzzle.points))],
+                           separators=(',', ':'))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def is_solution(puzzle, grid):
+    """
+    Checks that a grid solves a puzzle: it keeps the fixed cells, places
+    exactly the available blocks on open slots and the lasers hit every
+    target.
 
+    Arguments:
+    - puzzle (Puzzle): The parsed puzzle.
+    - grid (list): The candidate solved grid.
 
-   Arguments:
-   - org_grid (list): The original grid of the game.
-   - available_slots (list): List of available slots on the grid.
-   - perm (list): Permutation of block placements.
+    Returns:
+    - solved (bool): True if the grid is a solution of the puzzle.
 
+    Example:
+    >> is_solution(read_puzzle('tiny_5.bff'), [['o'] * 3] * 3)
+    False
+    """
+    if len(grid) != len(puzzle.grid):
+        return False
+    placed = {'A': 0, 'B': 0, 'C': 0}
+    for row, fixed_row in zip(grid, puzzle.grid):
+        if len(row) != len(fixed_row):
+            return False
+        for block, fixed in zip(row, fixed_row):
+            if fixed == 'o' and block in placed:
+                placed[block] += 1
+            elif block != fixed:
+                return False
+    if (placed['A'], placed['B'], placed['C']) != tuple(puzzle.blocks):
+        return False
+    game = puzzle.to_game()
+    return check_solution(shoot_laser(grid, game.get_lasers()),
+                          game.get_points())
 
-   Returns:
-   - new_grid (list): The new grid with the block placements.
 
+class SolutionStore:
+    """
+    A persistent store of solved puzzles keyed by puzzle_fingerprint, so
+    a puzzle that was solved before is not searched again.
+
+    Each entry is a small JSON file in the store directory, holding the
+    solved grid or null for a puzzle without a solution. Entries are
+    written to a private file and renamed into place, so readers never
+    see half an entry, and readers and writers take a lock on the
+    directory so that concurrent processes do not evict each other's
+    fresh entries. Reads refresh an entry's modification time. The number
+    of entries is kept in a count file, and once it passes max_entries
+    the least recently used entries are removed in one batch, down to
+    nine tenths of max_entries, so a put only lists the directory when
+    the store is full. Entries read from disk are checked with
+    is_solution before they are trusted.
 
-   Example:
-   >> org_grid = [[0, 'A', 0], ['B', 0, 'C']]
-   >> available_slots = [(0, 0), (0, 2), (1, 1)]
-   >> perm = ['A', 'B', 'C']
-   >> new_grid = initialize_board(org_grid, available_slots, perm)
-   >> new_grid
-   [['A', 'A', 'B'], ['B', 'C', 'C']]
+    Attributes:
+    - directory (str): The directory holding the entries.
+    - max_entries (int): The most entries kept on disk, and in memory.
+    - memory (OrderedDict): The entries last used by this process, the
+      most recent last.
+    - hits (int): The number of lookups answered by the store.
+    - misses (int): The number of lookups that found nothing.
+    """
 
-    '''
-    new_grid = org_grid
-    for i, slot in enumerate(available_slots):
-        new_grid[slot[0]][slot[1]] = perm[i]
-    return new_grid
+    def __init__(self, directory, max_entries=10000):
+        """
+        Opens the store in the given directory, creating it if needed.
+
+        Arguments:
+        - directory (str): The directory holding the entries.
+        - max_entries (int): The most entries to keep. Defaults to 10000.
+
+        Example:
+        >> store = SolutionStore('.solutions')
+        >> solve('mad_7.bff', store=store)
+        """
+        if max_entries < 1:
+            raise ValueError("A SolutionStore needs room for an entry")
+        self.directory = directory
+        self.max_entries = max_entries
+        self.memory = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def entry_path(self, fingerprint):
+        """
+        Returns the path of the entry file of a fingerprint.
+        """
+        return os.path.join(self.directory, f"{fingerprint}.json")
+
+    @contextlib.contextmanager
+    def locked(self):
+        """
+        Holds the lock of the store directory for the with block.
+        """
+        with open(os.path.join(self.directory, '.lock'), 'a') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def remember(self, fingerprint, grid):
+        """
+        Keeps an entry in memory, forgetting the least recently used
+        ones beyond max_entries.
+        """
+        self.memory[fingerprint] = grid
+        self.memory.move_to_end(fingerprint)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+
+    def get(self, puzzle):
+        """
+        Looks up the solution of a puzzle.
+
+        Arguments:
+        - puzzle (Puzzle): The parsed puzzle.
+
+        Returns:
+        - found (bool): Whether the store knows the puzzle.
+        - grid (list): The solved grid, or None if the puzzle has no
+          solution or is not in the store.
+
+        Example:
+        >> store.get(read_puzzle('mad_7.bff'))
+        (True, [['o', 'A', 'o', 'o', 'o'], ...])
+        """
+        fingerprint = puzzle_fingerprint(puzzle)
+        if fingerprint in self.memory:
+            self.memory.move_to_end(fingerprint)
+            self.hits += 1
+            return True, self.memory[fingerprint]
+        path = self.entry_path(fingerprint)
+        try:
+            # Under the lock, so the entry is not evicted between being
+            # read and being marked as recently used
+            with self.locked():
+                with open(path) as file:
+                    grid = json.load(file)['grid']
+                os.utime(path)
+            if grid is not None and not is_solution(puzzle, grid):
+                raise ValueError(f"Invalid solution in {path}")
+        except (OSError, ValueError, KeyError, TypeError):
+            self.misses += 1
+            return False, None
+        self.remember(fingerprint, grid)
+        self.hits += 1
+        return True, grid
+
+    def put(self, puzzle, grid):
+        """
+        Stores the solution of a puzzle, evicting the least recently
+        used entries if the store is full.
+
+        Arguments:
+        - puzzle (Puzzle): The parsed puzzle.
+        - grid (list): The solved grid, or None if there is no solution.
+        """
+        fingerprint = puzzle_fingerprint(puzzle)
+        self.remember(fingerprint, grid)
+        path = self.entry_path(fingerprint)
+        with self.locked():
+            added = not os.path.exists(path)
+            count = self.count() + added
+            handle, temp_path = tempfile.mkstemp(dir=self.directory,
+                                                 suffix='.tmp')
+            with os.fdopen(handle, 'w') as file:
+                json.dump({'grid': grid}, file)
+            os.replace(temp_path, path)
+            if count > self.max_entries:
+                count = self.evict()
+            elif not added:
+                return  # a rewritten entry leaves the count as it is
+            self.save_count(count)
+
+    def count(self):
+        """
+        Reads the number of entries from the count file, or counts the
+        entry files if it is missing or unreadable. The caller holds the
+        lock.
+        """
+        try:
+            with open(os.path.join(self.directory, '.count')) as file:
+                return int(file.read())
+        except (OSError, ValueError):
+            return sum(1 for name in os.listdir(self.directory)
+                       if name.endswith('.json'))
+
+    def save_count(self, count):
+        """
+        Writes the number of entries to the count file. The caller holds
+        the lock.
+        """
+        with open(os.path.join(self.directory, '.count'), 'w') as file:
+            file.write(str(count))
+
+    def evict(self):
+        """
+        Removes the least recently used entries, leaving nine tenths of
+        max_entries. The caller holds the lock.
+
+        Returns:
+        - count (int): The number of entries left.
+        """
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                entries.append((os.stat(path).st_mtime_ns, path))
+            except OSError:
+                continue  # removed meanwhile
+        entries.sort()
+        keep = self.max_entries - self.max_entries // 10
+        removed = 0
+        for _, path in entries[:max(len(entries) - keep, 0)]:
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError:
+                pass
+            self.memory.pop(os.path.basename(path)[:-5], None)
+        return len(entries) - removed
+
+
+def save_solution(file_path, grid):
+    """
+    Saves a solved grid next to its puzzle as solution_<file name>.
+
+    Arguments:
+    - file_path (str): The path of the solved .bff file.
+    - grid (list): The solved grid.
+
+    Returns:
+    - solution_file (str): The path the solution was written to.
 
+    Example:
+    >> save_solution('showstopper_4.bff', grid)
+    'solution_showstopper_4.bff'
+    """
+    # Create the solution filename
+    directory, file_name = os.path.split(file_path)
+    solution_file = os.path.join(directory, f"solution_{file_name}")
+    # Save the solution to the solution file
+    with open(solution_file, "w") as file:
+        file.write("GRID START\n")
+        for row in grid:
+            # Convert each row of the grid back to a string with spaces
+            file.write(" ".join(map(str, row)) + "\n")
+        file.write("GRID STOP\n")
+    return solution_file
+
+
+@contextlib.contextmanager
+def profiled(profile=None):
+    """
+    Runs the with block under cProfile and saves a dump of it.
+
+    Arguments:
+    - profile (str): The path to save the dump to. Defaults to the
+      LAZOR_PROFILE environment variable; without either, the block runs
+      unprofiled.
 
-def solve(file_path):
+    Example:
+    >> with profiled('mad_7.prof'):
+    ..     count_solutions(parse_bff('mad_7.bff'))
+    """
+    if profile is None:
+        profile = os.environ.get('LAZOR_PROFILE') or None
+    if profile is None:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(profile)
+        print(f"Profile saved to {profile}", file=sys.stderr)
+
+
+def solve(file_path, engine='brute', monitor=None, profile=None,
+          store=None):
     """
    Solves a game by creating a game instance from the given file,
    finding a solution, and saving it to a new .bff file.
@@ -596,42 +4098,349 @@ def solve(file_path):
 
    Arguments:
    - file_path (str): The path of the .bff file.
+   - engine (str): The search engine to use: 'brute' to test every
+     placement permutation, 'parallel' to do the same on one worker
+     process per CPU core, 'cached' to reuse the traces of beams whose
+     paths are unchanged, 'incremental' to re-trace only what changed
+     between placements, or 'backtrack' to place blocks along the
+     laser paths. Defaults to 'brute'.
+   - monitor (SolveMonitor): Optional monitor to collect counters, phase
+     timers and progress reports of the run.
+   - profile (str): Optional path to save a cProfile dump of the run to.
+     Defaults to the LAZOR_PROFILE environment variable, so a run can be
+     profiled without changing the code that calls solve.
+   - store (SolutionStore): Optional store of earlier solutions. A
+     puzzle found in it is not searched again, and a new result is added.
 
 
    Example:
    >> solve('showstopper_4.bff')
+   >> solve('mad_7.bff', engine='backtrack')
+   >> solve('mad_7.bff', monitor=SolveMonitor(progress=print),
+   ..       profile='mad_7.prof')
     """
-    # Parse the .bff file to create a game instance
-    new_game = parse_bff(file_path)
-    grid = new_game.get_grid()
-    slots_available = find_all_placements(grid)
-    blocks = new_game.get_blocks()
-    all_permutations = place_blocks(slots_available, blocks)
-    lasers = new_game.get_lasers()
-    target_points = new_game.get_points()
-
-    # Iterate through all permutations and test each one
-    for perm in all_permutations:
-        test_grid = initialize_board(grid, slots_available, perm)
-        test_points = shoot_laser(test_grid, lasers)
-
-    # Check if the current solution matches the target points
-        if check_solution(test_points, target_points):
-            # Create the solution filenamepycodestyle lazor.py
-            solution_file = f"solution_{file_path}"
-        # Save the solution to the solution file
-            with open(solution_file, "w") as file:
-                file.write("GRID START\n")
-                for row in test_grid:
-                    # Convert each row of the grid back to a string with spaces
-                    file.write(" ".join(map(str, row)) + "\n")
-                file.write("GRID STOP\n")
-            print(f"Solution found! Solution saved to {solution_file}")
-            return
+    if engine not in SOLVER_ENGINES:
+        raise ValueError(f"Unknown solver engine: {engine}")
+    with profiled(profile):
+        # Parse the .bff file to create a game instance
+        if monitor is None:
+            puzzle = read_puzzle(file_path)
+        else:
+            with monitor.phase('parse'):
+                puzzle = read_puzzle(file_path)
+        found, test_grid = (False, None) if store is None else \
+            store.get(puzzle)
+        if not found:
+            test_grid = SOLVER_ENGINES[engine](puzzle.to_game(),
+                                               stats=monitor)
+            if store is not None:
+                store.put(puzzle, test_grid)
+
+    if test_grid is not None:
+        solution_file = save_solution(file_path, test_grid)
+        print(f"Solution found! Solution saved to {solution_file}")
+        return
 
     print("No solution found")
 
 
+def solve_file(file_path, engine='brute', cache_dir=None, store=None):
+    """
+    Solves one puzzle file for a batch run and describes the outcome.
+    The solution is saved the same way solve saves it.
+
+    Arguments:
+    - file_path (str): The path of the .bff file.
+    - engine (str): The search engine to use, one of BATCH_ENGINES.
+    - cache_dir (str): Optional directory of cached puzzles, see
+      read_puzzle.
+    - store (SolutionStore): Optional store to reuse and keep solutions
+      in.
+
+    Returns:
+    - record (dict): The file, whether it was solved, the solution file,
+      the wall time in seconds, the number of candidates evaluated,
+      whether the solution came from the store and any error message.
+
+    Example:
+    >> solve_file('showstopper_4.bff')['solved']
+    True
+    """
+    record = {'file': file_path, 'engine': engine, 'solved': False,
+              'solution_file': None, 'seconds': 0.0, 'candidates': 0,
+              'stored': False, 'error': None}
+    stats = {}
+    start = time.perf_counter()
+    try:
+        puzzle = read_puzzle(file_path, cache_dir)
+        found, grid = (False, None) if store is None else store.get(puzzle)
+        if found:
+            record['stored'] = True
+        else:
+            grid = SOLVER_ENGINES[engine](puzzle.to_game(), stats=stats)
+            if store is not None:
+                store.put(puzzle, grid)
+        if grid is not None:
+            record['solved'] = True
+            record['solution_file'] = save_solution(file_path, grid)
+    except Exception as error:
+        # Any failure is recorded, so one bad puzzle cannot end a batch
+        record['error'] = f"{type(error).__name__}: {error}"
+    record['seconds'] = time.perf_counter() - start
+    record['candidates'] = stats.get('candidates', 0)
+    return record
+
+
+def find_puzzles(paths):
+    """
+    Expands files and directories into the list of puzzle files to
+    solve. Directories contribute their .bff files, except earlier
+    solution_ outputs.
+
+    Arguments:
+    - paths (list): Paths of .bff files or of directories holding them.
+
+    Returns:
+    - puzzles (list): The puzzle file paths, in order.
+
+    Example:
+    >> find_puzzles(['.'])
+    ['./dark_1.bff', './mad_1.bff', ...]
+    """
+    puzzles = []
+    for path in paths:
+        if os.path.isdir(path):
+            puzzles.extend(os.path.join(path, name)
+                           for name in sorted(os.listdir(path))
+                           if name.endswith('.bff') and
+                           not name.startswith('solution_'))
+        else:
+            puzzles.append(path)
+    return puzzles
+
+
+def init_batch_worker(store):
+    """
+    Stores the SolutionStore of a batch run in a worker process of
+    batch_solve, so it is sent to each worker only once and keeps the
+    entries it has read in memory from one puzzle to the next.
+
+    Arguments:
+    - store (SolutionStore): The store, or None.
+    """
+    worker_state['store'] = store
+
+
+def solve_batch_file(file_path, engine, cache_dir):
+    """
+    Solves one puzzle file in a worker process of batch_solve, with the
+    store given to the worker.
+
+    Arguments:
+    - file_path (str): The path of the .bff file.
+    - engine (str): The search engine to use, one of BATCH_ENGINES.
+    - cache_dir (str): Optional directory of cached puzzles.
+
+    Returns:
+    - record (dict): The outcome of the puzzle, as from solve_file.
+    """
+    return solve_file(file_path, engine, cache_dir, worker_state['store'])
+
+
+def batch_solve(paths, workers=None, engine='brute', cache_dir=None,
+                store=None):
+    """
+    Solves many puzzles at the same time on a pool of worker processes,
+    yielding one record per puzzle as soon as it finishes.
+
+    Arguments:
+    - paths (list): Paths of .bff files or of directories holding them.
+    - workers (int): The number of worker processes, or None for one per
+      CPU core.
+    - engine (str): The search engine to use, one of BATCH_ENGINES.
+    - cache_dir (str): Optional directory of cached puzzles, see
+      read_puzzle.
+    - store (SolutionStore): Optional store shared by the workers.
+
+    Yields:
+    - record (dict): The outcome of one puzzle, as from solve_file.
+
+    Example:
+    >> for record in batch_solve(['.'], workers=4):
+    ..     print(record['file'], record['solved'])
+    """
+    if engine not in BATCH_ENGINES:
+        raise ValueError(f"Unsupported batch engine: {engine}")
+    puzzles = find_puzzles(paths)
+    if not puzzles:
+        return
+    workers = min(workers or os.cpu_count() or 1, len(puzzles))
+    with ProcessPoolExecutor(workers, initializer=init_batch_worker,
+                             initargs=(store,)) as pool:
+        futures = [pool.submit(solve_batch_file, file_path, engine,
+                               cache_dir)
+                   for file_path in puzzles]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def batch_main(argv=None):
+    """
+    Command line entry point for batch solving. Prints one JSON record
+    per puzzle as it finishes.
+
+    Arguments:
+    - argv (list): The command line arguments, or None for sys.argv.
+
+    Returns:
+    - status (int): 0 if every puzzle was read, 1 if any failed.
+
+    Example:
+    >> python lazor.py batch puzzles/ extra.bff --workers 8
+    """
+    parser = argparse.ArgumentParser(
+        prog='lazor.py batch',
+        description='Solve many .bff puzzles on a pool of workers.')
+    parser.add_argument('paths', nargs='+',
+                        help='.bff files or directories holding them')
+    parser.add_argument('-w', '--workers', type=int, default=None,
+                        help='worker processes (default: one per core)')
+    parser.add_argument('-e', '--engine', default='brute',
+                        choices=BATCH_ENGINES,
+                        help='search engine (default: brute)')
+    parser.add_argument('--parse-cache', metavar='DIR',
+                        help='cache parsed puzzles in DIR, keyed by content')
+    parser.add_argument('--solution-store', metavar='DIR',
+                        help='reuse and keep solutions in DIR')
+    args = parser.parse_args(argv)
+
+    store = None
+    if args.solution_store:
+        store = SolutionStore(args.solution_store)
+    status = 0
+    for record in batch_solve(args.paths, args.workers, args.engine,
+                              args.parse_cache, store):
+        print(json.dumps(record), flush=True)
+        if record['error'] is not None:
+            status = 1
+    return status
+
+
+def solve_main(argv=None):
+    """
+    Command line entry point for solving one puzzle with optional
+    progress reports and profiling, or for listing or counting all of
+    its solutions.
+
+    Arguments:
+    - argv (list): The command line arguments, or None for sys.argv.
+
+    Returns:
+    - status (int): 0 once the puzzle was searched.
+
+    Example:
+    >> python lazor.py solve mad_7.bff --progress --profile mad_7.prof
+    >> python lazor.py solve mad_7.bff --count --at-least 2
+    >> python lazor.py solve mad_7.bff --all --engine bitboard
+    """
+    parser = argparse.ArgumentParser(
+        prog='lazor.py solve',
+        description='Solve one .bff puzzle and save its solution.')
+    parser.add_argument('path', help='the .bff file to solve')
+    parser.add_argument('-e', '--engine', choices=sorted(SOLVER_ENGINES),
+                        help='search engine (default: brute); --all, '
+                             '--count and --at-least take brute or bitboard')
+    parser.add_argument('-p', '--progress', action='store_true',
+                        help='report progress and counters on stderr')
+    parser.add_argument('--interval', type=float, default=1.0,
+                        help='seconds between progress reports')
+    parser.add_argument('--profile', metavar='PATH',
+                        help='save a cProfile dump of the run to PATH')
+    parser.add_argument('--solution-store', metavar='DIR',
+                        help='reuse and keep solutions in DIR')
+    parser.add_argument('--all', action='store_true',
+                        help='print every solution instead of saving one')
+    parser.add_argument('--count', action='store_true',
+                        help='only count the solutions')
+    parser.add_argument('--at-least', type=int, metavar='K',
+                        help='stop once K solutions are found')
+    args = parser.parse_args(argv)
+    if args.at_least is not None and args.at_least < 1:
+        parser.error('--at-least must be at least 1')
+    enumerate_all = args.all or args.count or args.at_least is not None
+    if enumerate_all and args.engine not in (None, 'brute', 'bitboard'):
+        parser.error(f'--engine {args.engine} cannot list or count '
+                     'solutions, use brute or bitboard')
+    if enumerate_all and args.solution_store:
+        parser.error('--solution-store only keeps single solutions, '
+                     'not lists or counts')
+
+    monitor = None
+    if args.progress:
+        monitor = SolveMonitor(
+            progress=lambda progress: print(format_progress(progress),
+                                            file=sys.stderr, flush=True),
+            interval=args.interval)
+    if enumerate_all:
+        bitboard = args.engine == 'bitboard'
+        with profiled(args.profile):
+            if monitor is None:
+                game = parse_bff(args.path)
+            else:
+                with monitor.phase('parse'):
+                    game = parse_bff(args.path)
+            if args.all:
+                count = 0
+                grids = islice(all_solutions(game, monitor, bitboard),
+                               args.at_least)
+                for grid in grids:
+                    count += 1
+                    print('\n'.join(' '.join(row) for row in grid) + '\n',
+                          flush=True)
+            else:
+                count = count_solutions(game, args.at_least, monitor,
+                                        bitboard)
+        prefix = 'at least ' if count == args.at_least else ''
+        print(f"{prefix}{count} solution{'s' * (count != 1)}")
+    else:
+        store = None
+        if args.solution_store:
+            store = SolutionStore(args.solution_store)
+        solve(args.path, args.engine or 'brute', monitor, args.profile,
+              store)
+    if monitor is not None:
+        print(monitor.report(), file=sys.stderr)
+    return 0
+
+
+def corpus_main(argv=None):
+    """
+    Command line entry point for packing .bff files into a corpus.
+
+    Arguments:
+    - argv (list): The command line arguments, or None for sys.argv.
+
+    Returns:
+    - status (int): 0 if every file was packed, 1 if any was left out.
+
+    Example:
+    >> python lazor.py corpus levels.lzc levels/
+    """
+    parser = argparse.ArgumentParser(
+        prog='lazor.py corpus',
+        description='Pack .bff puzzles into one memory-mappable file.')
+    parser.add_argument('corpus', help='the corpus file to write')
+    parser.add_argument('paths', nargs='+',
+                        help='.bff files or directories holding them')
+    args = parser.parse_args(argv)
+
+    written, skipped = write_corpus(args.corpus, args.paths)
+    for file_path, message in skipped:
+        print(f"Skipped {file_path}: {message}", file=sys.stderr)
+    print(f"Packed {written} puzzles into {args.corpus}")
+    return 1 if skipped else 0
+
+
 class TestLazorProject (unittest.TestCase):
     """
     Performs unit tests for all functions in this project
@@ -740,17 +4549,117 @@ class TestLazorProject (unittest.TestCase):
         self.assertIsInstance(parse_bff(test_file_path), Game,
                               'The parse_bff function is wrong')
 
+    def test_parse_puzzle(self):
+        """
+        Test that parse_bff(file_path) is silent and that parse_puzzle
+        reports the line of invalid data
+        """
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            parse_bff('tiny_5.bff')
+        self.assertEqual(output.getvalue(), '',
+                         'The parse_bff function is not silent')
+        puzzle = read_puzzle('tiny_5.bff')
+        self.assertEqual(puzzle, Puzzle(('oBo', 'ooo', 'ooo'), (3, 0, 1),
+                                        ((4, 5, -1, -1),),
+                                        ((1, 2), (6, 3))),
+                         'The read_puzzle function is wrong')
+        self.assertEqual(hash(puzzle), hash(read_puzzle('tiny_5.bff')),
+                         'The Puzzle is not hashable')
+        game = puzzle.to_game()
+        self.assertEqual(game.get_grid(), [['o', 'B', 'o'],
+                                           ['o', 'o', 'o'],
+                                           ['o', 'o', 'o']],
+                         'The to_game function is wrong')
+        self.assertEqual(game.get_blocks().get_reflect(), 3,
+                         'The to_game function is wrong')
+        for text, message in [
+                ('GRID START\no o\no\nGRID STOP', 'line 3: Grid row'),
+                ('GRID START\no q\nGRID STOP', 'line 2: Invalid grid'),
+                ('GRID START\no o\nGRID STOP\n\nA x', 'line 5: Invalid'),
+                ('GRID START\no o\nGRID STOP\nL 1 2 3', 'line 4: Invalid'),
+                ('# just a comment', 'No grid data')]:
+            with self.assertRaisesRegex(ValueError, message):
+                parse_puzzle(text)
+
+    def test_read_puzzle_cache(self):
+        """
+        Test that read_puzzle(file_path, cache_dir) reuses cached puzzles
+        keyed by content
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            cache_dir = os.path.join(directory, 'cache')
+            file_path = shutil.copy('mad_1.bff', directory)
+            puzzle = read_puzzle(file_path, cache_dir)
+            self.assertEqual(len(os.listdir(cache_dir)), 1,
+                             'The read_puzzle cache is wrong')
+            self.assertEqual(read_puzzle(file_path, cache_dir), puzzle,
+                             'The read_puzzle cache is wrong')
+            copy_path = os.path.join(directory, 'copy.bff')
+            shutil.copy(file_path, copy_path)
+            self.assertEqual(read_puzzle(copy_path, cache_dir), puzzle,
+                             'The read_puzzle cache is wrong')
+            self.assertEqual(len(os.listdir(cache_dir)), 1,
+                             'The read_puzzle cache is wrong')
+            entry = os.path.join(cache_dir, os.listdir(cache_dir)[0])
+            with open(entry, 'w') as file:
+                file.write('not json')
+            self.assertEqual(read_puzzle(file_path, cache_dir), puzzle,
+                             'The read_puzzle cache is wrong')
+
     def test_place_blocks(self):
         """
         Tests the place_blocks(available_slots, blocks) function
         """
         test_slots = [(0, 0), (0, 1), (0, 2)]
-        test_perms = place_blocks(test_slots, self.blocks)
+        test_perms = list(place_blocks(test_slots, self.blocks))
         self.assertIn(['A', 'A', 'C'], test_perms)
         self.assertIn(['A', 'C', 'A'], test_perms)
         self.assertEqual(len(test_perms), 3,
                          'The place_blocks function is wrong')
 
+    def test_place_blocks_resume(self):
+        """
+        Tests resuming place_blocks from an index
+        """
+        test_slots = [(0, 0), (0, 1), (0, 2), (0, 3), (1, 0)]
+        all_perms = list(place_blocks(test_slots, self.blocks))
+        for start in range(len(all_perms) + 1):
+            self.assertEqual(list(place_blocks(test_slots, self.blocks,
+                                               start=start)),
+                             all_perms[start:],
+                             'The place_blocks function cannot resume')
+
+    def test_multiset_permutations(self):
+        """
+        Tests the multiset_permutations(items, start) function against
+        itertools.permutations
+        """
+        items = ['o', 'A', 'C', 'o', 'A', 'B', 'o']
+        expected = sorted(set(permutations(items)))
+        result = list(multiset_permutations(items))
+        self.assertEqual([tuple(perm) for perm in result], expected,
+                         'The multiset_permutations function is wrong')
+        self.assertEqual(len(result), multinomial([2, 1, 1, 3]),
+                         'The multinomial function is wrong')
+        for start in (0, 1, 17, len(result) - 1, len(result)):
+            self.assertEqual(list(multiset_permutations(items, start)),
+                             result[start:],
+                             'The multiset_permutations cannot resume')
+        self.assertEqual(list(multiset_permutations([])), [[]],
+                         'The multiset_permutations function is wrong')
+
+    def test_count_placements(self):
+        """
+        Tests the count_placements(available_slots, blocks) function
+        """
+        test_slots = [(0, 0), (0, 1), (0, 2), (0, 3), (1, 0)]
+        self.assertEqual(count_placements(test_slots, self.blocks),
+                         len(list(place_blocks(test_slots, self.blocks))),
+                         'The count_placements function is wrong')
+        self.assertEqual(count_placements(test_slots[:2], self.blocks), 0,
+                         'The count_placements function is wrong')
+
     def test_find_all_placements(self):
         """
         Test the find_all_placements(grid) function
@@ -770,21 +4679,208 @@ class TestLazorProject (unittest.TestCase):
                      ['A', 'x', 'o'],
                      ['C', 'o', 'o']]
         test_laser_1 = Laser((4, 3), (-1, -1))
-        correct_points_1 = [(3, 2)]
+        correct_points_1 = {(3, 2)}
         self.assertEqual(shoot_laser(test_grid, [test_laser_1]),
                          correct_points_1,
                          'The shoot_laser method is wrong')
         test_laser_2 = Laser((3, 4), (-1, -1))
-        correct_points_2 = [(2, 3), (3, 2)]
+        correct_points_2 = {(2, 3), (3, 2)}
         self.assertEqual(shoot_laser(test_grid, [test_laser_2]),
                          correct_points_2,
                          'The shoot laser method is wrong')
         test_laser_3 = Laser((3, 4), (-1, 1))
-        correct_points_3 = [(2, 5), (1, 6), (3, 6)]
+        correct_points_3 = {(2, 5), (1, 6), (3, 6)}
         self.assertEqual(shoot_laser(test_grid, [test_laser_3]),
                          correct_points_3,
                          'The shoot_laser method is wrong')
 
+    def test_shoot_laser_loop(self):
+        """
+        Test that shoot_laser(grid, lasers) ends beams caught in a loop
+        """
+        test_grid = [['C', 'o', 'o'],
+                     ['C', 'o', 'o'],
+                     ['o', 'o', 'o']]
+        test_laser = Laser((1, 2), (-1, -1))
+        self.assertEqual(shoot_laser(test_grid, [test_laser]),
+                         {(0, 1), (0, 3)},
+                         'The shoot_laser method cannot end a loop')
+        test_grid = [['A', 'A'],
+                     ['o', 'o']]
+        test_laser = Laser((2, 1), (1, -1))
+        self.assertEqual(shoot_laser(test_grid, [test_laser]), set(),
+                         'The shoot_laser method cannot end a loop')
+
+    def test_points_mask(self):
+        """
+        Test the point_bit(point, grid) and points_mask(points, grid)
+        functions against trace_lasers(grid, lasers)
+        """
+        test_grid = [['o', 'B', 'o'],
+                     ['A', 'x', 'o'],
+                     ['C', 'o', 'o']]
+        test_laser = Laser((3, 4), (-1, 1))
+        self.assertEqual(trace_lasers(test_grid, [test_laser]),
+                         points_mask([(2, 5), (1, 6), (3, 6)], test_grid),
+                         'The trace_lasers function is wrong')
+        self.assertEqual(point_bit((6, 6), test_grid), 48,
+                         'The point_bit function is wrong')
+        self.assertIsNone(point_bit((7, 0), test_grid),
+                          'The point_bit function is wrong')
+        self.assertIsNone(points_mask([(1, 0), (0, -1)], test_grid),
+                          'The points_mask function is wrong')
+
+    def test_trace_lasers_early_exit(self):
+        """
+        Test that trace_lasers(grid, lasers, target_mask) stops once every
+        target is hit and reports a board that cannot succeed
+        """
+        test_grid = [['o', 'B', 'o'],
+                     ['A', 'x', 'o'],
+                     ['C', 'o', 'o']]
+        test_laser = Laser((3, 4), (-1, 1))
+        target_mask = points_mask([(2, 5)], test_grid)
+        self.assertEqual(trace_lasers(test_grid, [test_laser], target_mask),
+                         target_mask,
+                         'The trace_lasers function does not stop early')
+        target_mask = points_mask([(2, 5), (0, 1)], test_grid)
+        hit_mask = trace_lasers(test_grid, [test_laser], target_mask)
+        self.assertNotEqual(hit_mask & target_mask, target_mask,
+                            'The trace_lasers function is wrong')
+        self.assertEqual(hit_mask, trace_lasers(test_grid, [test_laser]),
+                         'The trace_lasers function is wrong')
+
+    def test_trace_bitboard(self):
+        """
+        Test that trace_bitboard(board, layout, starts) hits the same
+        points as trace_board(board, layout, starts), loops included
+        """
+        test_grids = [[['o', 'B', 'o'], ['A', 'x', 'o'], ['C', 'o', 'o']],
+                      [['C', 'o', 'o'], ['C', 'o', 'o'], ['o', 'o', 'o']],
+                      [['A', 'A'], ['o', 'o']]]
+        test_lasers = [Laser((3, 4), (-1, 1)), Laser((1, 2), (-1, -1)),
+                       Laser((2, 1), (1, -1)), Laser((0, 1), (1, 1))]
+        for grid in test_grids:
+            rows, cols = len(grid), len(grid[0])
+            layout = board_layout(rows, cols)
+            board = encode_grid(grid)
+            starts = layout.laser_states(test_lasers)
+            self.assertEqual(trace_bitboard(board,
+                                            bitboard_layout(rows, cols),
+                                            starts),
+                             trace_board(board, layout, starts),
+                             'The trace_bitboard function is wrong')
+        for file_path in ['mad_1.bff', 'mad_7.bff', 'tiny_5.bff']:
+            game = parse_bff(file_path)
+            compiled = compile_game(game)
+            bitboard = bitboard_layout(compiled.rows, compiled.cols)
+            for perm in islice(place_blocks(compiled.slots,
+                                            game.get_blocks()), 300):
+                board = compiled.candidate.overlay(
+                    [BLOCK_CODES[block] for block in perm])
+                self.assertEqual(
+                    trace_bitboard(board, bitboard, compiled.starts),
+                    trace_board(board, compiled.layout, compiled.starts),
+                    f'The trace_bitboard function is wrong on {file_path}')
+        # Every way of placing the blocks on an open grid, with beams
+        # coming in from every side
+        grid = [['o'] * 4 for _ in range(3)]
+        layout = board_layout(3, 4)
+        bitboard = bitboard_layout(3, 4)
+        starts = layout.laser_states([Laser((1, 0), (1, 1)),
+                                      Laser((8, 3), (-1, -1)),
+                                      Laser((5, 6), (-1, -1)),
+                                      Laser((0, 5), (1, -1))])
+        for perm in place_blocks(find_all_placements(grid),
+                                 Blocks(['A', 'A', 'C'])):
+            board = encode_grid([perm[i:i + 4] for i in range(0, 12, 4)])
+            self.assertEqual(trace_bitboard(board, bitboard, starts),
+                             trace_board(board, layout, starts),
+                             'The trace_bitboard function is wrong')
+
+    def test_bitboard_check(self):
+        """
+        Test that bitboard_check(grid, lasers, required_points) agrees with
+        check_solution(shoot_laser(grid, lasers), required_points)
+        """
+        test_grid = [['o', 'B', 'o'],
+                     ['A', 'x', 'o'],
+                     ['C', 'o', 'o']]
+        test_laser = Laser((3, 4), (-1, 1))
+        for points in [[], [(2, 5)], [(2, 5), (3, 6)], [(2, 5), (0, 1)],
+                       [(9, 9)]]:
+            self.assertEqual(bitboard_check(test_grid, [test_laser], points),
+                             check_solution(shoot_laser(test_grid,
+                                                        [test_laser]),
+                                            points),
+                             'The bitboard_check function is wrong')
+        for file_path in ['mad_1.bff', 'showstopper_4.bff']:
+            game = parse_bff(file_path)
+            solution = brute_force_search(game)
+            self.assertTrue(bitboard_check(solution, game.get_lasers(),
+                                           game.get_points()),
+                            'The bitboard_check function is wrong')
+            self.assertFalse(bitboard_check(game.get_grid(),
+                                            game.get_lasers(),
+                                            game.get_points()),
+                             'The bitboard_check function is wrong')
+
+    def test_bitboard_search(self):
+        """
+        Test that bitboard_search(game) finds the same solution as
+        brute_force_search(game) after as many candidates
+        """
+        for file_path in ['dark_1.bff', 'mad_1.bff', 'mad_4.bff',
+                          'mad_7.bff', 'numbered_6.bff', 'showstopper_4.bff',
+                          'tiny_5.bff']:
+            game = parse_bff(file_path)
+            stats, expected_stats = {}, {}
+            self.assertEqual(bitboard_search(game, stats),
+                             brute_force_search(game, expected_stats),
+                             f'The bitboard engine is wrong on {file_path}')
+            self.assertEqual(stats, expected_stats,
+                             'The bitboard engine counters are wrong')
+
+    def test_board_encoding(self):
+        """
+        Test the encode_grid(grid) and decode_grid(board, cols) functions
+        """
+        test_grid = [['o', 'B', 'o'],
+                     ['A', 'x', 'o'],
+                     ['C', 'o', 'o']]
+        board = encode_grid(test_grid)
+        self.assertEqual(len(board), 9,
+                         'The encode_grid function is wrong')
+        self.assertEqual(board[3], REFLECT,
+                         'The encode_grid function is wrong')
+        self.assertEqual(decode_grid(board, 3), test_grid,
+                         'The decode_grid function is wrong')
+
+    def test_board_layout(self):
+        """
+        Test the BoardLayout lookup tables against find_row_col
+        """
+        layout = board_layout(3, 4)
+        self.assertIs(layout, board_layout(3, 4),
+                      'The board_layout function is wrong')
+        for y in range(7):
+            for x in range(9):
+                if (x + y) % 2 == 0:
+                    continue  # not a point a laser can be on
+                for d, direction in enumerate(DIRECTIONS):
+                    state = (y * 9 + x) * 4 + d
+                    row_num, col_num = find_row_col((x, y), direction)
+                    if 0 <= row_num < 3 and 0 <= col_num < 4:
+                        expected = row_num * 4 + col_num
+                    else:
+                        expected = -1
+                    self.assertEqual(layout.neighbours[state], expected,
+                                     'The neighbour table is wrong')
+        self.assertEqual(layout.laser_states([Laser((1, 2), (1, -1)),
+                                              Laser((99, 0), (1, 1))]),
+                         [(2 * 9 + 1) * 4 + 2],
+                         'The laser_states function is wrong')
+
     def test_check(self):
         """
         Test the check(curr_pos, grid) function
@@ -817,12 +4913,744 @@ class TestLazorProject (unittest.TestCase):
                         ['o', 'o', 'o', 'B'],
                         ['o', 'A', 'o', 'o'],
                         ['o', 'o', 'o', 'o']]
+        original_grid = [row[:] for row in self.grid]
         self.assertEqual(initialize_board(self.grid, test_slots, test_perm),
                          correct_grid,
                          'The initialize_board function is wrong')
+        self.assertEqual(self.grid, original_grid,
+                         'The initialize_board function changed the grid')
+
+    def test_candidate_board(self):
+        """
+        Test that CandidateBoard overlays placements without touching the
+        shared base board
+        """
+        base = encode_grid(self.grid)
+        slot_cells = [0, 3, 7, 9]
+        first = CandidateBoard(base, slot_cells)
+        second = CandidateBoard(base, slot_cells)
+        first.overlay([REFLECT, REFRACT, OPAQUE, REFLECT])
+        second.overlay([EMPTY, EMPTY, REFLECT, EMPTY])
+        self.assertEqual(decode_grid(first.board, 4),
+                         [['A', 'o', 'o', 'C'],
+                          ['o', 'o', 'o', 'B'],
+                          ['o', 'A', 'o', 'o'],
+                          ['o', 'o', 'o', 'o']],
+                         'The CandidateBoard overlay is wrong')
+        self.assertEqual(decode_grid(second.board, 4)[1],
+                         ['o', 'o', 'o', 'A'],
+                         'The CandidateBoard overlay is wrong')
+        self.assertEqual(base, encode_grid(self.grid),
+                         'The CandidateBoard changed the base board')
+        self.assertEqual(placement_codes(slot_cells, self.blocks),
+                         [REFLECT, REFLECT, REFRACT, EMPTY],
+                         'The placement_codes function is wrong')
+
+    def test_find_row_col(self):
+        """
+        Test the find_row_col(curr_pos, curr_dir) function
+        """
+        self.assertEqual(find_row_col((3, 4), (-1, -1)), (1, 1),
+                         'The find_row_col function is wrong')
+        self.assertEqual(find_row_col((4, 3), (1, 1)), (1, 2),
+                         'The find_row_col function is wrong')
+
+    def test_backtrack_search(self):
+        """
+        Test that the backtrack_search(game) engine agrees with
+        brute_force_search(game) on the bundled puzzles, each of which
+        has one solution, and finds one of the solutions of small games
+        with several solutions or none
+        """
+        for file_path in ['dark_1.bff', 'mad_1.bff', 'mad_4.bff',
+                          'mad_7.bff', 'numbered_6.bff',
+                          'showstopper_4.bff', 'tiny_5.bff']:
+            game = parse_bff(file_path)
+            solution = backtrack_search(game)
+            self.assertIsNotNone(solution,
+                                 f'The backtrack engine missed {file_path}')
+            self.assertTrue(check_solution(shoot_laser(solution,
+                                                       game.get_lasers()),
+                                           game.get_points()),
+                            f'The backtrack engine is wrong on {file_path}')
+            self.assertEqual(solution, brute_force_search(game),
+                             f'The backtrack engine disagrees with the '
+                             f'brute engine on {file_path}')
+
+        open_grid = [['o', 'o', 'o'], ['o', 'o', 'o'], ['o', 'x', 'o']]
+        games = [
+            # 30 solutions
+            Game(open_grid, Blocks(['A', 'B']), [Laser((0, 1), (1, 1))],
+                 [(2, 3)]),
+            # Five solutions that turn the laser back
+            Game(open_grid, Blocks(['A', 'C']), [Laser((0, 1), (1, 1))],
+                 [(1, 4), (3, 4)]),
+            # No solution: the only block stops the laser
+            Game([['o', 'o'], ['o', 'o']], Blocks(['B']),
+                 [Laser((1, 4), (1, -1))], [(0, 1)]),
+            # No solution: a target that no beam can reach
+            Game(open_grid, Blocks(['A']), [Laser((0, 1), (1, 1))],
+                 [(1, 6), (5, 0)]),
+        ]
+        for game in games:
+            solutions = list(all_solutions(game))
+            solution = backtrack_search(game)
+            self.assertEqual(solution is None,
+                             brute_force_search(game) is None,
+                             'The backtrack engine disagrees with the brute '
+                             'engine')
+            if solutions:
+                self.assertIn(solution, solutions,
+                              'The backtrack engine is wrong')
+            else:
+                self.assertIsNone(solution, 'The backtrack engine is wrong')
+
+    def test_reachable_slots(self):
+        """
+        Test the reachable_slots(game) analysis and the PlacementSpace it
+        narrows down
+        """
+        grid = [['o', 'o', 'o'],
+                ['o', 'o', 'o'],
+                ['o', 'o', 'o']]
+        game = Game(grid, Blocks(['B']), [Laser((1, 6), (1, -1))],
+                    [(6, 1)])
+        # With nothing to bounce the beam off, it can only go straight
+        # up the diagonal
+        self.assertEqual(reachable_slots(game), [(0, 2), (1, 1), (1, 2),
+                                                 (2, 0), (2, 1)],
+                         'The reachable_slots function is wrong')
+        space = PlacementSpace(game, constrain=False)
+        full = PlacementSpace(game, prune=False)
+        self.assertEqual(full.total, count_placements(
+            find_all_placements(grid), game.get_blocks()),
+            'The PlacementSpace is wrong')
+        self.assertEqual((space.total, full.total), (6, 9),
+                         'The PlacementSpace was not pruned')
+        boards = [bytes(board) for board in space.boards()]
+        self.assertEqual(len(boards), space.total,
+                         'The PlacementSpace is wrong')
+        self.assertEqual(len(set(boards)), space.total,
+                         'The PlacementSpace repeats a placement')
+        for board in boards:
+            self.assertEqual(sorted(board), sorted(boards[0]),
+                             'The PlacementSpace lost a block')
+        self.assertEqual([bytes(board) for board in space.boards(5)],
+                         boards[5:],
+                         'The PlacementSpace cannot resume')
+
+    def test_target_constraints(self):
+        """
+        Test the target_constraints(game) analysis and the PlacementSpace
+        it narrows down
+        """
+        game = parse_bff('showstopper_4.bff')
+        analysis = target_constraints(game)
+        self.assertTrue(analysis.feasible,
+                        'The target_constraints function is wrong')
+        self.assertEqual(analysis.deflect, [(0, 1), (1, 2), (2, 0)],
+                         'The target_constraints function is wrong')
+        self.assertEqual(analysis.through, [(1, 1), (2, 1)],
+                         'The target_constraints function is wrong')
+        self.assertNotIn((0, 2), analysis.relevant,
+                         'The target_constraints function is wrong')
+
+        for file_path in ['mad_1.bff', 'tiny_5.bff']:
+            game = parse_bff(file_path)
+            space = PlacementSpace(game)
+            self.assertLess(space.total,
+                            PlacementSpace(game, constrain=False).total,
+                            'The PlacementSpace was not constrained')
+            boards = [bytes(board) for board in space.boards()]
+            self.assertEqual(len(set(boards)), space.total,
+                             'The PlacementSpace repeats a placement')
+            for board in boards:
+                self.assertEqual(sorted(board), sorted(boards[0]),
+                                 'The PlacementSpace lost a block')
+            self.assertEqual([bytes(board) for board in space.boards(3)],
+                             boards[3:], 'The PlacementSpace cannot resume')
+
+        # No beam can ever step onto the target corner
+        game = Game([['o', 'B'], ['o', 'o']], Blocks(['A']),
+                    [Laser((0, 3), (1, -1))], [(4, 0)])
+        self.assertFalse(target_constraints(game).feasible,
+                         'The target_constraints function is wrong')
+        self.assertEqual(PlacementSpace(game).total, 0,
+                         'The PlacementSpace is wrong')
+
+    def test_revolving_door(self):
+        """
+        Test that revolving_door(n, k) visits every subset once, changing
+        one element in and one out at each step
+        """
+        for n in range(7):
+            for k in range(n + 1):
+                subsets = [tuple(subset) for subset in revolving_door(n, k)]
+                self.assertEqual(sorted(subsets),
+                                 list(combinations(range(n), k)),
+                                 'The revolving_door function is wrong')
+                for first, second in zip(subsets, subsets[1:]):
+                    self.assertEqual(len(set(first) ^ set(second)), 2,
+                                     'The revolving_door order is wrong')
+
+    def test_minimal_change_permutations(self):
+        """
+        Test that minimal_change_permutations(codes) visits every
+        placement once and reports exactly the slots that change
+        """
+        codes = [REFLECT, REFLECT, OPAQUE, REFRACT, EMPTY, EMPTY, EMPTY]
+        previous = None
+        seen = set()
+        for perm, changed in minimal_change_permutations(codes):
+            if previous is not None:
+                self.assertEqual(sorted(changed),
+                                 [i for i in range(len(perm))
+                                  if perm[i] != previous[i]],
+                                 'The changed slots are wrong')
+                self.assertLessEqual(len(changed), 4,
+                                     'Too many slots changed at once')
+            seen.add(tuple(perm))
+            previous = perm[:]
+        self.assertEqual(seen, set(permutations(codes)),
+                         'The minimal_change_permutations is wrong')
+
+    def test_ranked_minimal_change_permutations(self):
+        """
+        Test that ranked_minimal_change_permutations(codes, prefix) starts
+        in rank order, visits every placement once and reports exactly
+        the slots that change
+        """
+        codes = [REFLECT, REFLECT, OPAQUE, REFRACT, EMPTY, EMPTY, EMPTY]
+        for prefix in [0, 1, 100, 420, 1000]:
+            previous = [None] * len(codes)
+            visited = []
+            for perm, changed in ranked_minimal_change_permutations(
+                    codes, prefix):
+                self.assertEqual(sorted(changed),
+                                 [i for i in range(len(perm))
+                                  if perm[i] != previous[i]],
+                                 'The changed slots are wrong')
+                visited.append(tuple(perm))
+                previous = perm[:]
+            self.assertEqual(sorted(visited), sorted(set(permutations(
+                codes))), 'The ranked_minimal_change_permutations is wrong')
+            self.assertEqual(visited[:prefix],
+                             [tuple(perm) for perm in islice(
+                                 multiset_permutations(codes), prefix)],
+                             'The rank-ordered prefix is wrong')
+
+    def test_incremental_tracer(self):
+        """
+        Test that IncrementalTracer agrees with trace_board(board, layout,
+        starts) as cells change
+        """
+        game = parse_bff('mad_1.bff')
+        grid = game.get_grid()
+        layout = board_layout(len(grid), len(grid[0]))
+        starts = layout.laser_states(game.get_lasers())
+        board = encode_grid(grid)
+        tracer = IncrementalTracer(board, layout, starts)
+        for i in range(200):
+            cell = i * 7 % len(board)
+            code = (REFLECT, REFRACT, EMPTY, OPAQUE)[i * 5 % 4]
+            board[cell] = code
+            tracer.set_cell(cell, code)
+            self.assertEqual(tracer.hit_mask(),
+                             trace_board(board, layout, starts),
+                             'The IncrementalTracer is wrong')
+        self.assertGreater(tracer.reused, 0,
+                           'The IncrementalTracer never reused a segment')
+
+    def test_incremental_search(self):
+        """
+        Test that incremental_search(game) solves the bundled puzzles
+        """
+        for file_path in ['dark_1.bff', 'mad_1.bff', 'mad_4.bff',
+                          'mad_7.bff', 'numbered_6.bff', 'showstopper_4.bff',
+                          'tiny_5.bff']:
+            game = parse_bff(file_path)
+            solution = incremental_search(game)
+            self.assertTrue(check_solution(shoot_laser(solution,
+                                                       game.get_lasers()),
+                                           game.get_points()),
+                            f'The incremental engine is wrong on {file_path}')
+
+    def test_beam_cache(self):
+        """
+        Test that BeamCache agrees with trace_board(board, layout, starts)
+        and keeps within its size, counting hits, misses and evictions
+        """
+        game = parse_bff('mad_1.bff')
+        space = PlacementSpace(game)
+        grid = game.get_grid()
+        layout = board_layout(len(grid), len(grid[0]))
+        starts = layout.laser_states(game.get_lasers())
+        cache = BeamCache(layout, space.reach_cells + space.spare_cells,
+                          maxsize=20)
+        for i, board in enumerate(space.boards()):
+            if i == 500:
+                break
+            self.assertEqual(cache.hit_mask(board, starts),
+                             trace_board(board, layout, starts),
+                             'The BeamCache is wrong')
+        info = cache.info()
+        self.assertEqual(info['hits'] + info['misses'], 500,
+                         'The BeamCache counters are wrong')
+        self.assertGreater(info['hits'], 0, 'The BeamCache never hit')
+        self.assertEqual(info['size'], 20, 'The BeamCache is too big')
+        self.assertEqual(info['evictions'], info['misses'] - 20,
+                         'The BeamCache counters are wrong')
+
+    def test_cached_search(self):
+        """
+        Test that cached_search(game) finds the same solution as
+        brute_force_search(game)
+        """
+        for file_path in ['mad_1.bff', 'mad_4.bff', 'numbered_6.bff',
+                          'tiny_5.bff']:
+            game = parse_bff(file_path)
+            stats = {}
+            self.assertEqual(cached_search(game, stats),
+                             brute_force_search(game),
+                             f'The cached engine is wrong on {file_path}')
+            self.assertEqual(stats['cache']['hits'] +
+                             stats['cache']['misses'],
+                             stats['candidates'] * len(game.get_lasers()),
+                             'The cached engine counters are wrong')
+
+    def test_parallel_search(self):
+        """
+        Test that parallel_search(game) finds the same solution as
+        brute_force_search(game)
+        """
+        for file_path in ['mad_1.bff', 'mad_4.bff', 'numbered_6.bff',
+                          'showstopper_4.bff', 'tiny_5.bff']:
+            game = parse_bff(file_path)
+            self.assertEqual(parallel_search(game, workers=2,
+                                             chunk_size=100),
+                             brute_force_search(game),
+                             f'The parallel engine is wrong on {file_path}')
+        game = Game([['o', 'o'], ['o', 'o']], Blocks(['B']),
+                    [Laser((1, 4), (1, -1))], [(0, 1)])
+        self.assertIsNone(parallel_search(game, workers=2, chunk_size=1),
+                          'The parallel_search function is wrong')
+
+    def test_compile_game(self):
+        """
+        Test that compile_game(game).evaluate(placement) agrees with
+        shoot_laser on the full grid
+        """
+        for file_path in ['mad_1.bff', 'showstopper_4.bff', 'tiny_5.bff']:
+            game = parse_bff(file_path)
+            compiled = compile_game(game)
+            for i, perm in enumerate(place_blocks(compiled.slots,
+                                                  game.get_blocks())):
+                if i == 300:
+                    break
+                grid = initialize_board(game.get_grid(), compiled.slots,
+                                        perm)
+                self.assertEqual(compiled.grid(perm), grid,
+                                 'The CompiledGame grid is wrong')
+                self.assertEqual(compiled.evaluate(perm),
+                                 check_solution(shoot_laser(
+                                     grid, game.get_lasers()),
+                                     game.get_points()),
+                                 f'The evaluate function is wrong on '
+                                 f'{file_path}')
+        game = Game([['o']], Blocks(['A']), [Laser((1, 2), (1, 1))],
+                    [(9, 9)])
+        self.assertFalse(compile_game(game).evaluate(['A']),
+                         'The evaluate function is wrong')
+
+    def test_search_placements(self):
+        """
+        Test that search_placements(game, start, stop) searches only the
+        given rank range
+        """
+        game = parse_bff('showstopper_4.bff')
+        rank, grid = search_placements(game)
+        self.assertEqual(grid, brute_force_search(game),
+                         'The search_placements function is wrong')
+        self.assertEqual(search_placements(game, rank), (rank, grid),
+                         'The search_placements function is wrong')
+        self.assertIsNone(search_placements(game, 0, rank),
+                          'The search_placements function is wrong')
+
+    def test_batch_solve(self):
+        """
+        Test that batch_solve(paths) solves a directory of puzzles, writes
+        their solutions and reports files it cannot read
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            for file_path in ['showstopper_4.bff', 'tiny_5.bff',
+                              'yarn_5.bff']:
+                shutil.copy(file_path, directory)
+            records = {os.path.basename(record['file']): record
+                       for record in batch_solve([directory], workers=2)}
+            self.assertEqual(sorted(records),
+                             ['showstopper_4.bff', 'tiny_5.bff',
+                              'yarn_5.bff'],
+                             'The batch_solve function is wrong')
+            for name in ['showstopper_4.bff', 'tiny_5.bff']:
+                self.assertTrue(records[name]['solved'],
+                                'The batch_solve function is wrong')
+                self.assertGreater(records[name]['candidates'], 0,
+                                   'The batch_solve function is wrong')
+                self.assertTrue(os.path.exists(os.path.join(
+                    directory, f'solution_{name}')),
+                    'The batch_solve function did not save a solution')
+            self.assertIn('No grid data', records['yarn_5.bff']['error'],
+                          'The batch_solve function is wrong')
+            # A failing engine is recorded instead of raised
+            record = solve_file(os.path.join(directory, 'tiny_5.bff'),
+                                engine='missing')
+            self.assertFalse(record['solved'],
+                             'The solve_file function is wrong')
+            self.assertIn('KeyError', record['error'],
+                          'The solve_file function is wrong')
+
+    @unittest.skipIf(not NUMPY_AVAILABLE, 'numpy is not installed')
+    def test_batch_evaluate(self):
+        """
+        Test that batch_evaluate(boards, layout, starts, points) agrees
+        with trace_board(board, layout, starts) on every board
+        """
+        for file_path in ['mad_1.bff', 'tiny_5.bff']:
+            game = parse_bff(file_path)
+            grid = game.get_grid()
+            layout = board_layout(len(grid), len(grid[0]))
+            starts = layout.laser_states(game.get_lasers())
+            target = points_mask(game.get_points(), grid)
+            slots = find_all_placements(grid)
+            perms = list(islice(place_blocks(slots, game.get_blocks()),
+                                2000))
+            boards = candidate_array(game, perms)
+            expected = [trace_board(bytearray(board.tobytes()), layout,
+                                    starts) & target == target
+                        for board in boards]
+            self.assertEqual(
+                batch_evaluate(boards, layout, starts,
+                               game.get_points()).tolist(),
+                expected, f'The batch_evaluate function is wrong on '
+                f'{file_path}')
+
+    @unittest.skipIf(not NUMPY_AVAILABLE, 'numpy is not installed')
+    def test_numpy_search(self):
+        """
+        Test that numpy_search(game) finds the same solution as
+        brute_force_search(game) after as many candidates
+        """
+        for file_path in ['dark_1.bff', 'mad_1.bff', 'numbered_6.bff',
+                          'showstopper_4.bff', 'tiny_5.bff']:
+            game = parse_bff(file_path)
+            stats, expected_stats = {}, {}
+            self.assertEqual(numpy_search(game, stats, batch_size=500),
+                             brute_force_search(game, expected_stats),
+                             f'The numpy engine is wrong on {file_path}')
+            self.assertEqual(stats, expected_stats,
+                             'The numpy engine counters are wrong')
+
+    def test_solve_monitor(self):
+        """
+        Test that a SolveMonitor counts the candidates, pruned placements
+        and laser steps of the brute-force search and reports progress
+        """
+        game = parse_bff('mad_1.bff')
+        reports = []
+        monitor = SolveMonitor(progress=reports.append, interval=0)
+        expected = {}
+        self.assertEqual(brute_force_search(game, monitor),
+                         brute_force_search(game, expected),
+                         'The monitored search is wrong')
+        self.assertEqual(monitor['candidates'], expected['candidates'],
+                         'The SolveMonitor counters are wrong')
+        space = PlacementSpace(game)
+        self.assertEqual(monitor['pruned'],
+                         count_placements(find_all_placements(
+                             game.get_grid()), game.get_blocks()) -
+                         space.total, 'The SolveMonitor counters are wrong')
+
+        layout = board_layout(len(game.get_grid()),
+                              len(game.get_grid()[0]))
+        starts = layout.laser_states(game.get_lasers())
+        target_mask = points_mask(game.get_points(), game.get_grid())
+        steps = 0
+        for board in islice(space.boards(), monitor['candidates']):
+            visited = bytearray(len(layout.neighbours))
+            trace_board(board, layout, starts, target_mask, visited)
+            steps += visited.count(1)
+        self.assertEqual(monitor['steps'], steps,
+                         'The SolveMonitor counters are wrong')
+        self.assertEqual(reports[-1]['done'], monitor['candidates'],
+                         'The SolveMonitor progress is wrong')
+        self.assertEqual(reports[-1]['total'], space.total,
+                         'The SolveMonitor progress is wrong')
+        self.assertGreater(monitor.timers['trace'], 0,
+                           'The SolveMonitor timers are wrong')
+        # Every engine fills in the steps and the phase timers
+        for name, engine in SOLVER_ENGINES.items():
+            monitor = SolveMonitor()
+            self.assertIsNotNone(engine(parse_bff('mad_1.bff'),
+                                        stats=monitor),
+                                 f'The {name} engine is wrong')
+            self.assertGreater(monitor['steps'], 0,
+                               f'The {name} engine does not count steps')
+            for phase in ['enumerate', 'trace', 'check']:
+                self.assertGreater(monitor.timers[phase], 0,
+                                   f'The {name} engine does not time the '
+                                   f'{phase} phase')
+
+    def test_solve_profile(self):
+        """
+        Test that solve(file_path, monitor, profile) times the parse and
+        saves a profile when LAZOR_PROFILE is set
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            file_path = shutil.copy('tiny_5.bff', directory)
+            profile = os.path.join(directory, 'tiny_5.prof')
+            monitor = SolveMonitor()
+            os.environ['LAZOR_PROFILE'] = profile
+            try:
+                with contextlib.redirect_stdout(io.StringIO()), \
+                        contextlib.redirect_stderr(io.StringIO()):
+                    solve(file_path, 'backtrack', monitor)
+            finally:
+                del os.environ['LAZOR_PROFILE']
+            self.assertTrue(os.path.exists(profile),
+                            'The solve function did not save a profile')
+            self.assertGreater(monitor.timers['parse'], 0,
+                               'The SolveMonitor timers are wrong')
+            self.assertGreater(monitor['candidates'], 0,
+                               'The SolveMonitor counters are wrong')
+
+    def test_all_solutions(self):
+        """
+        Test that all_solutions(game) yields every solved placement once,
+        including those that differ only in slots that cannot matter
+        """
+        grid = [['o', 'o', 'o'], ['o', 'o', 'o'], ['o', 'x', 'o']]
+        game = Game(grid, Blocks(['A', 'B']), [Laser((0, 1), (1, 1))],
+                    [(2, 3)])
+        compiled = compile_game(game)
+        expected = [compiled.grid(perm) for perm in
+                    place_blocks(compiled.slots, game.get_blocks())
+                    if compiled.evaluate(perm)]
+        stats = {}
+        solutions = list(all_solutions(game, stats))
+        self.assertEqual(sorted(solutions), sorted(expected),
+                         'The all_solutions function is wrong')
+        self.assertEqual(len(solutions), 30,
+                         'The all_solutions function is wrong')
+        self.assertLess(stats['candidates'], len(solutions),
+                        'The all_solutions function tests too much')
+        self.assertEqual(list(all_solutions(parse_bff('mad_1.bff'))),
+                         [brute_force_search(parse_bff('mad_1.bff'))],
+                         'The all_solutions function is wrong')
+
+    def test_count_solutions(self):
+        """
+        Test that count_solutions(game, at_least) counts the solutions and
+        stops once at_least of them are found
+        """
+        grid = [['o', 'o', 'o'], ['o', 'o', 'o'], ['o', 'x', 'o']]
+        game = Game(grid, Blocks(['A', 'B']), [Laser((0, 1), (1, 1))],
+                    [(2, 3)])
+        self.assertEqual(count_solutions(game), 30,
+                         'The count_solutions function is wrong')
+        self.assertEqual(count_solutions(game, at_least=2), 2,
+                         'The count_solutions function does not stop')
+        for file_path in ['dark_1.bff', 'mad_1.bff', 'tiny_5.bff']:
+            self.assertEqual(count_solutions(parse_bff(file_path)), 1,
+                             f'The count_solutions function is wrong on '
+                             f'{file_path}')
+        # Stopping at the first solution tests as many placements as the
+        # brute-force search
+        game = parse_bff('mad_1.bff')
+        stats, expected = {}, {}
+        self.assertEqual(count_solutions(game, 1, stats), 1,
+                         'The count_solutions function is wrong')
+        brute_force_search(game, expected)
+        self.assertEqual(stats, expected,
+                         'The count_solutions counters are wrong')
+        unsolvable = Game([['o', 'o']], Blocks(['B']),
+                          [Laser((0, 1), (1, 1))], [(9, 9)])
+        self.assertEqual(count_solutions(unsolvable), 0,
+                         'The count_solutions function is wrong')
+        self.assertEqual(count_solutions(game, 1, bitboard=True), 1,
+                         'The count_solutions function is wrong')
+
+    def test_solve_main_count(self):
+        """
+        Test that solve_main counts with the brute or bitboard engine,
+        profiles the count and rejects options it cannot honor
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            profile = os.path.join(directory, 'tiny_5.prof')
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output), \
+                    contextlib.redirect_stderr(io.StringIO()):
+                solve_main(['tiny_5.bff', '--count', '--engine', 'bitboard',
+                            '--profile', profile])
+                solve_main(['tiny_5.bff', '--all', '--at-least', '1'])
+            self.assertIn('1 solution\n', output.getvalue(),
+                          'The solve_main function is wrong')
+            self.assertIn('at least 1 solution\n', output.getvalue(),
+                          'The solve_main function is wrong')
+            self.assertTrue(os.path.exists(profile),
+                            'The solve_main function did not save a profile')
+            for argv in [['--count', '--engine', 'backtrack'],
+                         ['--all', '--solution-store', directory]]:
+                with contextlib.redirect_stderr(io.StringIO()), \
+                        self.assertRaises(SystemExit):
+                    solve_main(['tiny_5.bff'] + argv)
+
+    def test_puzzle_corpus(self):
+        """
+        Test that a corpus written by write_corpus reads back the same
+        puzzles as read_puzzle, by index
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            corpus_path = os.path.join(directory, 'levels.lzc')
+            files = ['dark_1.bff', 'mad_7.bff', 'numbered_6.bff',
+                     'yarn_5.bff']
+            written, skipped = write_corpus(corpus_path, files)
+            self.assertEqual(written, 3, 'The write_corpus function is wrong')
+            self.assertEqual([path for path, _ in skipped], ['yarn_5.bff'],
+                             'The write_corpus function is wrong')
+            with PuzzleCorpus(corpus_path) as corpus:
+                self.assertEqual(len(corpus), 3,
+                                 'The PuzzleCorpus is wrong')
+                self.assertEqual(list(corpus),
+                                 [read_puzzle(path) for path in files[:3]],
+                                 'The PuzzleCorpus is wrong')
+                self.assertEqual(corpus.name(1), 'mad_7.bff',
+                                 'The PuzzleCorpus is wrong')
+                board = corpus.board(2)
+                self.assertEqual(bytes(board),
+                                 bytes(encode_grid(parse_bff(
+                                     'numbered_6.bff').get_grid())),
+                                 'The PuzzleCorpus is wrong')
+                board.release()
+                with self.assertRaises(IndexError):
+                    corpus[3]
+            with self.assertRaisesRegex(ValueError, 'Not a puzzle corpus'):
+                PuzzleCorpus('mad_1.bff')
+
+    def test_puzzle_fingerprint(self):
+        """
+        Test that puzzle_fingerprint(puzzle) ignores whitespace, comments
+        and the order of laser and point lines
+        """
+        puzzle = parse_puzzle('GRID START\no o\nGRID STOP\nA 1\n'
+                              'L 0 1 1 1\nP 2 1\nP 3 0')
+        same = parse_puzzle('# comment\nGRID START\n  o   o\nGRID STOP\n\n'
+                            'P 3 0\nA 1\nP 2 1\nL 0 1 1 1\n')
+        other = parse_puzzle('GRID START\no o\nGRID STOP\nA 1\n'
+                             'L 0 1 1 1\nP 2 1')
+        self.assertEqual(puzzle_fingerprint(puzzle),
+                         puzzle_fingerprint(same),
+                         'The puzzle_fingerprint function is wrong')
+        self.assertNotEqual(puzzle_fingerprint(puzzle),
+                            puzzle_fingerprint(other),
+                            'The puzzle_fingerprint function is wrong')
+
+    def test_solution_store(self):
+        """
+        Test that a SolutionStore returns stored solutions, checks them,
+        remembers puzzles without a solution and evicts old entries
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            store = SolutionStore(directory, max_entries=2)
+            puzzle = read_puzzle('tiny_5.bff')
+            grid = brute_force_search(puzzle.to_game())
+            self.assertEqual(store.get(puzzle), (False, None),
+                             'The SolutionStore is wrong')
+            store.put(puzzle, grid)
+            self.assertEqual(SolutionStore(directory).get(puzzle),
+                             (True, grid), 'The SolutionStore is wrong')
+
+            unsolvable = parse_puzzle('GRID START\no o\no o\nGRID STOP\n'
+                                      'B 1\nL 1 4 1 -1\nP 0 1')
+            store.put(unsolvable, None)
+            self.assertEqual(SolutionStore(directory).get(unsolvable),
+                             (True, None), 'The SolutionStore is wrong')
+
+            # A tampered entry is not trusted
+            with open(store.entry_path(puzzle_fingerprint(puzzle)),
+                      'w') as file:
+                json.dump({'grid': puzzle.to_game().get_grid()}, file)
+            self.assertEqual(SolutionStore(directory).get(puzzle),
+                             (False, None), 'The SolutionStore is wrong')
+
+            store.put(read_puzzle('mad_1.bff'), None)
+            self.assertEqual(len([name for name in os.listdir(directory)
+                                  if name.endswith('.json')]), 2,
+                             'The SolutionStore did not evict')
+            self.assertLessEqual(len(store.memory), 2,
+                                 'The SolutionStore memory is not bounded')
+
+        # The directory is only listed once the store is full, and then
+        # a batch of entries is evicted at once
+        with tempfile.TemporaryDirectory() as directory:
+            store = SolutionStore(directory, max_entries=10)
+            evictions = []
+            evict = store.evict
+            store.evict = lambda: evictions.append(1) or evict()
+            for k in range(11):
+                puzzle = parse_puzzle(f'GRID START\no o\nGRID STOP\n'
+                                      f'A 1\nL 1 0 1 1\nP {k} 9')
+                store.put(puzzle, None)
+                store.put(puzzle, None)  # a rewrite is not a new entry
+            self.assertEqual(len(evictions), 1,
+                             'The SolutionStore evicts too often')
+            self.assertEqual(len([name for name in os.listdir(directory)
+                                  if name.endswith('.json')]), 9,
+                             'The SolutionStore did not evict a batch')
+            self.assertEqual(store.count(), 9,
+                             'The SolutionStore count is wrong')
+
+    def test_solve_store(self):
+        """
+        Test that solve(file_path, store=store) searches a puzzle once
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            file_path = shutil.copy('tiny_5.bff', directory)
+            store = SolutionStore(os.path.join(directory, 'store'))
+            with contextlib.redirect_stdout(io.StringIO()):
+                solve(file_path, store=store)
+                monitor = SolveMonitor()
+                solve(file_path, monitor=monitor, store=store)
+            self.assertEqual((store.hits, store.misses), (1, 1),
+                             'The solve function did not use the store')
+            self.assertEqual(monitor['candidates'], 0,
+                             'The solve function searched again')
+            record = solve_file(file_path, store=store)
+            self.assertTrue(record['stored'] and record['solved'],
+                            'The solve_file function did not use the store')
+            records = list(batch_solve([file_path], store=store))
+            self.assertTrue(records[0]['stored'],
+                            'The batch_solve function did not use the store')
+
+    def test_backtrack_search_no_solution(self):
+        """
+        Test that both engines agree when a puzzle has no solution
+        """
+        grid = [['o', 'o'], ['o', 'o']]
+        game = Game(grid, Blocks(['B']), [Laser((1, 4), (1, -1))],
+                    [(0, 1)])
+        self.assertIsNone(backtrack_search(game),
+                          'The backtrack_search function is wrong')
+        self.assertIsNone(brute_force_search(game),
+                          'The brute_force_search function is wrong')
 
 
 if __name__ == "__main__":
+    if sys.argv[1:2] == ['batch']:
+        sys.exit(batch_main(sys.argv[2:]))
+    if sys.argv[1:2] == ['corpus']:
+        sys.exit(corpus_main(sys.argv[2:]))
+    if sys.argv[1:2] == ['solve']:
+        sys.exit(solve_main(sys.argv[2:]))
     # Test the solve function with one of the files
     file_path = 'showstopper_4.bff'
     solve(file_path)
@@ -0,0 +1,547 @@
+"""
+A resident lazor solver service.
+
+It answers HTTP requests on a TCP port or a local Unix socket, solving
+each puzzle on a pool of warm worker processes, so a request pays for
+neither interpreter startup nor the import of lazor.
+
+    python lazor_server.py --unix /tmp/lazor.sock --workers 4
+    curl --unix-socket /tmp/lazor.sock --data-binary @mad_7.bff \\
+        'http://lazor/solve?engine=backtrack&timeout=2'
+
+POST /solve takes the text of a .bff file as its body and answers with
+JSON holding the solved grid. GET /health describes the queue.
+"""
+import argparse
+import asyncio
+import json
+import math
+import multiprocessing
+import os
+import signal
+import sys
+import tempfile
+import time
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+import lazor
+
+# The largest puzzle text accepted, in bytes
+MAX_BODY = 1 << 20
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found',
+           405: 'Method Not Allowed', 413: 'Payload Too Large',
+           431: 'Request Header Fields Too Large',
+           500: 'Internal Server Error', 503: 'Service Unavailable',
+           504: 'Gateway Timeout'}
+
+# State of a service worker process, set once by init_worker
+worker_state = {}
+
+
+class SolveTimeout(Exception):
+    """
+    Raised inside a worker when a request runs out of time.
+    """
+
+
+def raise_timeout(signum, frame):
+    """
+    Signal handler that interrupts a solve running past its deadline.
+    """
+    raise SolveTimeout()
+
+
+def init_worker(store_dir):
+    """
+    Warms up a worker process: installs the timeout handler, opens the
+    solution store and builds the lookup tables of common board sizes.
+
+    Arguments:
+    - store_dir (str): Optional directory of a lazor.SolutionStore.
+    """
+    if hasattr(signal, 'setitimer'):
+        signal.signal(signal.SIGALRM, raise_timeout)
+    worker_state['store'] = (None if store_dir is None
+                             else lazor.SolutionStore(store_dir))
+    for rows in range(1, 9):
+        for cols in range(1, 9):
+            lazor.board_layout(rows, cols)
+
+
+def warm_up():
+    """
+    A no-op task that makes the pool start a worker.
+    """
+    return os.getpid()
+
+
+def solve_request(text, engine, timeout):
+    """
+    Solves the text of one .bff file in a worker process. Where the
+    platform has interval timers the solve is interrupted after timeout
+    seconds, so a slow puzzle does not keep the worker busy.
+
+    Arguments:
+    - text (str): The content of the .bff file.
+    - engine (str): The search engine to use, one of lazor.BATCH_ENGINES.
+    - timeout (float): The seconds the solve may take.
+
+    Returns:
+    - response (tuple): The HTTP status and the JSON payload.
+
+    Example:
+    >> solve_request(open('tiny_5.bff').read(), 'backtrack', 1.0)
+    (200, {'solved': True, 'grid': [...], ...})
+    """
+    start = time.perf_counter()
+    stats = {}
+    timer = hasattr(signal, 'setitimer')
+    try:
+        if timer:
+            signal.setitimer(signal.ITIMER_REAL, timeout)
+        puzzle = lazor.parse_puzzle(text, '<request>')
+        store = worker_state.get('store')
+        found, grid = (False, None) if store is None else store.get(puzzle)
+        if not found:
+            grid = lazor.SOLVER_ENGINES[engine](puzzle.to_game(),
+                                                stats=stats)
+            # The solve is done, so the timer must not cut the store's
+            # write short
+            if timer:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+            if store is not None:
+                store.put(puzzle, grid)
+    except SolveTimeout:
+        return 504, {'error': f"No answer within {timeout} s"}
+    except (ValueError, IndexError) as error:
+        return 400, {'error': str(error)}
+    finally:
+        if timer:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+    return 200, {'solved': grid is not None, 'grid': grid,
+                 'engine': engine, 'stored': found,
+                 'candidates': stats.get('candidates', 0),
+                 'seconds': time.perf_counter() - start}
+
+
+class SolverService:
+    """
+    An asyncio HTTP front end over a pool of warm solver processes.
+
+    Requests beyond the worker count wait in the pool's queue. Once
+    max_pending requests are queued or running, new ones are turned away
+    at once with 503 and a Retry-After header instead of piling up, and
+    every request is answered with 504 once its timeout has passed. A
+    request answered with 504 while its solve is still running counts as
+    pending until the worker is done with it.
+
+    Attributes:
+    - workers (int): The number of worker processes.
+    - max_pending (int): The most requests queued or running at once.
+    - timeout (float): The default and largest timeout of a request.
+    - engine (str): The default search engine.
+    - pending (int): The number of solves queued or running.
+    """
+
+    def __init__(self, workers=None, max_pending=None, timeout=10.0,
+                 engine='backtrack', store_dir=None):
+        """
+        Initializes the SolverService. Call start to open the pool.
+
+        Arguments:
+        - workers (int): The number of worker processes, or None for one
+          per CPU core.
+        - max_pending (int): The most requests queued or running at once,
+          or None for four per worker.
+        - timeout (float): The default and largest seconds per request.
+          Defaults to 10.
+        - engine (str): The default search engine, one of
+          lazor.BATCH_ENGINES. Defaults to 'backtrack'.
+        - store_dir (str): Optional directory of a lazor.SolutionStore
+          shared by the workers.
+
+        Example:
+        >> service = SolverService(workers=4)
+        >> asyncio.run(service.serve(unix_path='/tmp/lazor.sock'))
+        """
+        if engine not in lazor.BATCH_ENGINES:
+            raise ValueError(f"Unsupported service engine: {engine}")
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending or self.workers * 4
+        self.timeout = timeout
+        self.engine = engine
+        self.store_dir = store_dir
+        self.pending = 0
+        self.pool = None
+
+    async def start(self):
+        """
+        Starts the worker processes and waits until all are warm.
+        """
+        # Spawned workers do not inherit the event loop of this process
+        self.pool = ProcessPoolExecutor(
+            self.workers, mp_context=multiprocessing.get_context('spawn'),
+            initializer=init_worker, initargs=(self.store_dir,))
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*[loop.run_in_executor(self.pool, warm_up)
+                               for _ in range(self.workers)])
+
+    def close(self):
+        """
+        Stops the worker processes.
+        """
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+            self.pool = None
+
+    async def solve(self, text, engine=None, timeout=None):
+        """
+        Solves one puzzle on the pool, unless the queue is full.
+
+        Arguments:
+        - text (str): The content of the .bff file.
+        - engine (str): The search engine, or None for the default.
+        - timeout (float): The seconds allowed, or None for the default.
+          It is capped at the default.
+
+        Returns:
+        - response (tuple): The HTTP status and the JSON payload.
+        """
+        engine = engine or self.engine
+        if engine not in lazor.BATCH_ENGINES:
+            return 400, {'error': f"Unsupported engine: {engine}"}
+        timeout = self.timeout if timeout is None else \
+            min(timeout, self.timeout)
+        if self.pending >= self.max_pending:
+            return 503, {'error': 'Too many pending requests'}
+
+        self.pending += 1
+        started = time.monotonic()
+        loop = asyncio.get_running_loop()
+        job = None
+        try:
+            job = self.pool.submit(solve_request, text, engine, timeout)
+            # The solve stays pending until the worker is done with it,
+            # even if the request is answered before. The callback runs in
+            # a thread of the pool and comes before the result is passed
+            # to the event loop.
+            job.add_done_callback(lambda job: self.finished(loop))
+            # The worker times itself out once it starts; this also
+            # covers the time spent waiting in the queue
+            status, payload = await asyncio.wait_for(
+                asyncio.shield(asyncio.wrap_future(job)), timeout + 1.0)
+        except asyncio.TimeoutError:
+            job.cancel()  # drop it if it is still queued
+            status, payload = 504, {
+                'error': f"No answer within {timeout} s"}
+        except Exception as error:
+            # A broken pool or a crashed solve still gets an answer
+            status, payload = 500, {
+                'error': f"{type(error).__name__}: {error}"}
+        finally:
+            if job is None:
+                self.pending -= 1
+        payload['latency'] = time.monotonic() - started
+        return status, payload
+
+    def finished(self, loop):
+        """
+        Counts a solve as no longer pending, from any thread.
+
+        Arguments:
+        - loop (asyncio.AbstractEventLoop): The event loop of the service.
+        """
+        def release():
+            self.pending -= 1
+        try:
+            loop.call_soon_threadsafe(release)
+        except RuntimeError:
+            pass  # the event loop is closed, so nobody is counting
+
+    async def respond(self, method, target, body):
+        """
+        Routes one HTTP request.
+
+        Arguments:
+        - method (str): The HTTP method.
+        - target (str): The request target, with its query string.
+        - body (bytes): The request body.
+
+        Returns:
+        - response (tuple): The HTTP status and the JSON payload.
+        """
+        url = urlsplit(target)
+        query = {name: values[-1]
+                 for name, values in parse_qs(url.query).items()}
+        if url.path == '/health':
+            return 200, {'workers': self.workers, 'pending': self.pending,
+                         'max_pending': self.max_pending}
+        if url.path != '/solve':
+            return 404, {'error': f"Unknown path: {url.path}"}
+        if method != 'POST':
+            return 405, {'error': 'Use POST with the puzzle as the body'}
+        try:
+            timeout = (float(query['timeout']) if 'timeout' in query
+                       else None)
+            text = body.decode()
+        except ValueError as error:
+            return 400, {'error': str(error)}
+        if timeout is not None and not (math.isfinite(timeout) and
+                                        timeout > 0):
+            return 400, {'error': f"Bad timeout: {query['timeout']}"}
+        return await self.solve(text, query.get('engine'), timeout)
+
+    async def handle(self, reader, writer):
+        """
+        Serves the HTTP/1.1 requests of one connection, keeping it open
+        between requests unless the client asks to close it.
+        """
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    method, target, version = line.decode('latin-1').split()
+                except ValueError:
+                    await self.write(writer, 400, {'error': 'Bad request'},
+                                     False)
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                keep_alive = (headers.get('connection', '').lower() !=
+                              'close' and version == 'HTTP/1.1')
+                try:
+                    length = int(headers.get('content-length', 0))
+                except ValueError:
+                    length = -1
+                if not 0 <= length <= MAX_BODY:
+                    await self.write(writer, 413 if length > 0 else 400,
+                                     {'error': 'Bad body length'}, False)
+                    break
+                body = await reader.readexactly(length)
+                status, payload = await self.respond(method, target, body)
+                await self.write(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except ValueError:
+            # A request or header line longer than the stream limit
+            try:
+                await self.write(writer, 431, {'error': 'Line too long'},
+                                 False)
+            except ConnectionError:
+                pass
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def write(self, writer, status, payload, keep_alive):
+        """
+        Writes one JSON response.
+        """
+        body = json.dumps(payload).encode()
+        head = [f"HTTP/1.1 {status} {REASONS[status]}",
+                'Content-Type: application/json',
+                f"Content-Length: {len(body)}",
+                f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+        if status == 503:
+            head.append('Retry-After: 1')
+        writer.write(('\r\n'.join(head) + '\r\n\r\n').encode() + body)
+        await writer.drain()
+
+    async def listen(self, host='127.0.0.1', port=8080, unix_path=None):
+        """
+        Starts the pool and opens the listening socket.
+
+        Arguments:
+        - host (str): The TCP address to listen on.
+        - port (int): The TCP port to listen on.
+        - unix_path (str): A Unix socket path to listen on instead.
+
+        Returns:
+        - server (asyncio.Server): The listening server.
+        """
+        await self.start()
+        if unix_path is not None:
+            return await asyncio.start_unix_server(self.handle, unix_path)
+        return await asyncio.start_server(self.handle, host, port)
+
+    async def serve(self, host='127.0.0.1', port=8080, unix_path=None):
+        """
+        Serves requests until cancelled.
+        """
+        server = await self.listen(host, port, unix_path)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.close()
+
+
+def main(argv=None):
+    """
+    Command line entry point of the service.
+
+    Arguments:
+    - argv (list): The command line arguments, or None for sys.argv.
+
+    Example:
+    >> python lazor_server.py --port 8080 --workers 4
+    """
+    parser = argparse.ArgumentParser(
+        description='Serve lazor solutions over HTTP.')
+    parser.add_argument('--host', default='127.0.0.1',
+                        help='TCP address to listen on')
+    parser.add_argument('--port', type=int, default=8080,
+                        help='TCP port to listen on')
+    parser.add_argument('--unix', metavar='PATH',
+                        help='listen on a Unix socket instead of TCP')
+    parser.add_argument('-w', '--workers', type=int, default=None,
+                        help='worker processes (default: one per core)')
+    parser.add_argument('--max-pending', type=int, default=None,
+                        help='requests queued or running before 503 '
+                        '(default: four per worker)')
+    parser.add_argument('-t', '--timeout', type=float, default=10.0,
+                        help='default and largest seconds per request')
+    parser.add_argument('-e', '--engine', default='backtrack',
+                        choices=lazor.BATCH_ENGINES,
+                        help='default search engine (default: backtrack)')
+    parser.add_argument('--solution-store', metavar='DIR',
+                        help='reuse and keep solutions in DIR')
+    args = parser.parse_args(argv)
+
+    service = SolverService(args.workers, args.max_pending, args.timeout,
+                            args.engine, args.solution_store)
+    try:
+        asyncio.run(service.serve(args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+class TestSolverService (unittest.TestCase):
+    """
+    This class tests the solver service over a Unix socket
+    """
+
+    def request(self, method, target, body=b''):
+        """
+        Sends one request to the test service and reads the answer.
+        """
+        async def exchange():
+            reader, writer = await asyncio.open_unix_connection(self.path)
+            writer.write(f"{method} {target} HTTP/1.1\r\n"
+                         f"Content-Length: {len(body)}\r\n"
+                         "Connection: close\r\n\r\n".encode() + body)
+            await writer.drain()
+            response = await reader.read()
+            writer.close()
+            head, _, payload = response.partition(b'\r\n\r\n')
+            return int(head.split()[1]), json.loads(payload)
+        return exchange()
+
+    def run_service(self, test, **options):
+        """
+        Runs a coroutine test against a fresh one-worker service.
+        """
+        async def run():
+            service = SolverService(workers=1, **options)
+            server = await service.listen(unix_path=self.path)
+            try:
+                await test(service)
+            finally:
+                server.close()
+                await server.wait_closed()
+                service.close()
+        with tempfile.TemporaryDirectory() as directory:
+            self.path = os.path.join(directory, 'lazor.sock')
+            asyncio.run(run())
+
+    def test_solve(self):
+        """
+        Test that POST /solve answers with a solution of the puzzle
+        """
+        with open('tiny_5.bff') as file:
+            text = file.read()
+
+        async def test(service):
+            status, payload = await self.request('POST', '/solve',
+                                                 text.encode())
+            self.assertEqual(status, 200, 'The service is wrong')
+            self.assertTrue(lazor.is_solution(lazor.parse_puzzle(text),
+                                              payload['grid']),
+                            'The service answered a wrong grid')
+            status, payload = await self.request('POST', '/solve',
+                                                 b'GRID START\nL 1 2\n')
+            self.assertEqual(status, 400, 'The service is wrong')
+            self.assertIn('line 2', payload['error'],
+                          'The service is wrong')
+            status, payload = await self.request('GET', '/health')
+            self.assertEqual(payload['pending'], 0, 'The service is wrong')
+        self.run_service(test)
+
+    def test_bad_requests(self):
+        """
+        Test that bad timeouts, over-long header lines and failing solves
+        are all answered
+        """
+        with open('tiny_5.bff', 'rb') as file:
+            text = file.read()
+
+        async def test(service):
+            for timeout in ['nan', 'inf', '0', '-1', 'soon']:
+                status, _ = await self.request(
+                    'POST', f'/solve?timeout={timeout}', text)
+                self.assertEqual(status, 400,
+                                 f'The service took timeout={timeout}')
+            status, _ = await self.request(
+                'POST', '/solve?x=' + 'a' * (1 << 17), text)
+            self.assertEqual(status, 431,
+                             'The service did not refuse a long line')
+            service.pool.shutdown()
+            status, payload = await self.request('POST', '/solve', text)
+            self.assertEqual(status, 500, 'The service is wrong')
+            self.assertIn('RuntimeError', payload['error'],
+                          'The service is wrong')
+        self.run_service(test)
+
+    def test_timeout_and_backpressure(self):
+        """
+        Test that slow requests time out and that a full queue turns
+        requests away
+        """
+        # An open board whose search space is too large to finish
+        slow = '\n'.join(
+            ['GRID START'] + ['o o o o o o o'] * 7 +
+            ['GRID STOP', 'A 4', 'B 2', 'C 1', 'L 0 7 1 -1',
+             'P 13 14', 'P 9 0', 'P 1 12']).encode()
+
+        async def test(service):
+            first = asyncio.ensure_future(self.request(
+                'POST', '/solve?engine=brute&timeout=0.2', slow))
+            await asyncio.sleep(0.05)
+            status, _ = await self.request('POST', '/solve', slow)
+            self.assertEqual(status, 503, 'The service did not push back')
+            status, payload = await first
+            self.assertEqual(status, 504, 'The service did not time out')
+            self.assertEqual(service.pending, 0,
+                             'The service did not release the solve')
+            # The worker is free again
+            with open('mad_7.bff', 'rb') as file:
+                status, _ = await self.request(
+                    'POST', '/solve?engine=backtrack', file.read())
+            self.assertEqual(status, 200, 'The service is wrong')
+        self.run_service(test, max_pending=1)
+
+
+if __name__ == "__main__":
+    sys.exit(main())